@@ -1 +1 @@
-from dmoj.checkers import easy, floats, floatsrel, floatsabs, identical, rstripped, sorted, standard, unordered, linecount
+from dmoj.checkers import easy, floats, floatsrel, floatsabs, identical, rstripped, sorted, standard, unordered, linecount, numeric
@@ -1,4 +1,8 @@
 #include <Python.h>
+#include <math.h>
+#include <stdlib.h>
+#include <string.h>
+#include <time.h>
 
 #define UNREFERENCED_PARAMETER(p)
 #if defined(_MSC_VER)
@@ -49,9 +53,410 @@ static int check_standard(const char *judge, size_t jlen, const char *process, s
 			if (p >= plen) return 0;
 			if (judge[j++] != process[p++]) return 0;
 		}
+		// The process's token must end where the judge's does, or it would be "21" accepted for "2 1".
+		if (p < plen && !iswhite(process[p])) return 0;
 	}
 }
 
+static inline int isdigit_(char ch) {
+	return ch >= '0' && ch <= '9';
+}
+
+static inline int istokenwhite(char ch) {
+	// Whitespace for str.split(), less the newline, which separates lines.
+	return ch != '\n' && iswhite(ch);
+}
+
+static int matches_ci(const char *token, size_t len, const char *word) {
+	size_t i;
+	if (strlen(word) != len) return 0;
+	for (i = 0; i < len; ++i)
+		if ((token[i] | 0x20) != word[i]) return 0;
+	return 1;
+}
+
+// Whether token is something Python's float() accepts, which unlike strtod, excludes hex and nan(...).
+static int is_float_token(const char *token, size_t len) {
+	size_t i = 0, digits = 0;
+
+	if (i < len && (token[i] == '+' || token[i] == '-')) ++i;
+	if (matches_ci(token + i, len - i, "inf") || matches_ci(token + i, len - i, "infinity") ||
+			matches_ci(token + i, len - i, "nan"))
+		return 1;
+
+	for (; i < len && isdigit_(token[i]); ++i) ++digits;
+	if (i < len && token[i] == '.')
+		for (++i; i < len && isdigit_(token[i]); ++i) ++digits;
+	if (!digits) return 0;
+
+	if (i < len && (token[i] == 'e' || token[i] == 'E')) {
+		++i;
+		if (i < len && (token[i] == '+' || token[i] == '-')) ++i;
+		if (i >= len || !isdigit_(token[i])) return 0;
+		while (i < len && isdigit_(token[i])) ++i;
+	}
+	return i == len;
+}
+
+// Returns 1 and sets *value if token is a float, 0 if it isn't, and -1 if strtod disagrees with our parse of it.
+// The token must be followed by whitespace or the terminating null.
+static int parse_float(const char *token, size_t len, double *value) {
+	char *end;
+
+	if (!is_float_token(token, len)) return 0;
+	*value = strtod(token, &end);
+	return end == token + len ? 1 : -1;
+}
+
+#define FLOATS_DEFAULT 0
+#define FLOATS_ABSOLUTE 1
+#define FLOATS_RELATIVE 2
+
+static inline int floats_equal(double judge, double process, double epsilon, int mode) {
+	// Mirrors the Python checkers exactly, including their handling of NaN, and the division by zero that the Python
+	// versions fail on when epsilon is not positive.
+	switch (mode) {
+	case FLOATS_ABSOLUTE:
+		return !(fabs(process - judge) > epsilon);
+	case FLOATS_RELATIVE:
+		if (fabs(judge) < epsilon && epsilon <= fabs(process)) return 0;
+		if (fabs(judge) >= epsilon) {
+			if (judge == 0) return 0;
+			if (fabs(1.0 - process / judge) > epsilon) return 0;
+		}
+		return 1;
+	default:
+		if (fabs(process - judge) > epsilon) {
+			if (fabs(judge) < epsilon) return 0;
+			if (judge == 0) return 0;
+			if (fabs(1.0 - process / judge) > epsilon) return 0;
+		}
+		return 1;
+	}
+}
+
+// Returns 1 if the outputs match, 0 if they don't, and -1 if the Python checker should decide.
+static int check_floats(const char *judge, size_t jlen, const char *process, size_t plen, double epsilon, int mode) {
+	size_t j = 0, p = 0, jend, pend, jtok, ptok;
+	double jval, pval;
+	int parsed;
+
+	for (;;) {
+		// Empty lines are discounted, but lines of whitespace count.
+		while (j < jlen && judge[j] == '\n') ++j;
+		while (p < plen && process[p] == '\n') ++p;
+		if (j == jlen || p == plen) return j == jlen && p == plen;
+
+		for (jend = j; jend < jlen && judge[jend] != '\n'; ++jend);
+		for (pend = p; pend < plen && process[pend] != '\n'; ++pend);
+
+		for (;;) {
+			while (j < jend && istokenwhite(judge[j])) ++j;
+			while (p < pend && istokenwhite(process[p])) ++p;
+			if (j == jend || p == pend) {
+				if (j != jend || p != pend) return 0;
+				break;
+			}
+
+			for (jtok = j; jtok < jend && !istokenwhite(judge[jtok]); ++jtok);
+			for (ptok = p; ptok < pend && !istokenwhite(process[ptok]); ++ptok);
+
+			parsed = parse_float(judge + j, jtok - j, &jval);
+			if (parsed < 0) return -1;
+			if (!parsed) {
+				// Allow mixed tokens, for lines like "abc 0.68 def 0.70", where the others must match exactly.
+				if (jtok - j != ptok - p || memcmp(judge + j, process + p, jtok - j)) return 0;
+			} else {
+				parsed = parse_float(process + p, ptok - p, &pval);
+				if (parsed <= 0) return parsed;
+				if (!floats_equal(jval, pval, epsilon, mode)) return 0;
+			}
+			j = jtok;
+			p = ptok;
+		}
+	}
+}
+
+static PyObject *checker_floats_mode(PyObject *args, const char *format, int mode) {
+	PyObject *expected, *actual;
+	double epsilon;
+	int result;
+
+	if (!PyArg_ParseTuple(args, format, &expected, &actual, &epsilon))
+		return NULL;
+
+	if (!PyString_Check(expected) || !PyString_Check(actual)) {
+		PyErr_SetString(PyExc_ValueError, "expected strings");
+		return NULL;
+	}
+
+	Py_INCREF(expected);
+	Py_INCREF(actual);
+	Py_BEGIN_ALLOW_THREADS
+	result = check_floats(PyString_AS_STRING(expected), PyString_GET_SIZE(expected),
+						  PyString_AS_STRING(actual), PyString_GET_SIZE(actual), epsilon, mode);
+	Py_END_ALLOW_THREADS
+	Py_DECREF(expected);
+	Py_DECREF(actual);
+
+	if (result < 0)
+		Py_RETURN_NONE;
+	if (result)
+		Py_RETURN_TRUE;
+	Py_RETURN_FALSE;
+}
+
+static PyObject *checker_floats(PyObject *self, PyObject *args) {
+	UNREFERENCED_PARAMETER(self);
+	return checker_floats_mode(args, "OOd:floats", FLOATS_DEFAULT);
+}
+
+static PyObject *checker_floatsabs(PyObject *self, PyObject *args) {
+	UNREFERENCED_PARAMETER(self);
+	return checker_floats_mode(args, "OOd:floatsabs", FLOATS_ABSOLUTE);
+}
+
+static PyObject *checker_floatsrel(PyObject *self, PyObject *args) {
+	UNREFERENCED_PARAMETER(self);
+	return checker_floats_mode(args, "OOd:floatsrel", FLOATS_RELATIVE);
+}
+
+#define MULTISET_TOKENS 0
+#define MULTISET_LINES 1
+
+typedef struct {
+	const char *key;
+	size_t len;
+	size_t hash;
+	Py_ssize_t count;
+} multiset_entry;
+
+typedef struct {
+	multiset_entry *entries;
+	size_t capacity;
+	size_t size;
+	size_t seed;
+	int type;
+} multiset;
+
+static inline size_t hash_bytes(size_t hash, const char *data, size_t len) {
+	while (len--)
+		hash = (hash ^ (unsigned char) *data++) * 0x01000193;
+	return hash;
+}
+
+static size_t multiset_hash(multiset *set, const char *key, size_t len) {
+	size_t hash = set->seed, i = 0, start;
+
+	if (set->type == MULTISET_TOKENS)
+		hash = hash_bytes(hash, key, len);
+	else {
+		// Hash the tokens of the line as if joined by single spaces, since that's all split() preserves.
+		for (;;) {
+			while (i < len && iswhite(key[i])) ++i;
+			if (i == len) break;
+			for (start = i; i < len && !iswhite(key[i]); ++i);
+			hash = hash_bytes(hash, key + start, i - start);
+			hash = (hash ^ ' ') * 0x01000193;
+		}
+	}
+	return hash ^ (hash >> 15);
+}
+
+static int lines_equal(const char *a, size_t alen, const char *b, size_t blen) {
+	size_t i = 0, j = 0;
+
+	for (;;) {
+		while (i < alen && iswhite(a[i])) ++i;
+		while (j < blen && iswhite(b[j])) ++j;
+		if (i == alen || j == blen) return i == alen && j == blen;
+		while (i < alen && j < blen && !iswhite(a[i]) && a[i] == b[j]) ++i, ++j;
+		if ((i < alen && !iswhite(a[i])) || (j < blen && !iswhite(b[j]))) return 0;
+	}
+}
+
+static multiset_entry *multiset_find(multiset *set, const char *key, size_t len, size_t hash) {
+	size_t mask = set->capacity - 1, i = hash & mask;
+	multiset_entry *entry;
+
+	// Keys are compared in full on every hash match, so the verdict never depends on the hash.
+	for (;; i = (i + 1) & mask) {
+		entry = set->entries + i;
+		if (!entry->key || (entry->hash == hash &&
+				(set->type == MULTISET_TOKENS ? entry->len == len && !memcmp(entry->key, key, len) :
+												lines_equal(entry->key, entry->len, key, len))))
+			return entry;
+	}
+}
+
+static int multiset_grow(multiset *set) {
+	multiset_entry *old = set->entries, *entry;
+	size_t capacity = set->capacity, i;
+
+	set->entries = (multiset_entry *) calloc(capacity * 2, sizeof(multiset_entry));
+	if (!set->entries) {
+		set->entries = old;
+		return 0;
+	}
+	set->capacity = capacity * 2;
+	for (i = 0; i < capacity; ++i) {
+		if (old[i].key) {
+			entry = multiset_find(set, old[i].key, old[i].len, old[i].hash);
+			*entry = old[i];
+		}
+	}
+	free(old);
+	return 1;
+}
+
+// Adds the key to the multiset, or removes it if remove is set.
+// Returns 0 if the key is absent when removing, and -1 if out of memory.
+static int multiset_add(multiset *set, const char *key, size_t len, int remove) {
+	size_t hash = multiset_hash(set, key, len);
+	multiset_entry *entry = multiset_find(set, key, len, hash);
+
+	if (remove) {
+		return entry->key && entry->count-- > 0;
+	} else if (entry->key) {
+		++entry->count;
+		return 1;
+	}
+
+	entry->key = key;
+	entry->len = len;
+	entry->hash = hash;
+	entry->count = 1;
+	if (++set->size * 2 >= set->capacity && !multiset_grow(set))
+		return -1;
+	return 1;
+}
+
+// Returns the number of keys added or removed, or -1 if a key to remove is absent, or -2 if out of memory.
+static Py_ssize_t multiset_fill(multiset *set, const char *data, size_t len, int remove) {
+	size_t i = 0, start;
+	Py_ssize_t count = 0;
+	int result;
+
+	for (;;) {
+		if (set->type == MULTISET_TOKENS) {
+			while (i < len && iswhite(data[i])) ++i;
+			if (i == len) return count;
+			for (start = i; i < len && !iswhite(data[i]); ++i);
+		} else {
+			// Empty lines are discounted, but lines of whitespace count.
+			while (i < len && data[i] == '\n') ++i;
+			if (i == len) return count;
+			for (start = i; i < len && data[i] != '\n'; ++i);
+		}
+
+		result = multiset_add(set, data + start, i - start, remove);
+		if (result <= 0) return result ? -2 : -1;
+		++count;
+	}
+}
+
+// Returns whether judge and process hold the same multiset of tokens or lines of tokens, or -1 if out of memory.
+static int check_multiset(const char *judge, size_t jlen, const char *process, size_t plen, int type) {
+	multiset set;
+	Py_ssize_t jcount, pcount = 0;
+
+	set.capacity = 1024;
+	set.size = 0;
+	set.seed = 0x811c9dc5 ^ (size_t) time(NULL) ^ (size_t) &set;
+	set.type = type;
+	set.entries = (multiset_entry *) calloc(set.capacity, sizeof(multiset_entry));
+	if (!set.entries) return -1;
+
+	jcount = multiset_fill(&set, judge, jlen, 0);
+	if (jcount >= 0)
+		pcount = multiset_fill(&set, process, plen, 1);
+	free(set.entries);
+
+	if (jcount == -2 || pcount == -2) return -1;
+	// Since no count went negative, the multisets are equal if they are the same size.
+	return pcount == jcount;
+}
+
+static int check_easy(const char *judge, size_t jlen, const char *process, size_t plen) {
+	size_t counts[256] = {0}, i;
+	unsigned char ch;
+
+	for (i = 0; i < jlen; ++i) {
+		ch = (unsigned char) judge[i];
+		if (!iswhite(ch)) ++counts[ch >= 'A' && ch <= 'Z' ? ch | 0x20 : ch];
+	}
+	for (i = 0; i < plen; ++i) {
+		ch = (unsigned char) process[i];
+		if (!iswhite(ch) && !counts[ch >= 'A' && ch <= 'Z' ? ch | 0x20 : ch]--) return 0;
+	}
+	for (i = 0; i < 256; ++i)
+		if (counts[i]) return 0;
+	return 1;
+}
+
+static PyObject *checker_multiset_type(PyObject *args, const char *format, int type) {
+	PyObject *expected, *actual;
+	int result;
+
+	if (!PyArg_ParseTuple(args, format, &expected, &actual))
+		return NULL;
+
+	if (!PyString_Check(expected) || !PyString_Check(actual)) {
+		PyErr_SetString(PyExc_ValueError, "expected strings");
+		return NULL;
+	}
+
+	Py_INCREF(expected);
+	Py_INCREF(actual);
+	Py_BEGIN_ALLOW_THREADS
+	result = check_multiset(PyString_AS_STRING(expected), PyString_GET_SIZE(expected),
+							PyString_AS_STRING(actual), PyString_GET_SIZE(actual), type);
+	Py_END_ALLOW_THREADS
+	Py_DECREF(expected);
+	Py_DECREF(actual);
+
+	if (result < 0)
+		return PyErr_NoMemory();
+	if (result)
+		Py_RETURN_TRUE;
+	Py_RETURN_FALSE;
+}
+
+static PyObject *checker_sorted(PyObject *self, PyObject *args) {
+	UNREFERENCED_PARAMETER(self);
+	return checker_multiset_type(args, "OO:sorted", MULTISET_LINES);
+}
+
+static PyObject *checker_unordered(PyObject *self, PyObject *args) {
+	UNREFERENCED_PARAMETER(self);
+	return checker_multiset_type(args, "OO:unordered", MULTISET_TOKENS);
+}
+
+static PyObject *checker_easy(PyObject *self, PyObject *args) {
+	PyObject *expected, *actual, *result;
+
+	UNREFERENCED_PARAMETER(self);
+	if (!PyArg_ParseTuple(args, "OO:easy", &expected, &actual))
+		return NULL;
+
+	if (!PyString_Check(expected) || !PyString_Check(actual)) {
+		PyErr_SetString(PyExc_ValueError, "expected strings");
+		return NULL;
+	}
+
+	Py_INCREF(expected);
+	Py_INCREF(actual);
+	Py_BEGIN_ALLOW_THREADS
+	result = check_easy(PyString_AS_STRING(expected), PyString_GET_SIZE(expected),
+						PyString_AS_STRING(actual), PyString_GET_SIZE(actual)) ?
+			Py_True : Py_False;
+	Py_END_ALLOW_THREADS
+	Py_DECREF(expected);
+	Py_DECREF(actual);
+	Py_INCREF(result);
+	return result;
+}
+
 static PyObject *checker_standard(PyObject *self, PyObject *args) {
 	PyObject *expected, *actual, *result;
 
@@ -80,6 +485,18 @@ static PyObject *checker_standard(PyObject *self, PyObject *args) {
 static PyMethodDef checker_methods[] = {
 	{"standard", checker_standard, METH_VARARGS,
 	 "Standard DMOJ checker."},
+	{"floats", checker_floats, METH_VARARGS,
+	 "Float checker, with absolute or relative error. Returns None if the Python checker must decide."},
+	{"floatsabs", checker_floatsabs, METH_VARARGS,
+	 "Float checker, with absolute error. Returns None if the Python checker must decide."},
+	{"floatsrel", checker_floatsrel, METH_VARARGS,
+	 "Float checker, with relative error. Returns None if the Python checker must decide."},
+	{"sorted", checker_sorted, METH_VARARGS,
+	 "Checker for lines of tokens in any order."},
+	{"unordered", checker_unordered, METH_VARARGS,
+	 "Checker for tokens in any order."},
+	{"easy", checker_easy, METH_VARARGS,
+	 "Checker for the same characters in any order and case, ignoring whitespace."},
 	{NULL, NULL, 0, NULL}
 };
 
@@ -0,0 +1,90 @@
+"""
+Measures the throughput of the native checkers against their pure Python versions.
+
+Usage: python -m dmoj.checkers.benchmark [-c CHECKER ...] [SIZE_MB ...]
+"""
+
+import argparse
+import imp
+import os
+import random
+import sys
+import time
+
+CHECKERS = ['standard', 'floats', 'sorted', 'unordered', 'easy']
+
+
+def load_python_checker(name):
+    # A None entry in sys.modules makes the import of _checker fail, so the module keeps its Python check.
+    native = sys.modules.get('dmoj.checkers._checker')
+    sys.modules['dmoj.checkers._checker'] = None
+    try:
+        path = os.path.join(os.path.dirname(__file__), name + '.py')
+        return imp.load_source('dmoj.checkers._benchmark_' + name, path).check
+    finally:
+        if native is None:
+            del sys.modules['dmoj.checkers._checker']
+        else:
+            sys.modules['dmoj.checkers._checker'] = native
+
+
+def load_native_checker(name):
+    module = __import__('dmoj.checkers.' + name, fromlist=['check'])
+    return module.check
+
+
+def generate(name, size):
+    """
+    Returns a judge output of about size bytes, and an accepted process output for it, which for the unordered
+    checkers is shuffled so that nothing can be matched in order.
+    """
+    if name == 'floats':
+        token = lambda: '%.9f' % random.uniform(-1e6, 1e6)
+    else:
+        token = lambda: str(random.randint(0, 1 << 30))
+    lines = []
+    total = 0
+    while total < size:
+        line = ' '.join(token() for _ in xrange(8))
+        lines.append(line)
+        total += len(line) + 1
+    judge = '\n'.join(lines) + '\n'
+
+    if name == 'sorted':
+        random.shuffle(lines)
+    elif name in ('unordered', 'easy'):
+        tokens = judge.split()
+        random.shuffle(tokens)
+        lines = [' '.join(tokens[i:i + 8]) for i in xrange(0, len(tokens), 8)]
+    return judge, '\n'.join(lines) + '\n'
+
+
+def measure(check, process, judge):
+    start = time.time()
+    result = check(process, judge, precision=6)
+    elapsed = time.time() - start
+    assert result, 'checker rejected accepted output'
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measures native checker throughput against the Python versions.')
+    parser.add_argument('sizes', nargs='*', type=int, default=[1, 10, 100], help='output sizes in megabytes')
+    parser.add_argument('-c', '--checker', action='append', choices=CHECKERS, help='checkers to measure')
+    args = parser.parse_args()
+
+    print '%-10s %8s %12s %12s %8s' % ('checker', 'size', 'native', 'python', 'speedup')
+    for name in args.checker or CHECKERS:
+        native = load_native_checker(name)
+        python = load_python_checker(name)
+        for size in args.sizes:
+            judge, process = generate(name, size << 20)
+            native_time = measure(native, process, judge)
+            python_time = measure(python, process, judge)
+            print '%-10s %6dMB %8.1f MB/s %8.1f MB/s %7.1fx' % (name, size, size / native_time, size / python_time,
+                                                              python_time / native_time)
+            sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -4,3 +4,12 @@ def check(process_output, judge_output, **kwargs):
     process_all = re.sub(r'\s+', '', process_output)
     judge_all = re.sub(r'\s+', '', judge_output)
     return Counter(process_all.lower()) == Counter(judge_all.lower())
+
+try:
+    from ._checker import easy
+except ImportError as e:
+    pass
+else:
+    def check(process_output, judge_output, _checker=easy, **kwargs):
+        return _checker(judge_output, process_output)
+    del easy
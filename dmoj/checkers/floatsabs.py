@@ -30,3 +30,15 @@ def check(process_output, judge_output, precision, **kwargs):
     except:
         return False
     return True
+
+try:
+    from ._checker import floatsabs
+except ImportError as e:
+    pass
+else:
+    def check(process_output, judge_output, precision, _checker=floatsabs, _fallback=check, **kwargs):
+        result = _checker(judge_output, process_output, 10 ** -int(precision))
+        if result is None:
+            return _fallback(process_output, judge_output, precision, **kwargs)
+        return result
+    del floatsabs
@@ -31,3 +31,15 @@ def check(process_output, judge_output, precision, **kwargs):
     except:
         return False
     return True
+
+try:
+    from ._checker import floatsrel
+except ImportError as e:
+    pass
+else:
+    def check(process_output, judge_output, precision, _checker=floatsrel, _fallback=check, **kwargs):
+        result = _checker(judge_output, process_output, 10 ** -int(precision))
+        if result is None:
+            return _fallback(process_output, judge_output, precision, **kwargs)
+        return result
+    del floatsrel
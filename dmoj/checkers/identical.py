@@ -1,2 +1,22 @@
 def check(process_output, judge_output, **kwargs):
     return judge_output == process_output
+
+
+class IdenticalStream(object):
+    def __init__(self, judge_output):
+        self.judge_output = judge_output
+        self.offset = 0
+        self.wrong = False
+
+    def feed(self, data):
+        if not self.wrong:
+            self.wrong = not self.judge_output.startswith(data, self.offset)
+            self.offset += len(data)
+        return not self.wrong
+
+    def finish(self):
+        return not self.wrong and self.offset == len(self.judge_output)
+
+
+def check_stream(judge_output, **kwargs):
+    return IdenticalStream(judge_output)
@@ -26,3 +26,78 @@ def check(process_output, judge_output, point_value, feedback=False,
             count += 1
 
     return CheckerResult(count == len(judge_lines), point_value * (1.0 * count / len(judge_lines)), ''.join(cases) if feedback else "")
+
+
+class LineCountStream(object):
+    """
+    Matches output lines against the judge's as they arrive. The last line with content is held back until more
+    content follows, since it is the one stripped at the end of the output.
+    """
+
+    def __init__(self, judge_output, point_value, feedback=False,
+                 match=lambda p, j: p.strip() == j.strip(), **kwargs):
+        self.judge_lines = filter(None, judge_output.strip().split("\n"))
+        self.point_value = point_value
+        self.feedback = feedback
+        self.match = eval(match) if isinstance(match, basestring) else match
+
+        self.cases = [verdict[0]] * len(self.judge_lines)
+        self.count = 0
+        self.lines = 0
+        self.partial = ''
+        self.held = []
+        self.started = False
+        self.wrong = False
+
+    def _emit(self, line):
+        if self.lines >= len(self.judge_lines):
+            self.wrong = True
+            return
+        if self.match(line, self.judge_lines[self.lines]):
+            self.cases[self.lines] = verdict[1]
+            self.count += 1
+        self.lines += 1
+
+    def _line(self, line):
+        if not self.started:
+            line = line.lstrip()
+            if not line:
+                return
+            self.started = True
+        if not line:
+            return
+        if line.strip():
+            for held in self.held:
+                self._emit(held)
+            self.held = [line]
+        else:
+            # Whitespace lines only count if there's content after them.
+            self.held.append(line)
+
+    def feed(self, data):
+        if self.wrong:
+            return False
+        lines = (self.partial + data).split("\n")
+        self.partial = lines.pop()
+        for line in lines:
+            self._line(line)
+            if self.wrong:
+                break
+        return not self.wrong
+
+    def finish(self):
+        if not self.wrong:
+            self._line(self.partial)
+            if self.held:
+                self._emit(self.held[0].rstrip())
+        if self.wrong:
+            return False
+        if not self.judge_lines:
+            return True
+        return CheckerResult(self.count == len(self.judge_lines),
+                             self.point_value * (1.0 * self.count / len(self.judge_lines)),
+                             ''.join(self.cases) if self.feedback else "")
+
+
+def check_stream(judge_output, point_value, **kwargs):
+    return LineCountStream(judge_output, point_value, **kwargs)
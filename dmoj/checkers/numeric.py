@@ -0,0 +1,71 @@
+from itertools import chain
+
+from dmoj.checkers import floats, floatsabs, floatsrel
+from dmoj.result import CheckerResult
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+fallbacks = {
+    'default': floats,
+    'absolute': floatsabs,
+    'relative': floatsrel,
+}
+
+
+def _parse(output):
+    # Discount empty lines, like the float checkers
+    lines = [line.split() for line in output.split('\n') if line]
+    return [len(line) for line in lines], list(chain.from_iterable(lines))
+
+
+def _matches(process, judge, epsilon, error_mode):
+    if error_mode == 'absolute':
+        return numpy.isclose(process, judge, rtol=0, atol=epsilon, equal_nan=True)
+    elif error_mode == 'relative':
+        return numpy.isclose(process, judge, rtol=epsilon, atol=0, equal_nan=True)
+    return (numpy.isclose(process, judge, rtol=0, atol=epsilon, equal_nan=True) |
+            numpy.isclose(process, judge, rtol=epsilon, atol=0, equal_nan=True))
+
+
+def check(process_output, judge_output, precision=6, error_mode='default', feedback=True, **kwargs):
+    """
+    Compares outputs of whitespace-separated numbers all at once with NumPy, accepting absolute, relative or either
+    error within 10^-precision, as selected by error_mode. The line structure must match, as with the float checkers.
+
+    Outputs that don't parse as numbers, which includes mixed tokens, are left to the corresponding float checker,
+    as is everything if NumPy isn't installed.
+    """
+    if error_mode not in fallbacks:
+        raise ValueError('unknown error_mode: %s' % error_mode)
+    if process_output == judge_output:
+        return True
+    if numpy is None:
+        return fallbacks[error_mode].check(process_output, judge_output, precision=precision, **kwargs)
+
+    epsilon = 10 ** -int(precision)
+    process_counts, process_tokens = _parse(process_output)
+    judge_counts, judge_tokens = _parse(judge_output)
+    if process_counts != judge_counts:
+        return False
+
+    try:
+        judge = numpy.array(judge_tokens, dtype=numpy.float64)
+    except ValueError:
+        return fallbacks[error_mode].check(process_output, judge_output, precision=precision, **kwargs)
+    try:
+        process = numpy.array(process_tokens, dtype=numpy.float64)
+    except ValueError:
+        return False
+
+    matches = _matches(process, judge, epsilon, error_mode)
+    if matches.all():
+        return True
+
+    index = int(numpy.argmin(matches))
+    ends = numpy.cumsum(judge_counts)
+    line = int(numpy.searchsorted(ends, index, side='right'))
+    number = index - (int(ends[line - 1]) if line else 0)
+    return CheckerResult(False, 0.0, 'wrong answer on line %d, number %d' % (line + 1, number + 1) if feedback else '')
@@ -13,3 +13,12 @@ def check(process_output, judge_output, **kwargs):
         if process_line != judge_line:
             return False
     return True
+
+try:
+    from ._checker import sorted
+except ImportError as e:
+    pass
+else:
+    def check(process_output, judge_output, _checker=sorted, **kwargs):
+        return _checker(judge_output, process_output)
+    del sorted
@@ -1,13 +1,14 @@
+import re
+from string import whitespace
+
+_line = re.compile(r'[\r\n]')
+
+
 def check(process_output, judge_output, **kwargs):
-    from itertools import izip
-    process_lines = filter(None, process_output.split('\n'))
-    judge_lines = filter(None, judge_output.split('\n'))
-    if len(process_lines) != len(judge_lines):
-        return False
-    for process_line, judge_line in izip(process_lines, judge_lines):
-        if process_line.split() != judge_line.split():
-            return False
-    return True
+    # Like the native checker and the stream, a lone \r breaks the line, and lines of only whitespace are ignored.
+    process_lines = filter(None, [line.split() for line in _line.split(process_output)])
+    judge_lines = filter(None, [line.split() for line in _line.split(judge_output)])
+    return process_lines == judge_lines
 
 try:
     from ._checker import standard
@@ -17,3 +18,61 @@ else:
     def check(process_output, judge_output, _checker=standard, **kwargs):
         return _checker(judge_output, process_output)
     del standard
+
+_line_break = re.compile(r'[ \t\v\f]*[\r\n]\s*')
+_space = re.compile(r'[ \t\v\f]+')
+
+
+def _canonical(data):
+    # Whitespace between tokens only matters in whether it breaks the line.
+    return _space.sub(' ', _line_break.sub('\n', data))
+
+
+class StandardStream(object):
+    """
+    Compares output against the judge's token by token as it arrives, by comparing canonical forms in which every
+    run of whitespace is replaced by a newline if it contains one, and a space otherwise.
+    """
+
+    def __init__(self, judge_output):
+        self.judge_output = _canonical(judge_output.strip())
+        self.offset = 0
+        self.pending = ''
+        self.started = False
+        self.wrong = False
+
+    def _compare(self, data):
+        data = _canonical(data)
+        self.wrong = not self.judge_output.startswith(data, self.offset)
+        self.offset += len(data)
+
+    def feed(self, data):
+        if self.wrong:
+            return False
+
+        data = self.pending + data
+        if not self.started:
+            data = data.lstrip()
+            if not data:
+                self.pending = ''
+                return True
+            self.started = True
+
+        # A trailing whitespace run or token could be continued by the next read, so it's held back until then.
+        if data[-1] in whitespace:
+            cut = len(data.rstrip())
+        else:
+            cut = max(data.rfind(char) for char in whitespace) + 1
+        self.pending = data[cut:]
+        if cut:
+            self._compare(data[:cut])
+        return not self.wrong
+
+    def finish(self):
+        if not self.wrong:
+            self._compare(self.pending.rstrip())
+        return not self.wrong and self.offset == len(self.judge_output)
+
+
+def check_stream(judge_output, **kwargs):
+    return StandardStream(judge_output)
@@ -2,3 +2,12 @@ def check(process_output, judge_output, **kwargs):
     process_tokens = process_output.split()
     judge_tokens = judge_output.split()
     return len(process_tokens) == len(judge_tokens) and sorted(process_tokens) == sorted(judge_tokens)
+
+try:
+    from ._checker import unordered
+except ImportError as e:
+    pass
+else:
+    def check(process_output, judge_output, _checker=unordered, **kwargs):
+        return _checker(judge_output, process_output)
+    del unordered
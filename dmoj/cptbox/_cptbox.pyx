@@ -8,6 +8,7 @@ from posix.types cimport pid_t
 
 
 __all__ = ['Process', 'Debugger', 'bsd_get_proc_cwd', 'bsd_get_proc_fdno', 'MAX_SYSCALL_NUMBER',
+           'start_zygote', 'stop_zygote', 'zygote_pid',
            'DEBUGGER_X86', 'DEBUGGER_X64', 'DEBUGGER_X86_ON_X64', 'DEBUGGER_X32', 'DEBUGGER_ARM',
            'AT_FDCWD']
 
@@ -65,9 +66,14 @@ cdef extern from 'ptbox.h' nogil:
         void set_callback(pt_handler_callback callback, void* context)
         void set_event_proc(pt_event_callback, void *context)
         int set_handler(int syscall, int handler)
+        void set_handlers(const int *handlers)
         bint trace_syscalls()
         void trace_syscalls(bint value)
+        bint use_seccomp()
+        void use_seccomp(bint value)
+        void *seccomp_program()
         int spawn(pt_fork_handler, void *context)
+        int attach(pid_t pid)
         int monitor()
         int getpid()
         double execution_time()
@@ -103,9 +109,14 @@ cdef extern from 'helper.h' nogil:
         int stderr
         int max_fd
         int *fds
+        void *seccomp
 
     void cptbox_closefrom(int lowfd)
     int cptbox_child_run(child_config *)
+    int cptbox_zygote_start()
+    void cptbox_zygote_stop()
+    pid_t cptbox_zygote_pid()
+    pid_t cptbox_zygote_spawn(child_config *)
     char *_bsd_get_proc_cwd "bsd_get_proc_cwd"(pid_t pid)
     char *_bsd_get_proc_fdno "bsd_get_proc_fdno"(pid_t pid, int fdno)
 
@@ -184,6 +195,21 @@ def bsd_get_proc_fdno(pid_t pid, int fd):
     free(buf)
     return res
 
+def start_zygote():
+    """
+    Starts the zygote for this process if it isn't running, which spawns processes whose _spawn asks for it
+    instead of forking this process, however large it has grown. It should be started while this process is small,
+    since its pages are shared with the zygote until this process writes to them.
+    """
+    if cptbox_zygote_start():
+        PyErr_SetFromErrno(OSError)
+
+def stop_zygote():
+    cptbox_zygote_stop()
+
+def zygote_pid():
+    return cptbox_zygote_pid() or None
+
 
 cdef class Debugger:
     cdef pt_debugger *thisptr
@@ -338,6 +364,8 @@ cdef class Process:
     cdef public unsigned long _child_memory, _child_address
     cdef public unsigned int _cpu_time
     cdef public int _nproc
+    # Whether to read the peak memory from /proc, rather than it being accounted elsewhere.
+    cdef public bint _proc_memory
     cdef unsigned long _max_memory
 
     def __cinit__(self, int debugger, debugger_type, *args, **kwargs):
@@ -346,6 +374,7 @@ cdef class Process:
         self._cpu_time = 0
         self._nproc = -1
         self._signal = 0
+        self._proc_memory = True
 
         if debugger == DEBUGGER_X86:
             self._debugger = new pt_debugger_x86()
@@ -379,7 +408,7 @@ cdef class Process:
         return self._callback(syscall)
 
     cdef int _event_handler(self, int event, unsigned long param) nogil:
-        if not PTBOX_FREEBSD and (event == PTBOX_EVENT_EXITING or event == PTBOX_EVENT_SIGNAL):
+        if not PTBOX_FREEBSD and self._proc_memory and (event == PTBOX_EVENT_EXITING or event == PTBOX_EVENT_SIGNAL):
             self._max_memory = get_memory(self.process.getpid()) or self._max_memory
         if event == PTBOX_EVENT_PROTECTION:
             with gil:
@@ -395,14 +424,22 @@ cdef class Process:
     cpdef _handler(self, syscall, handler):
         self.process.set_handler(syscall, handler)
 
+    cpdef _set_handlers(self, bytes handlers):
+        # The handler of every syscall number, as MAX_SYSCALL native ints.
+        if len(handlers) != MAX_SYSCALL * sizeof(int):
+            raise ValueError('Expected %d handlers' % MAX_SYSCALL)
+        self.process.set_handlers(<const int*><const char*>handlers)
+
     cpdef _protection_fault(self, syscall):
         pass
 
     cpdef _cpu_time_exceeded(self):
         pass
 
-    cpdef _spawn(self, file, args, env=(), chdir='', fds=None):
+    cpdef _spawn(self, file, args, env=(), chdir='', fds=None, bint zygote=False):
         cdef child_config config
+        cdef pid_t pid = -1
+        cdef int failed
         config.address_space = self._child_address
         config.memory = self._child_memory
         config.cpu_time = self._cpu_time
@@ -422,12 +459,25 @@ cdef class Process:
             config.fds = <int*>malloc(sizeof(int) * len(fds))
             for i in xrange(len(fds)):
                 config.fds[i] = fds[i]
+        if self.process.trace_syscalls() and self.process.use_seccomp():
+            config.seccomp = self.process.seccomp_program()
+        else:
+            config.seccomp = NULL
         with nogil:
-            if self.process.spawn(pt_child, &config):
-                with gil:
-                    raise RuntimeError('Failed to spawn child')
+            if zygote:
+                pid = cptbox_zygote_spawn(&config)
+            if pid > 0:
+                failed = self.process.attach(pid)
+                if failed:
+                    # We can't trace what the zygote spawns, so don't try again.
+                    cptbox_zygote_stop()
+            if pid <= 0 or failed:
+                failed = self.process.spawn(pt_child, &config)
         free(config.argv)
         free(config.envp)
+        free(config.fds)
+        if failed:
+            raise RuntimeError('Failed to spawn child')
 
     cpdef _monitor(self):
         cdef int exitcode
@@ -448,6 +498,13 @@ cdef class Process:
         def __set__(self, bint value):
             self.process.trace_syscalls(value)
 
+    property _use_seccomp:
+        def __get__(self):
+            return self.process.use_seccomp()
+
+        def __set__(self, bint value):
+            self.process.use_seccomp(value)
+
     property pid:
         def __get__(self):
             return self.process.getpid()
@@ -467,7 +524,7 @@ cdef class Process:
 
     property max_memory:
         def __get__(self):
-            if PTBOX_FREEBSD:
+            if PTBOX_FREEBSD or not self._proc_memory:
                 return self.process.getrusage().ru_maxrss
             if self._exited:
                 return self._max_memory or self.process.getrusage().ru_maxrss
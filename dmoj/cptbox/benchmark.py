@@ -0,0 +1,98 @@
+"""
+Benchmarks of the sandbox.
+
+spawn measures the latency of spawning a sandboxed process by forking the judge, against spawning it from the
+zygote, as the judge's heap grows.
+
+syscalls measures a syscall-heavy workload under a profile that allows every syscall, traced by ptrace alone
+against filtered by seccomp, which lets the kernel run allowed syscalls without stopping for the judge.
+
+Usage: python -m dmoj.cptbox.benchmark spawn [-n SPAWNS] [-e EXECUTABLE] [HEAP_MB ...]
+       python -m dmoj.cptbox.benchmark syscalls [-n RUNS] [COMMAND ...]
+"""
+
+import argparse
+import os
+import time
+
+from dmoj.cptbox import NullSecurity, SecurePopen
+from dmoj.cptbox._cptbox import start_zygote, stop_zygote
+
+
+def measure(executable, spawns, zygote):
+    times = []
+    for _ in xrange(spawns):
+        start = time.time()
+        process = SecurePopen([executable], stdin=None, stdout=None, zygote=zygote)
+        process.wait()
+        times.append(time.time() - start)
+        assert process.returncode == 0, 'process failed with %d' % process.returncode
+    times.sort()
+    return times[len(times) // 2], times[len(times) * 9 // 10]
+
+
+def measure_syscalls(command, runs, seccomp):
+    times = []
+    for _ in xrange(runs):
+        # The sandbox closes the descriptors it's given once the process has them.
+        process = SecurePopen(command, security=NullSecurity(), stdin=None, stdout=os.open(os.devnull, os.O_WRONLY),
+                              stderr=os.open(os.devnull, os.O_WRONLY), seccomp=seccomp)
+        process.wait()
+        assert process.returncode == 0, 'process failed with %d' % process.returncode
+        times.append(process.wall_clock_time)
+    times.sort()
+    return times[len(times) // 2], times[0]
+
+
+def spawn(args):
+    # Start the zygote while we are small, as the judge does.
+    start_zygote()
+
+    print '%8s %14s %14s %14s %14s' % ('heap', 'fork median', 'fork p90', 'zygote median', 'zygote p90')
+    heap = []
+    for size in sorted(args.heaps):
+        # Every page is written to, so that the heap is resident and the fork has to copy its page tables.
+        while len(heap) < size:
+            heap.append(bytearray(1 << 20))
+        fork_median, fork_p90 = measure(args.executable, args.spawns, False)
+        zygote_median, zygote_p90 = measure(args.executable, args.spawns, True)
+        print '%6dMB %11.2f ms %11.2f ms %11.2f ms %11.2f ms' % (size, fork_median * 1000, fork_p90 * 1000,
+                                                                zygote_median * 1000, zygote_p90 * 1000)
+
+    stop_zygote()
+
+
+def syscalls(args):
+    # Copying one byte at a time makes a read and a write for every byte.
+    command = args.command or ['/bin/dd', 'if=/dev/zero', 'of=/dev/null', 'bs=1', 'count=200000']
+    print ' '.join(command)
+    print '%10s %14s %14s' % ('tracing', 'median', 'best')
+    for name, seccomp in (('ptrace', False), ('seccomp', True)):
+        median, best = measure_syscalls(command, args.runs, seccomp)
+        print '%10s %11.3f s %11.3f s' % (name, median, best)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks the sandbox.')
+    subparsers = parser.add_subparsers()
+
+    spawn_parser = subparsers.add_parser('spawn', help='sandboxed process spawn latency with and without the '
+                                                       'zygote')
+    spawn_parser.add_argument('heaps', nargs='*', type=int, default=[0, 256, 1024],
+                              help='judge heap sizes in megabytes')
+    spawn_parser.add_argument('-n', '--spawns', type=int, default=200, help='processes to spawn for each measurement')
+    spawn_parser.add_argument('-e', '--executable', default='/bin/true', help='executable to spawn')
+    spawn_parser.set_defaults(func=spawn)
+
+    syscalls_parser = subparsers.add_parser('syscalls', help='syscall-heavy workload with and without seccomp')
+    syscalls_parser.add_argument('command', nargs=argparse.REMAINDER, help='workload to run, by default a dd '
+                                                                           'copying one byte at a time')
+    syscalls_parser.add_argument('-n', '--runs', type=int, default=5, help='runs of the workload in each mode')
+    syscalls_parser.set_defaults(func=syscalls)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+import errno
+import itertools
+import logging
+import os
+import signal
+import threading
+import time
+
+log = logging.getLogger('dmoj.cptbox')
+
+
+def _write(path, value):
+    with open(path, 'w') as f:
+        f.write(value)
+
+
+def _read(path):
+    with open(path) as f:
+        return f.read()
+
+
+def _read_keyed(path):
+    # Files like cpu.stat and memory.events are lines of a key and an integer.
+    values = {}
+    for line in _read(path).splitlines():
+        key, _, value = line.partition(' ')
+        values[key] = int(value)
+    return values
+
+
+class Cgroup(object):
+    """
+    A transient cgroup v2 that a sandboxed process and all its children are accounted and limited in. It is created
+    with its memory limit, the process is moved into it before it execs, and it is destroyed once the process exits.
+    """
+
+    def __init__(self, path, memory):
+        self.path = path
+        os.mkdir(path)
+        try:
+            if memory:
+                _write(self._file('memory.max'), str(memory))
+                # Swapping out would let the process use more than its limit, if swap is accounted at all.
+                if os.path.exists(self._file('memory.swap.max')):
+                    _write(self._file('memory.swap.max'), '0')
+        except Exception:
+            self.destroy()
+            raise
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def add(self, pid):
+        _write(self._file('cgroup.procs'), str(pid))
+
+    def usage(self):
+        """
+        Returns the peak memory of the cgroup in kilobytes, its user CPU time in seconds, and whether the OOM killer
+        killed anything in it for reaching its memory limit.
+        """
+        memory = self.peak_memory()
+        cpu = _read_keyed(self._file('cpu.stat'))['user_usec'] / 1000000.
+        oom = _read_keyed(self._file('memory.events')).get('oom_kill', 0) > 0
+        return memory, cpu, oom
+
+    def peak_memory(self):
+        return int(_read(self._file('memory.peak'))) // 1024
+
+    def destroy(self):
+        # Processes that left the sandbox's process group may outlive it, but not its cgroup.
+        try:
+            _write(self._file('cgroup.kill'), '1')
+        except IOError:
+            pass
+        # Killed processes take a moment to leave.
+        for _ in xrange(50):
+            try:
+                os.rmdir(self.path)
+                return
+            except OSError as e:
+                if e.errno == errno.ENOENT:
+                    return
+                if e.errno != errno.EBUSY:
+                    break
+            time.sleep(0.01)
+        log.warning('Failed to remove cgroup: %s', self.path)
+
+
+class CgroupRoot(object):
+    """
+    A cgroup v2 delegated to the judge, in which a transient cgroup is created for every sandboxed process. The
+    memory controller must be available to it, and it must not have processes of its own, so that it can be enabled
+    for its children.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._counter = itertools.count()
+
+        created = not os.path.isdir(path)
+        if created:
+            os.mkdir(path)
+        try:
+            if 'memory' not in _read(os.path.join(path, 'cgroup.controllers')).split():
+                # We may have just created it, in which case its parent may be able to give it the controller.
+                parent = os.path.dirname(path)
+                if 'memory' not in _read(os.path.join(parent, 'cgroup.controllers')).split():
+                    raise OSError(errno.ENOTSUP, 'the memory controller is not available to %s' % parent)
+                _write(os.path.join(parent, 'cgroup.subtree_control'), '+memory')
+            if 'memory' not in _read(os.path.join(path, 'cgroup.subtree_control')).split():
+                _write(os.path.join(path, 'cgroup.subtree_control'), '+memory')
+            self._probe()
+        except Exception:
+            if created:
+                os.rmdir(path)
+            raise
+
+    def _probe(self):
+        # Moving a process needs more than being able to create a cgroup, so try it once with one that does nothing.
+        cgroup = self.create(0)
+        pid = os.fork()
+        if not pid:
+            try:
+                signal.pause()
+            finally:
+                os._exit(0)
+        try:
+            cgroup.add(pid)
+            if not os.path.exists(cgroup._file('memory.peak')):
+                raise OSError(errno.ENOTSUP, 'memory.peak is unsupported, Linux 5.19 or later is required')
+        finally:
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+            cgroup.destroy()
+
+    def create(self, memory):
+        """
+        Creates a cgroup limited to memory bytes, or unlimited if memory is 0.
+        """
+        return Cgroup(os.path.join(self.path, 'box-%d-%d' % (os.getpid(), next(self._counter))), memory)
+
+
+_roots = {}
+_roots_lock = threading.Lock()
+
+
+def get_cgroup_root(path):
+    """
+    Returns the CgroupRoot at path, or None if it can't be used, in which case sandboxed processes are accounted and
+    limited without cgroups.
+    """
+    with _roots_lock:
+        if path not in _roots:
+            try:
+                _roots[path] = CgroupRoot(path)
+            except (IOError, OSError) as e:
+                log.warning('Cannot use cgroup %s for sandbox accounting, falling back to rlimits: %s', path, e)
+                _roots[path] = None
+        return _roots[path]
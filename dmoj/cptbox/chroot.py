@@ -3,7 +3,7 @@ import sys
 import os
 import logging
 
-from dmoj.cptbox.handlers import ALLOW, STDOUTERR, ACCESS_DENIED
+from dmoj.cptbox.handlers import ALLOW, DISALLOW, STDOUTERR, ACCESS_DENIED
 from dmoj.cptbox._cptbox import bsd_get_proc_cwd, bsd_get_proc_fdno, AT_FDCWD
 from dmoj.cptbox.syscalls import *
 
@@ -11,10 +11,58 @@ from dmoj.cptbox.syscalls import *
 log = logging.getLogger('dmoj.security')
 
 
+_fs_jails = {}
+
+
+def compile_fs_jail(filesystem):
+    """
+    Compiles the patterns of filesystem into one, once for each executor's filesystem. Paths that vary from launch to
+    launch, like the submission's directory, should be given to CHROOTSecurity as paths instead.
+    """
+    filesystem = tuple(filesystem)
+    jail = _fs_jails.get(filesystem)
+    if jail is None:
+        jail = _fs_jails[filesystem] = re.compile('|'.join(filesystem) if filesystem else '^')
+    return jail
+
+
+class _DecisionCache(object):
+    """
+    Remembers the last few thousand access decisions. The least recently used are forgotten, in generations: lookups
+    that hit the previous generation are carried into the current one, and once the current one is full it replaces
+    the previous one.
+    """
+    __slots__ = ('size', '_current', '_previous')
+
+    def __init__(self, size):
+        self.size = size
+        self._current = {}
+        self._previous = {}
+
+    def get(self, key):
+        value = self._current.get(key)
+        if value is None:
+            value = self._previous.get(key)
+            if value is not None:
+                self.put(key, value)
+        return value
+
+    def put(self, key, value):
+        if len(self._current) >= self.size:
+            self._previous = self._current
+            self._current = {}
+        self._current[key] = value
+
+
 class CHROOTSecurity(dict):
-    def __init__(self, filesystem, writable=(1, 2), io_redirects=None):
+    def __init__(self, filesystem, writable=(1, 2), io_redirects=None, paths=()):
         super(CHROOTSecurity, self).__init__()
-        self.fs_jail = re.compile('|'.join(filesystem) if filesystem else '^')
+        self.fs_jail = compile_fs_jail(filesystem)
+        # Directories to allow on top of the jail, by prefix.
+        self._paths = tuple(paths)
+        self._decisions = _DecisionCache(2048)
+        self._cwd = None
+        self._cwd_fixed = None
         self._writable = list(writable)
         self._io_redirects = io_redirects
 
@@ -214,21 +262,52 @@ class CHROOTSecurity(dict):
 
         return self._file_access_check(file, debugger)
 
+    def in_jail(self, file):
+        return self.fs_jail.match(file) is not None or file.startswith(self._paths)
+
     def _file_access_check(self, file, debugger, dirfd=AT_FDCWD):
-        file = self.get_full_path(debugger, file, dirfd)
-        if self.fs_jail.match(file) is None:
+        dirfd = (dirfd & 0x7FFFFFFF) - (dirfd & 0x80000000)
+        # The decision for a path depends only on the path once it's resolved. An absolute path needs no resolving,
+        # and neither does one relative to a working directory that can't change.
+        cacheable = file.startswith('/') or (dirfd == AT_FDCWD and self._is_cwd_fixed())
+        allowed = self._decisions.get(file) if cacheable else None
+        if allowed is None:
+            allowed = self.in_jail(self.get_full_path(debugger, file, dirfd))
+            if cacheable:
+                self._decisions.put(file, allowed)
+
+        if not allowed:
+            file = self.get_full_path(debugger, file, dirfd)
             log.warning('Denied file open: %s', file)
             print>> sys.stderr, 'Not allowed to access:', file
             return False
         return True
 
+    def _is_cwd_fixed(self):
+        # The handlers are settled by the time the process runs, so this only has to be worked out once.
+        if self._cwd_fixed is None:
+            self._cwd_fixed = all(self.get(call, DISALLOW) in (DISALLOW, ACCESS_DENIED)
+                                  for call in (sys_chdir, sys_fchdir))
+        return self._cwd_fixed
+
+    def _getcwd(self, debugger):
+        # Every process in the sandbox starts in its directory, and stays there if it can't chdir.
+        if not self._is_cwd_fixed():
+            return self._getcwd_pid(debugger.pid)
+        if self._cwd is None:
+            self._cwd = self._getcwd_pid(debugger.pid)
+        return self._cwd
+
     def get_full_path(self, debugger, file, dirfd=AT_FDCWD):
         dirfd = (dirfd & 0x7FFFFFFF) - (dirfd & 0x80000000)
         if not file.startswith('/'):
-            dir = (self._getcwd_pid(debugger.pid) if dirfd == AT_FDCWD else
+            dir = (self._getcwd(debugger) if dirfd == AT_FDCWD else
                    self._getfd_pid(debugger.pid, dirfd))
             file = os.path.join(dir, file)
-        file = '/' + os.path.normpath(file).lstrip('/')
+        # Most paths are already normal, and normpath takes longer than checking them.
+        if not file.startswith('/') or '//' in file or '/./' in file or '/../' in file or \
+                file.endswith(('/', '/.', '/..')):
+            file = '/' + os.path.normpath(file).lstrip('/')
         return file
 
     def do_faccessat(self, debugger):
@@ -0,0 +1,139 @@
+"""
+Measures file access checks with their cache of decisions and working directory, against resolving every path in
+full as they used to: first per check, on the paths a Python interpreter tries when it imports modules, then by the
+startup latency of the self-tests of executors that open many files as they start.
+
+Usage: python -m dmoj.cptbox.chroot_benchmark [-n RUNS] [EXECUTOR ...]
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+from contextlib import contextmanager
+
+from dmoj.cptbox import chroot
+from dmoj.cptbox._cptbox import AT_FDCWD
+from dmoj.executors import load_executor
+from dmoj.executors.mixins import BASE_FILESYSTEM
+
+
+def _legacy_file_access_check(self, file, debugger, dirfd=AT_FDCWD):
+    dirfd = (dirfd & 0x7FFFFFFF) - (dirfd & 0x80000000)
+    if not file.startswith('/'):
+        dir = (self._getcwd_pid(debugger.pid) if dirfd == AT_FDCWD else
+               self._getfd_pid(debugger.pid, dirfd))
+        file = os.path.join(dir, file)
+    file = '/' + os.path.normpath(file).lstrip('/')
+    if not self.in_jail(file):
+        chroot.log.warning('Denied file open: %s', file)
+        print>> sys.stderr, 'Not allowed to access:', file
+        return False
+    return True
+
+
+@contextmanager
+def legacy_checks():
+    file_access_check = chroot.CHROOTSecurity._file_access_check
+    chroot.CHROOTSecurity._file_access_check = _legacy_file_access_check
+    try:
+        yield
+    finally:
+        chroot.CHROOTSecurity._file_access_check = file_access_check
+
+
+class _Debugger(object):
+    pid = os.getpid()
+
+
+def import_paths():
+    # Every place an import of each loaded module is looked for, as a Python interpreter would stat and open them.
+    paths = []
+    for dir in sys.path:
+        for name in sys.modules.keys():
+            base = os.path.join(dir or '.', *name.split('.'))
+            paths += [base, base + '.so', base + 'module.so', base + '.py', base + '.pyc', base + '/__init__.py']
+    return paths
+
+
+def measure_checks(filesystem, paths, runs):
+    first, again = [], []
+    for _ in xrange(runs):
+        # A fresh instance each run, as each process gets, so the cache starts out empty.
+        sec = chroot.CHROOTSecurity(filesystem)
+        for times in first, again:
+            start = time.time()
+            for path in paths:
+                sec._file_access_check(path, _Debugger)
+            times.append(time.time() - start)
+    first.sort()
+    again.sort()
+    return first[len(first) // 2] / len(paths), again[len(again) // 2] / len(paths)
+
+
+def measure_self_test(executor, runs):
+    times = []
+    for _ in xrange(runs):
+        start = time.time()
+        if not executor.run_self_test(output=False):
+            return None
+        times.append(time.time() - start)
+    times.sort()
+    return times[len(times) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measures sandbox file access checks with and without caching.')
+    parser.add_argument('executors', nargs='*', default=['PY2', 'JAVA8', 'MONOCS'],
+                        help='executors to time the self-tests of')
+    parser.add_argument('-n', '--runs', type=int, default=20, help='times to repeat each measurement')
+    parser.add_argument('-p', '--paths', type=int, default=1000, help='distinct paths each process checks')
+    args = parser.parse_args()
+
+    # Allow Python's own directories as an executor would. A denial kills the process, so the rest are allowed too.
+    filesystem = BASE_FILESYSTEM + [re.escape(os.path.abspath(dir)) + '/' for dir in sys.path]
+    paths = import_paths()
+    paths = paths[::max(len(paths) // args.paths, 1)][:args.paths]
+    # Denials are reported on stderr, if there are any.
+    stderr, sys.stderr = sys.stderr, open(os.devnull, 'w')
+    try:
+        with legacy_checks():
+            legacy_first, legacy_again = measure_checks(filesystem, paths, args.runs)
+        first, again = measure_checks(filesystem, paths, args.runs)
+    finally:
+        sys.stderr = stderr
+    sec = chroot.CHROOTSecurity(filesystem)
+    print '%d paths, %d of them relative, %d denied' % (
+        len(paths), sum(not path.startswith('/') for path in paths),
+        sum(not sec.in_jail(sec.get_full_path(_Debugger, path)) for path in paths))
+    print '%-12s %14s %14s' % ('per check', 'uncached', 'cached')
+    print '%-12s %11.2f us %11.2f us' % ('first', legacy_first * 1e6, first * 1e6)
+    print '%-12s %11.2f us %11.2f us' % ('again', legacy_again * 1e6, again * 1e6)
+    print
+
+    print '%-12s %14s %14s' % ('self-test', 'uncached', 'cached')
+    for name in args.executors:
+        module = load_executor(name)
+        if module is None or not hasattr(module, 'Executor'):
+            print '%-12s %s' % (name, 'not available')
+            continue
+        cls = module.Executor
+        runtime, success, message = cls.autoconfig()[:3]
+        if not success:
+            print '%-12s %s' % (name, message or 'not available')
+            continue
+        executor = type('Executor', (cls,), {'runtime_dict': runtime})
+        executor.__module__ = cls.__module__
+
+        with legacy_checks():
+            legacy = measure_self_test(executor, args.runs)
+        current = measure_self_test(executor, args.runs)
+        if legacy is None or current is None:
+            print '%-12s %s' % (name, 'self-test failed')
+            continue
+        print '%-12s %11.2f ms %11.2f ms' % (name, legacy * 1000, current * 1000)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,21 @@
 #include <sys/ptrace.h>
+#include <sys/prctl.h>
+#include <linux/audit.h>
+#include <linux/filter.h>
+#include <linux/seccomp.h>
+
+#include <vector>
+
+#ifndef PTRACE_SEIZE
+#   define PTRACE_SEIZE 0x4206
+#endif
+#ifndef PTRACE_EVENT_SECCOMP
+#   define PTRACE_EVENT_SECCOMP 7
+#endif
+#ifndef PTRACE_O_TRACESECCOMP
+#   define PTRACE_O_TRACESECCOMP (1 << PTRACE_EVENT_SECCOMP)
+#endif
 
 inline long ptrace_traceme() {
     return ptrace(PTRACE_TRACEME, 0, NULL, NULL);
-}
\ No newline at end of file
+}
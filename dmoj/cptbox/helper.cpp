@@ -34,7 +34,7 @@ inline void setrlimit2(int resource, rlim_t limit) {
     setrlimit2(resource, limit, limit);
 }
 
-int cptbox_child_run(const struct child_config *config) {
+void cptbox_child_setup(const struct child_config *config) {
     if (config->address_space)
         setrlimit2(RLIMIT_AS, config->address_space);
 
@@ -61,13 +61,26 @@ int cptbox_child_run(const struct child_config *config) {
         dup2(config->fds[i-3], i);
 
     cptbox_closefrom(config->max_fd + 1);
+}
 
-    ptrace_traceme();
-    kill(getpid(), SIGSTOP);
+int cptbox_child_exec(const struct child_config *config) {
+#if !PTBOX_FREEBSD
+    // The parent stops tracing allowed syscalls once we exec, so we must never exec without the filter.
+    if (config->seccomp && (prctl(PR_SET_NO_NEW_PRIVS, 1, 0, 0, 0) ||
+                            prctl(PR_SET_SECCOMP, SECCOMP_MODE_FILTER, config->seccomp, 0, 0)))
+        return 3307;
+#endif
     execve(config->file, config->argv, config->envp);
     return 3306;
 }
 
+int cptbox_child_run(const struct child_config *config) {
+    cptbox_child_setup(config);
+    ptrace_traceme();
+    kill(getpid(), SIGSTOP);
+    return cptbox_child_exec(config);
+}
+
 // From python's _posixsubprocess
 static int pos_int_from_ascii(char *name) {
     int num = 0;
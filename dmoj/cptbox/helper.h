@@ -2,6 +2,8 @@
 #ifndef idABBEC9C1_3EF3_4A45_B187B10060CB9F85
 #define idABBEC9C1_3EF3_4A45_B187B10060CB9F85
 
+#include <sys/types.h>
+
 struct child_config {
     unsigned long memory;
     unsigned long address_space;
@@ -16,11 +18,21 @@ struct child_config {
     int stderr;
     int max_fd;
     int *fds;
+    void *seccomp; // struct sock_fprog * to install before execve, or NULL
 };
 
 void cptbox_closefrom(int lowfd);
+void cptbox_child_setup(const struct child_config *config);
+int cptbox_child_exec(const struct child_config *config);
 int cptbox_child_run(const struct child_config *config);
 
+// The zygote: a small helper process forked off early, which forks sandboxed children on request, so that the
+// judge never has to fork itself. Children come back stopped and untraced; the caller must attach to them.
+int cptbox_zygote_start();
+void cptbox_zygote_stop();
+pid_t cptbox_zygote_pid();
+pid_t cptbox_zygote_spawn(const struct child_config *config);
+
 char *bsd_get_proc_cwd(pid_t pid);
 char *bsd_get_proc_fdno(pid_t pid, int fdno);
 
@@ -9,6 +9,7 @@
 #include <sys/param.h>
 
 #include <sys/ptrace.h>
+#include <pthread.h>
 
 #include <map>
 
@@ -75,35 +76,52 @@ typedef int (*pt_event_callback)(void *context, int event, unsigned long param);
 class pt_process {
 public:
     pt_process(pt_debugger *debugger);
+    ~pt_process();
     void set_callback(pt_handler_callback, void *context);
     void set_event_proc(pt_event_callback, void *context);
     int set_handler(int syscall, int handler);
+    void set_handlers(const int *handlers);
     bool trace_syscalls() { return _trace_syscalls; }
     void trace_syscalls(bool value) { _trace_syscalls = value; }
+    bool use_seccomp() { return _use_seccomp; }
+    void use_seccomp(bool value);
+    void *seccomp_program();
     int spawn(pt_fork_handler child, void *context);
+    int attach(pid_t pid);
     int monitor();
     int getpid() { return pid; }
-    double execution_time() { return exec_time.tv_sec + exec_time.tv_nsec / 1000000000.0; }
+    double execution_time();
     double wall_clock_time();
     const rusage *getrusage() { return &_rusage; }
     bool was_initialized() { return _initialized; }
 protected:
     int dispatch(int event, unsigned long param);
     int protection_fault(int syscall);
+    bool handle_syscall(int syscall, int *exit_reason);
 private:
     pid_t pid;
     int handler[MAX_SYSCALL];
     pt_handler_callback callback;
     void *context;
-    struct timespec exec_time, start_time, end_time;
+    struct timespec exec_time, start_time, end_time, wait_start;
+    // Guards exec_time and wait_start, since execution_time() is read while the monitor runs.
+    pthread_mutex_t time_lock;
+    bool _waiting;
     struct rusage _rusage;
     pt_debugger *debugger;
     pt_event_callback event_proc;
     void *event_context;
     bool _trace_syscalls;
+    bool _use_seccomp;
     bool _initialized;
+#if !PTBOX_FREEBSD
+    std::vector<struct sock_filter> seccomp_filter;
+    struct sock_fprog seccomp_fprog;
+#endif
 };
 
+bool pt_seccomp_supported();
+
 class pt_debugger {
 public:
     pt_debugger();
@@ -131,6 +149,9 @@ public:
     virtual bool is_exit(int syscall) = 0;
     virtual int getpid_syscall() = 0;
     int execve_syscall() { return execve_id; }
+    // The AUDIT_ARCH_* value seccomp reports for this debugger's syscall convention,
+    // or 0 if the seccomp fast path is unsupported for it.
+    virtual unsigned int audit_arch() { return 0; }
 
     void set_process(pt_process *);
     virtual void new_process();
@@ -147,6 +168,8 @@ public:
     void setpid(pid_t pid);
 #else
     void settid(pid_t tid);
+    void settid_entry(pid_t tid);
+    void settid_exit(pid_t tid) { syscall_[tid] = -1; }
     bool is_enter() { return syscall_[tid] != -1; }
 #endif
 
@@ -188,6 +211,7 @@ public:
     virtual void arg5(long);
     virtual bool is_exit(int syscall);
     virtual int getpid_syscall();
+    virtual unsigned int audit_arch();
 };
 
 class pt_debugger_x64 : public pt_debugger {
@@ -212,6 +236,7 @@ public:
     virtual void arg5(long);
     virtual bool is_exit(int syscall);
     virtual int getpid_syscall();
+    virtual unsigned int audit_arch();
 };
 
 class pt_debugger_x86_on_x64 : public pt_debugger_x86 {
@@ -242,6 +267,8 @@ public:
 class pt_debugger_x32 : public pt_debugger_x64 {
 public:
     virtual int syscall();
+    // x32 syscall numbers are masked before indexing the handler table, which a filter can't express safely.
+    virtual unsigned int audit_arch() { return 0; }
 };
 
 class pt_debugger_arm : public pt_debugger {
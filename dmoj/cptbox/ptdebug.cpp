@@ -51,6 +51,12 @@ void pt_debugger::settid(pid_t tid) {
     if (!syscall_.count(tid)) syscall_[tid] = -1;
     syscall_[tid] = syscall_[tid] == -1 ? this->syscall() : -1;
 }
+
+void pt_debugger::settid_entry(pid_t tid) {
+    // Seccomp stops only ever happen on syscall entry, so there is nothing to toggle.
+    this->tid = tid;
+    syscall_[tid] = this->syscall();
+}
 #endif
 
 long pt_debugger::peek_reg(int idx) {
@@ -85,6 +85,14 @@ int pt_debugger_x64::getpid_syscall() {
 #endif
 }
 
+unsigned int pt_debugger_x64::audit_arch() {
+#if PTBOX_FREEBSD
+    return 0;
+#else
+    return AUDIT_ARCH_X86_64;
+#endif
+}
+
 pt_debugger_x64::pt_debugger_x64() {
     execve_id = 59;
 }
@@ -67,6 +67,14 @@ int pt_debugger_x86::getpid_syscall() {
     return 20;
 }
 
+unsigned int pt_debugger_x86::audit_arch() {
+#if PTBOX_FREEBSD
+    return 0;
+#else
+    return AUDIT_ARCH_I386;
+#endif
+}
+
 pt_debugger_x86::pt_debugger_x86() {
     execve_id = 11;
 }
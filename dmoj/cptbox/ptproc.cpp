@@ -11,6 +11,7 @@
 #include <sys/wait.h>
 #include <unistd.h>
 #include <sys/ptrace.h>
+#include <sys/utsname.h>
 
 #include <set>
 
@@ -27,15 +28,36 @@ void pt_free_process(pt_process *process) {
 pt_process::pt_process(pt_debugger *debugger) :
     pid(0), callback(NULL), context(NULL), debugger(debugger),
     event_proc(NULL), event_context(NULL), _trace_syscalls(true),
-    _initialized(false)
+    _use_seccomp(false), _initialized(false), _waiting(false)
 {
     memset(&exec_time, 0, sizeof exec_time);
     memset(&start_time, 0, sizeof exec_time);
     memset(&end_time, 0, sizeof exec_time);
+    memset(&wait_start, 0, sizeof exec_time);
     memset(handler, 0, sizeof handler);
+    pthread_mutex_init(&time_lock, NULL);
     debugger->set_process(this);
 }
 
+pt_process::~pt_process() {
+    pthread_mutex_destroy(&time_lock);
+}
+
+double pt_process::execution_time() {
+    struct timespec now, delta, total;
+
+    pthread_mutex_lock(&time_lock);
+    total = exec_time;
+    if (_waiting) {
+        // The process has been running since we started waiting on it, which we also count.
+        clock_gettime(CLOCK_MONOTONIC, &now);
+        timespec_sub(&now, &wait_start, &delta);
+        timespec_add(&total, &delta, &total);
+    }
+    pthread_mutex_unlock(&time_lock);
+    return total.tv_sec + total.tv_nsec / 1000000000.0;
+}
+
 double pt_process::wall_clock_time() {
     struct timespec now, delta;
 
@@ -67,6 +89,60 @@ int pt_process::set_handler(int syscall, int handler) {
     return 0;
 }
 
+void pt_process::set_handlers(const int *handlers) {
+    memcpy(this->handler, handlers, sizeof this->handler);
+}
+
+bool pt_seccomp_supported() {
+#if PTBOX_FREEBSD
+    return false;
+#else
+    static int supported = -1;
+    if (supported == -1) {
+        // Before Linux 4.8, seccomp stops happen before the syscall-enter-stop, so resuming with PTRACE_SYSCALL
+        // to catch the syscall return would stop on the entry instead.
+        struct utsname name;
+        int major = 0, minor = 0;
+        supported = !uname(&name) && sscanf(name.release, "%d.%d", &major, &minor) == 2 &&
+                    (major > 4 || (major == 4 && minor >= 8)) &&
+                    // With a NULL program, this fails with EFAULT if filters are supported, and EINVAL otherwise.
+                    prctl(PR_SET_SECCOMP, SECCOMP_MODE_FILTER, NULL, 0, 0) == -1 && errno == EFAULT;
+    }
+    return supported;
+#endif
+}
+
+void pt_process::use_seccomp(bool value) {
+    _use_seccomp = value && debugger->audit_arch() && pt_seccomp_supported();
+}
+
+void *pt_process::seccomp_program() {
+#if PTBOX_FREEBSD
+    return NULL;
+#else
+    // Syscalls whose handler is ALLOW never leave the kernel; everything else, including calls made with a
+    // foreign syscall convention, is handed to us as a PTRACE_EVENT_SECCOMP stop.
+    seccomp_filter.clear();
+    seccomp_filter.push_back((struct sock_filter) BPF_STMT(BPF_LD | BPF_W | BPF_ABS,
+                                                           offsetof(struct seccomp_data, arch)));
+    seccomp_filter.push_back((struct sock_filter) BPF_JUMP(BPF_JMP | BPF_JEQ | BPF_K, debugger->audit_arch(), 1, 0));
+    seccomp_filter.push_back((struct sock_filter) BPF_STMT(BPF_RET | BPF_K, SECCOMP_RET_TRACE));
+    seccomp_filter.push_back((struct sock_filter) BPF_STMT(BPF_LD | BPF_W | BPF_ABS,
+                                                           offsetof(struct seccomp_data, nr)));
+    for (int syscall = 0; syscall < MAX_SYSCALL; ++syscall) {
+        if (handler[syscall] != PTBOX_HANDLER_ALLOW)
+            continue;
+        seccomp_filter.push_back((struct sock_filter) BPF_JUMP(BPF_JMP | BPF_JEQ | BPF_K, syscall, 0, 1));
+        seccomp_filter.push_back((struct sock_filter) BPF_STMT(BPF_RET | BPF_K, SECCOMP_RET_ALLOW));
+    }
+    seccomp_filter.push_back((struct sock_filter) BPF_STMT(BPF_RET | BPF_K, SECCOMP_RET_TRACE));
+
+    seccomp_fprog.len = seccomp_filter.size();
+    seccomp_fprog.filter = &seccomp_filter[0];
+    return &seccomp_fprog;
+#endif
+}
+
 int pt_process::dispatch(int event, unsigned long param) {
     if (event_proc != NULL)
         return event_proc(event_context, event, param);
@@ -86,6 +162,22 @@ int pt_process::spawn(pt_fork_handler child, void *context) {
     return 0;
 }
 
+// Takes over a child spawned elsewhere, which must be stopped or about to stop itself before it execs.
+int pt_process::attach(pid_t pid) {
+#if PTBOX_FREEBSD
+    return 1;
+#else
+    // Unlike PTRACE_ATTACH, this doesn't send the child another SIGSTOP that it would see after we resume it.
+    if (ptrace(PTRACE_SEIZE, pid, NULL, NULL)) {
+        kill(pid, SIGKILL);
+        return 1;
+    }
+    this->pid = pid;
+    debugger->new_process();
+    return 0;
+#endif
+}
+
 int pt_process::protection_fault(int syscall) {
     dispatch(PTBOX_EVENT_PROTECTION, syscall);
     dispatch(PTBOX_EVENT_EXITING, PTBOX_EXIT_PROTECTION);
@@ -103,8 +195,38 @@ int pt_process::protection_fault(int syscall) {
     return PTBOX_EXIT_PROTECTION;
 }
 
+// Returns false if the process was killed, in which case it must not be resumed.
+bool pt_process::handle_syscall(int syscall, int *exit_reason) {
+    if (syscall >= MAX_SYSCALL)
+        return true;
+
+    switch (handler[syscall]) {
+        case PTBOX_HANDLER_ALLOW:
+            return true;
+        case PTBOX_HANDLER_STDOUTERR: {
+            int arg0 = debugger->arg0();
+            if (arg0 != 1 && arg0 != 2)
+                *exit_reason = protection_fault(syscall);
+            return true;
+        }
+        case PTBOX_HANDLER_CALLBACK:
+            if (callback(context, syscall))
+                return true;
+            //printf("Killed by callback: %d\n", syscall);
+            *exit_reason = protection_fault(syscall);
+            return false;
+        default:
+            // Default is to kill, safety first.
+            //printf("Killed by DISALLOW or None: %d\n", syscall);
+            *exit_reason = protection_fault(syscall);
+            return false;
+    }
+}
+
 int pt_process::monitor() {
     bool in_syscall = false, first = true, spawned = false;
+    // With seccomp, only syscalls the filter didn't allow stop the process once it's spawned.
+    bool seccomp = _trace_syscalls && _use_seccomp;
     struct timespec start, end, delta;
     int status, exit_reason = PTBOX_EXIT_NORMAL;
     // Set pgid to -this->pid such that -pgid becomes pid, resulting
@@ -118,7 +240,11 @@ int pt_process::monitor() {
 #endif
 
     while (true) {
+        pthread_mutex_lock(&time_lock);
         clock_gettime(CLOCK_MONOTONIC, &start);
+        wait_start = start;
+        _waiting = true;
+        pthread_mutex_unlock(&time_lock);
 
 #ifdef WSL
         // WSL currently doesn't support waiting on process groups.
@@ -129,10 +255,14 @@ int pt_process::monitor() {
         pid = wait4(-pgid, &status, __WALL, &_rusage);
 #endif
 
+        pthread_mutex_lock(&time_lock);
         clock_gettime(CLOCK_MONOTONIC, &end);
         timespec_sub(&end, &start, &delta);
         timespec_add(&exec_time, &delta, &exec_time);
+        _waiting = false;
+        pthread_mutex_unlock(&time_lock);
         int signal = 0;
+        bool seccomp_stop = false;
 
         //printf("pid: %d (%d)\n", pid, this->pid);
 
@@ -176,7 +306,7 @@ int pt_process::monitor() {
                                                  PTRACE_O_EXITKILL |
 #endif
                                                  PTRACE_O_TRACECLONE | PTRACE_O_TRACEFORK |
-                                                 PTRACE_O_TRACEVFORK);
+                                                 PTRACE_O_TRACEVFORK | (seccomp ? PTRACE_O_TRACESECCOMP : 0));
 #endif
             // We now set the process group to the actual pgid.
             pgid = pid;
@@ -219,29 +349,8 @@ int pt_process::monitor() {
                     if (!in_syscall && syscall == debugger->execve_syscall())
                         spawned = this->_initialized = true;
                 } else if (in_syscall) {
-                    if (syscall < MAX_SYSCALL) {
-                        switch (handler[syscall]) {
-                            case PTBOX_HANDLER_ALLOW:
-                                break;
-                            case PTBOX_HANDLER_STDOUTERR: {
-                                int arg0 = debugger->arg0();
-                                if (arg0 != 1 && arg0 != 2)
-                                    exit_reason = protection_fault(syscall);
-                                break;
-                            }
-                            case PTBOX_HANDLER_CALLBACK:
-                                if (callback(context, syscall))
-                                    break;
-                                //printf("Killed by callback: %d\n", syscall);
-                                exit_reason = protection_fault(syscall);
-                                continue;
-                            default:
-                                // Default is to kill, safety first.
-                                //printf("Killed by DISALLOW or None: %d\n", syscall);
-                                exit_reason = protection_fault(syscall);
-                                continue;
-                        }
-                    }
+                    if (!handle_syscall(syscall, &exit_reason))
+                        continue;
                 } else if (debugger->on_return_callback) {
                     debugger->on_return_callback(debugger->on_return_context, syscall);
                     debugger->on_return_callback = NULL;
@@ -280,6 +389,19 @@ int pt_process::monitor() {
                                 //printf("Created process: %d\n", npid);
                                 break;
                             }
+                            case PTRACE_EVENT_SECCOMP:
+                                seccomp_stop = true;
+                                // Before the spawn, every syscall is traced anyways.
+                                if (!spawned)
+                                    break;
+
+                                debugger->settid_entry(pid);
+                                if (!handle_syscall(debugger->syscall(), &exit_reason))
+                                    continue;
+                                // Unless we need to see the return, the syscall is done as far as we are concerned.
+                                if (!debugger->on_return_callback)
+                                    debugger->settid_exit(pid);
+                                break;
                         }
                         break;
                     default:
@@ -289,7 +411,7 @@ int pt_process::monitor() {
 
                 //printf("%d: WSTOPSIG(status): %d\n", pid, signal);
                 // Only main process signals are meaningful.
-                if (!first && pid == pgid) // *** Don't set _signal to SIGSTOP if this is the /first/ SIGSTOP
+                if (!first && !seccomp_stop && pid == pgid) // *** Don't set _signal to SIGSTOP if this is the /first/ SIGSTOP
                     dispatch(PTBOX_EVENT_SIGNAL, WSTOPSIG(status));
             }
         }
@@ -299,7 +421,10 @@ int pt_process::monitor() {
 #if PTBOX_FREEBSD
         ptrace(_trace_syscalls ? PT_SYSCALL : PT_CONTINUE, pid, (caddr_t) 1, first ? 0 : signal);
 #else
-        ptrace(_trace_syscalls ? PTRACE_SYSCALL : PTRACE_CONT, pid, NULL, first ? NULL : (void*) signal);
+        // When filtering with seccomp, we only need syscall stops to catch the execve, and the return of
+        // syscalls whose handler asked for it.
+        ptrace(_trace_syscalls && (!seccomp || !spawned || debugger->on_return_callback) ? PTRACE_SYSCALL : PTRACE_CONT,
+               pid, NULL, first ? NULL : (void*) signal);
 #endif
         first = false;
     }
@@ -5,13 +5,17 @@ import pty
 import re
 import select
 import signal
+import struct
 import subprocess
 import sys
 import threading
-import time
+from array import array
+from collections import OrderedDict
 
 from dmoj.cptbox._cptbox import *
+from dmoj.cptbox.cgroup import get_cgroup_root
 from dmoj.cptbox.handlers import DISALLOW, _CALLBACK
+from dmoj.cptbox.shocker import get_shocker
 from dmoj.cptbox.syscalls import translator, SYSCALL_COUNT, by_id
 from dmoj.error import InternalError
 from dmoj.utils.communicate import safe_communicate as _safe_communicate
@@ -45,7 +49,16 @@ X32 = 'x32'
 ARM = 'arm'
 
 
-def file_arch(path):
+ELFCLASS32 = 1
+ELFCLASS64 = 2
+ELFDATA2MSB = 2
+EM_ARM = 40
+EM_X86_64 = 62
+
+_SHEBANG_DEPTH = 4
+
+
+def _file_info_arch(path):
     info = file_info(path)
 
     if '32-bit' in info:
@@ -57,6 +70,66 @@ def file_arch(path):
     return None
 
 
+def _native_arch(path, depth=0):
+    # Returns the architecture of an ELF file or a script's interpreter, False if we can't tell, or None if the
+    # file is not executable on any architecture we know of.
+    with open(path, 'rb') as f:
+        header = f.read(128)
+
+    if header[:4] == '\x7fELF' and len(header) >= 20:
+        elf_class, elf_data = ord(header[4]), ord(header[5])
+        machine, = struct.unpack('>H' if elf_data == ELFDATA2MSB else '<H', header[18:20])
+
+        # Mirror what file(1) would have told us.
+        if elf_class == ELFCLASS32:
+            if machine == EM_ARM:
+                return ARM
+            return X32 if machine == EM_X86_64 else X86
+        elif elf_class == ELFCLASS64:
+            return X64
+        return None
+
+    if header[:2] == '#!' and depth < _SHEBANG_DEPTH:
+        # The kernel would run the interpreter instead, which is what we end up tracing.
+        interpreter = header[2:].split('\n', 1)[0].strip().split()
+        if interpreter and os.path.isabs(interpreter[0]):
+            return _native_arch(interpreter[0], depth + 1)
+
+    return False
+
+
+# Architectures of files, by identity, bounded as every compiled submission is a new file.
+_arch_cache = OrderedDict()
+_arch_cache_lock = threading.Lock()
+# Unknown formats are cached as None, so a miss needs telling apart.
+_arch_cache_miss = object()
+
+
+def file_arch(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+
+    # Keying on the inode and mtime means a replaced or rebuilt binary is looked at again.
+    key = path, stat.st_ino, stat.st_mtime
+    with _arch_cache_lock:
+        arch = _arch_cache.pop(key, _arch_cache_miss)
+    if arch is _arch_cache_miss:
+        try:
+            arch = _native_arch(path)
+        except (IOError, OSError):
+            arch = False
+        if arch is False:
+            arch = _file_info_arch(path)
+
+    with _arch_cache_lock:
+        _arch_cache[key] = arch
+        while len(_arch_cache) > 1024:
+            _arch_cache.popitem(last=False)
+    return arch
+
+
 PYTHON_ARCH = file_arch(sys.executable)
 
 _PIPE_BUF = getattr(select, 'PIPE_BUF', 512)
@@ -82,6 +155,77 @@ def _eintr_retry_call(func, *args):
             raise
 
 
+class SecurityProfile(object):
+    """
+    The handler of every syscall under a security dict, translated for each debugger once, into a table that
+    SecurePopen applies in a single call. Callbacks are recorded only by syscall, since they belong to the security
+    dict of each launch: a profile serves every security dict of the same shape, i.e. with the same handler or a
+    callback for each syscall.
+    """
+    __slots__ = ('shape', '_tables')
+
+    def __init__(self, shape):
+        self.shape = shape
+        self._tables = {}
+
+    def get_handlers(self, index):
+        """
+        Returns the handler table for the debugger with the given syscall index, as MAX_SYSCALL_NUMBER native ints,
+        and a tuple of (syscall number, syscall id) for each callback.
+        """
+        table = self._tables.get(index)
+        if table is None:
+            handlers = array('i', [DISALLOW]) * MAX_SYSCALL_NUMBER
+            callbacks = {}
+            shape = dict(self.shape)
+            for id in xrange(SYSCALL_COUNT):
+                call = translator[id][index]
+                if call is None:
+                    continue
+                handlers[call] = handler = shape.get(id, DISALLOW)
+                if handler == _CALLBACK:
+                    callbacks[call] = id
+                else:
+                    callbacks.pop(call, None)
+            table = self._tables[index] = handlers.tostring(), tuple(callbacks.iteritems())
+        return table
+
+
+_security_profiles = {}
+
+
+def get_security_profile(security):
+    shape = []
+    for id, handler in security.iteritems():
+        if not isinstance(handler, int):
+            if not callable(handler):
+                raise ValueError('Handler not callable: %r' % (handler,))
+            handler = _CALLBACK
+        shape.append((id, handler))
+    shape = frozenset(shape)
+
+    profile = _security_profiles.get(shape)
+    if profile is None:
+        profile = _security_profiles.setdefault(shape, SecurityProfile(shape))
+    return profile
+
+
+_zygote_failed = False
+
+
+def _start_zygote():
+    global _zygote_failed
+    if _zygote_failed:
+        return False
+    try:
+        start_zygote()
+    except OSError as e:
+        log.warning('Failed to start sandbox zygote, processes will be forked from the judge: %s', e)
+        _zygote_failed = True
+        return False
+    return True
+
+
 # (python arch, executable arch) -> debugger
 _arch_map = {
     (X86, X86): DEBUGGER_X86,
@@ -129,7 +273,7 @@ class SecurePopen(Process):
 
     def __init__(self, debugger, _, args, executable=None, security=None, time=0, memory=0, stdin=PIPE, stdout=PIPE,
                  stderr=None, env=None, nproc=0, address_grace=4096, cwd='', fds=None, unbuffered=False,
-                 wall_time=None):
+                 wall_time=None, seccomp=True, zygote=True, cgroup=None, deferred=False):
         self._debugger_type = debugger
         self._syscall_index = index = _SYSCALL_INDICIES[debugger]
         self._executable = executable or _find_exe(args[0])
@@ -143,8 +287,20 @@ class SecurePopen(Process):
         self._child_memory = memory * 1024
         self._child_address = self._child_memory + address_grace * 1024 if memory else 0
         self._nproc = nproc
+        self._cgroup = self.__create_cgroup(cgroup, memory)
+        self._cgroup_usage = None
+        if self._cgroup is not None:
+            # The cgroup limits the memory the process actually uses, so it needs no rlimits and no address space
+            # grace to allow for what it maps but doesn't use.
+            self._child_memory = self._child_address = 0
+            self._proc_memory = False
         self._tle = False
+        self.timeout_overshoot = None
+        # Times from before begin is called, which a deferred process isn't accounted for.
+        self._deferred = deferred
+        self._time_offset = self._wall_time_offset = 0
         self._fds = fds
+        self._zygote = zygote and _start_zygote()
         self.__init_streams(stdin, stdout, stderr, unbuffered)
         self.protection_fault = None
 
@@ -156,24 +312,15 @@ class SecurePopen(Process):
         if security is None:
             self._trace_syscalls = False
         else:
-            for i in xrange(SYSCALL_COUNT):
-                handler = security.get(i, DISALLOW)
-                call = translator[i][index]
-                if call is None:
-                    continue
-                if not isinstance(handler, int):
-                    if not callable(handler):
-                        raise ValueError('Handler not callable: ' + handler)
-                    self._callbacks[call] = handler
-                    handler = _CALLBACK
-                self._handler(call, handler)
+            handlers, callbacks = get_security_profile(security).get_handlers(index)
+            self._set_handlers(handlers)
+            for call, id in callbacks:
+                self._callbacks[call] = security[id]
+            # Let the kernel run allowed syscalls without stopping, where it's able to.
+            self._use_seccomp = seccomp
 
         self._started = threading.Event()
         self._died = threading.Event()
-        if time:
-            # Spawn thread to kill process after it times out
-            self._shocker = threading.Thread(target=self._shocker_thread)
-            self._shocker.start()
         self._worker = threading.Thread(target=self._run_process)
         self._worker.start()
 
@@ -184,18 +331,68 @@ class SecurePopen(Process):
     def poll(self):
         return self.returncode
 
+    def __create_cgroup(self, path, memory):
+        if not path:
+            return None
+        root = get_cgroup_root(path)
+        if root is None:
+            return None
+        try:
+            return root.create(memory * 1024)
+        except (IOError, OSError) as e:
+            log.warning('Failed to create cgroup, falling back to rlimits: %s', e)
+            return None
+
     @property
     def mle(self):
+        if self._cgroup_usage is not None and self._cgroup_usage[2]:
+            return True
         return self._memory and self.max_memory > self._memory
 
+    @property
+    def max_memory(self):
+        if self._cgroup_usage is not None:
+            return self._cgroup_usage[0]
+        if self._cgroup is not None and not self._exited:
+            try:
+                return self._cgroup.peak_memory()
+            except (IOError, OSError):
+                pass
+        return super(SecurePopen, self).max_memory
+
+    @property
+    def cpu_time(self):
+        if self._cgroup_usage is not None:
+            return self._cgroup_usage[1]
+        return super(SecurePopen, self).cpu_time
+
     @property
     def tle(self):
         return self._tle
 
+    @property
+    def execution_time(self):
+        return super(SecurePopen, self).execution_time - self._time_offset
+
+    @property
+    def wall_clock_time(self):
+        return super(SecurePopen, self).wall_clock_time - self._wall_time_offset
+
     @property
     def r_execution_time(self):
         return self.wall_clock_time
 
+    def begin(self):
+        """
+        Starts accounting for and limiting the time of a process spawned with deferred set, which until now has only
+        been made ready to run, such as a runtime that has started up and waits to be told what to run.
+        """
+        self._started.wait()
+        self._time_offset = super(SecurePopen, self).execution_time
+        self._wall_time_offset = super(SecurePopen, self).wall_clock_time
+        if self._time:
+            get_shocker().watch(self)
+
     def kill(self):
         log.warning('Request the killing of process: %s', self.pid)
         print>> sys.stderr, 'Child is requested to be killed'
@@ -239,7 +436,20 @@ class SecurePopen(Process):
         self._tle = True
 
     def _run_process(self):
-        self._spawn(self._executable, self._args, self._env, self._chdir, self._fds)
+        try:
+            self._spawn(self._executable, self._args, self._env, self._chdir, self._fds, self._zygote)
+        except Exception:
+            if self._cgroup is not None:
+                self._cgroup.destroy()
+            raise
+
+        if self._cgroup is not None:
+            # The child stops before it execs until we start monitoring it, so it can't yet have escaped its limits.
+            try:
+                self._cgroup.add(self.pid)
+            except (IOError, OSError):
+                log.exception('Failed to move process %d into its cgroup, killing it', self.pid)
+                os.kill(self.pid, signal.SIGKILL)
 
         if self._child_stdin >= 0:
             os.close(self._child_stdin)
@@ -248,38 +458,43 @@ class SecurePopen(Process):
         if self._child_stderr >= 0:
             os.close(self._child_stderr)
         self._started.set()
+        if self._time and not self._deferred:
+            get_shocker().watch(self)
         code = self._monitor()
 
+        if self._cgroup is not None:
+            try:
+                self._cgroup_usage = self._cgroup.usage()
+            except (IOError, OSError, KeyError, ValueError):
+                log.exception('Failed to read the usage of cgroup: %s', self._cgroup.path)
+            self._cgroup.destroy()
+
         if self._time and self.execution_time > self._time:
             self._tle = True
+        if self._tle:
+            self.timeout_overshoot = max(self.execution_time - self._time, self.wall_clock_time - self._wall_time, 0)
+            log.info('Process %d was killed %.3fs past its time limit', self.pid, self.timeout_overshoot)
         self._died.set()
 
         return code
 
-    def _shocker_thread(self):
-        # On Linux, ignored signals still cause a notification under ptrace.
-        # Hence, we use SIGWINCH, harmless and ignored signal to make wait4 return
-        # pt_process::monitor, causing time to be updated.
-        # On FreeBSD, a signal must not be ignored in order for wait4 to return.
-        # Hence, we swallow SIGSTOP, which should never be used anyway, and use it
-        # force an update.
-        wake_signal = signal.SIGSTOP if 'freebsd' in sys.platform else signal.SIGWINCH
-        self._started.wait()
+    def _check_timeout(self):
+        # Called by the shocker when the process could have run out of time.
+        if self._exited:
+            return None
 
-        while not self._exited:
-            if self.execution_time > self._time or self.wall_clock_time > self._wall_time:
-                print>> sys.stderr, 'Shocker activated, ouch!'
-                log.warning('Shocker activated and killed %d', self.pid)
-                os.killpg(self.pid, signal.SIGKILL)
-                self._tle = True
-                break
-            time.sleep(1)
-            try:
-                os.killpg(self.pid, wake_signal)
-            except OSError:
-                pass
-            else:
-                time.sleep(0.01)
+        remaining = min(self._time - self.execution_time, self._wall_time - self.wall_clock_time)
+        if remaining > 0:
+            return remaining
+
+        print>> sys.stderr, 'Shocker activated, ouch!'
+        log.warning('Shocker activated and killed %d', self.pid)
+        self._tle = True
+        try:
+            os.killpg(self.pid, signal.SIGKILL)
+        except OSError:
+            pass
+        return None
 
     def __init_streams(self, stdin, stdout, stderr, unbuffered):
         self.stdin = self.stdout = self.stderr = None
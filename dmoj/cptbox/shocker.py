@@ -0,0 +1,86 @@
+import errno
+import heapq
+import logging
+import os
+import select
+import threading
+import time
+
+log = logging.getLogger('dmoj.cptbox')
+
+
+class Shocker(object):
+    """
+    A single thread that enforces the time limits of every live sandboxed process.
+
+    Processes are kept in a heap ordered by the earliest moment they could possibly exceed a limit. When that
+    moment comes, the process is asked for its current times, and either killed or rescheduled for when it could
+    next run out of time. Since execution time never grows faster than wall time, a process is never checked
+    later than its deadline. The thread sleeps in select() on a pipe, which is written to when a process with an
+    earlier deadline is added.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._lock = threading.Lock()
+        self._read, self._write = os.pipe()
+        self._thread = None
+
+    def watch(self, process):
+        """
+        Starts enforcing the limits of process, which must implement _check_timeout.
+        """
+        self._schedule(time.time(), process)
+
+    def _schedule(self, deadline, process):
+        with self._lock:
+            wake = not self._heap or deadline < self._heap[0][0]
+            heapq.heappush(self._heap, (deadline, id(process), process))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='shocker')
+                self._thread.daemon = True
+                self._thread.start()
+        if wake:
+            os.write(self._write, '\0')
+
+    def _run(self):
+        while True:
+            with self._lock:
+                timeout = max(self._heap[0][0] - time.time(), 0) if self._heap else None
+
+            try:
+                ready, _, _ = select.select([self._read], [], [], timeout)
+            except select.error as e:
+                if e.args[0] != errno.EINTR:
+                    raise
+                continue
+            if ready:
+                os.read(self._read, 4096)
+
+            now = time.time()
+            due = []
+            with self._lock:
+                while self._heap and self._heap[0][0] <= now:
+                    due.append(heapq.heappop(self._heap)[2])
+
+            for process in due:
+                try:
+                    remaining = process._check_timeout()
+                except Exception:
+                    log.exception('Failed to check process for timeout')
+                    continue
+                if remaining is not None:
+                    self._schedule(now + remaining, process)
+
+
+_shocker = None
+_shocker_lock = threading.Lock()
+
+
+def get_shocker():
+    global _shocker
+    if _shocker is None:
+        with _shocker_lock:
+            if _shocker is None:
+                _shocker = Shocker()
+    return _shocker
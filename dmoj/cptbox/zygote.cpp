@@ -0,0 +1,380 @@
+#include "ptbox.h"
+#include "helper.h"
+
+#include <errno.h>
+#include <fcntl.h>
+#include <limits.h>
+#include <signal.h>
+#include <stdlib.h>
+#include <string.h>
+#include <unistd.h>
+#include <sys/socket.h>
+#include <sys/types.h>
+#include <sys/wait.h>
+
+#if PTBOX_FREEBSD
+
+int cptbox_zygote_start() {
+    errno = ENOSYS;
+    return -1;
+}
+
+void cptbox_zygote_stop() {}
+
+pid_t cptbox_zygote_pid() {
+    return 0;
+}
+
+pid_t cptbox_zygote_spawn(const struct child_config *config) {
+    return -1;
+}
+
+#else
+
+// Requests larger than this are too big for the socket anyways, and are spawned by forking the judge instead.
+#define ZYGOTE_MAX_REQUEST 196608
+#define ZYGOTE_MAX_FDS 64
+#define ZYGOTE_MAX_STRINGS 16384
+
+// The zygote is forked off a threaded process, so it must not touch the heap: another thread could have been
+// holding the allocator's lock at the time. Everything it receives is parsed in place in these buffers.
+struct zygote_request {
+    unsigned long memory;
+    unsigned long address_space;
+    unsigned int cpu_time;
+    int nproc;
+    int stdin;
+    int stdout;
+    int stderr;
+    int nfds;
+    int argc;
+    int envc;
+    unsigned int filter_len;
+    unsigned int data_len;
+    // Followed by file, dir, argv and envp as NUL-terminated strings, then filter_len BPF instructions.
+};
+
+static char zygote_buffer[ZYGOTE_MAX_REQUEST];
+static char *zygote_strings[ZYGOTE_MAX_STRINGS];
+static struct sock_filter zygote_filter[BPF_MAXINSNS];
+
+static pthread_mutex_t zygote_lock = PTHREAD_MUTEX_INITIALIZER;
+static int zygote_sock = -1;
+static pid_t zygote_process = 0;
+// The process that started the zygote, since a fork of the judge can't share it.
+static pid_t zygote_owner = 0;
+
+static bool cptbox_traced() {
+    char status[4096];
+    int fd = open("/proc/self/status", O_RDONLY);
+    if (fd < 0)
+        return false;
+    ssize_t bytes = read(fd, status, sizeof status - 1);
+    close(fd);
+    if (bytes <= 0)
+        return false;
+    status[bytes] = '\0';
+
+    char *tracer = strstr(status, "TracerPid:");
+    if (!tracer)
+        return false;
+    for (tracer += 10; *tracer == ' ' || *tracer == '\t'; ++tracer);
+    return *tracer >= '1' && *tracer <= '9';
+}
+
+static int zygote_child(struct child_config *config, int *fds, int nfds) {
+    setpgid(0, 0);
+    // The zygote only goes away with the judge, and so should anything still waiting on it to attach.
+    prctl(PR_SET_PDEATHSIG, SIGKILL);
+
+    // The received descriptors could have any number, including those they are about to be duplicated onto.
+    for (int i = 0; i < nfds; ++i)
+        fds[i] = fcntl(fds[i], F_DUPFD, config->max_fd + 1);
+
+    int next = 0;
+    if (config->stdin >= 0)  config->stdin = fds[next++];
+    if (config->stdout >= 0) config->stdout = fds[next++];
+    if (config->stderr >= 0) config->stderr = fds[next++];
+    config->fds = fds + next;
+
+    cptbox_child_setup(config);
+
+    // Wait for the judge to attach. It must see this stop at least once to set up tracing, so stop even if it
+    // attached already, and keep stopping if something else resumed us first.
+    do {
+        kill(getpid(), SIGSTOP);
+    } while (!cptbox_traced());
+    return cptbox_child_exec(config);
+}
+
+static bool zygote_parse(ssize_t size, struct child_config *config, int nfds) {
+    struct zygote_request *request = (struct zygote_request *) zygote_buffer;
+    if (size < (ssize_t) sizeof *request || (size_t) size != sizeof *request + request->data_len)
+        return false;
+    if (request->argc < 0 || request->envc < 0 || request->argc + request->envc + 4 > ZYGOTE_MAX_STRINGS ||
+            request->nfds < 0 || request->filter_len > BPF_MAXINSNS)
+        return false;
+    if (nfds != request->nfds + (request->stdin >= 0) + (request->stdout >= 0) + (request->stderr >= 0))
+        return false;
+
+    size_t filter_size = request->filter_len * sizeof(struct sock_filter);
+    if (filter_size > request->data_len)
+        return false;
+    char *data = zygote_buffer + sizeof *request, *end = data + request->data_len - filter_size;
+    memcpy(zygote_filter, end, filter_size);
+
+    // file, dir, argv, NULL, envp, NULL
+    char **strings = zygote_strings;
+    for (int i = 0; i < 2 + request->argc + request->envc; ++i) {
+        char *nul = data < end ? (char *) memchr(data, '\0', end - data) : NULL;
+        if (!nul)
+            return false;
+        if (i == 2 + request->argc)
+            *strings++ = NULL;
+        *strings++ = data;
+        data = nul + 1;
+    }
+    if (data != end)
+        return false;
+    if (!request->envc)
+        *strings++ = NULL;
+    *strings = NULL;
+
+    config->memory = request->memory;
+    config->address_space = request->address_space;
+    config->cpu_time = request->cpu_time;
+    config->nproc = request->nproc;
+    config->file = zygote_strings[0];
+    config->dir = zygote_strings[1];
+    config->argv = zygote_strings + 2;
+    config->envp = zygote_strings + 3 + request->argc;
+    config->stdin = request->stdin;
+    config->stdout = request->stdout;
+    config->stderr = request->stderr;
+    config->max_fd = 2 + request->nfds;
+    config->fds = NULL;
+
+    static struct sock_fprog program;
+    program.len = request->filter_len;
+    program.filter = zygote_filter;
+    config->seccomp = request->filter_len ? &program : NULL;
+    return true;
+}
+
+static void zygote_sigchld(int signal) {}
+
+static void zygote_serve(int sock) {
+    char control[CMSG_SPACE(sizeof(int) * ZYGOTE_MAX_FDS)];
+    int fds[ZYGOTE_MAX_FDS];
+
+    // Our children are ours to reap once the judge is done tracing them. Their exits interrupt the wait for the
+    // next request, so that they are reaped as they go, without restarting the wait.
+    struct sigaction action;
+    memset(&action, 0, sizeof action);
+    action.sa_handler = zygote_sigchld;
+    sigaction(SIGCHLD, &action, NULL);
+
+    while (true) {
+        while (waitpid(-1, NULL, WNOHANG) > 0);
+
+        struct iovec iov = {zygote_buffer, sizeof zygote_buffer};
+        struct msghdr message;
+        memset(&message, 0, sizeof message);
+        message.msg_iov = &iov;
+        message.msg_iovlen = 1;
+        message.msg_control = control;
+        message.msg_controllen = sizeof control;
+
+        ssize_t size = recvmsg(sock, &message, MSG_CMSG_CLOEXEC);
+        if (size < 0 && errno == EINTR)
+            continue;
+        if (size <= 0)
+            break;
+
+        int nfds = 0;
+        for (struct cmsghdr *cmsg = CMSG_FIRSTHDR(&message); cmsg; cmsg = CMSG_NXTHDR(&message, cmsg)) {
+            if (cmsg->cmsg_level != SOL_SOCKET || cmsg->cmsg_type != SCM_RIGHTS)
+                continue;
+            int count = (cmsg->cmsg_len - CMSG_LEN(0)) / sizeof(int);
+            for (int i = 0; i < count && nfds < ZYGOTE_MAX_FDS; ++i)
+                memcpy(&fds[nfds++], CMSG_DATA(cmsg) + i * sizeof(int), sizeof(int));
+        }
+
+        struct child_config config;
+        pid_t pid;
+        if (message.msg_flags & (MSG_TRUNC | MSG_CTRUNC) || !zygote_parse(size, &config, nfds)) {
+            pid = -EINVAL;
+        } else if ((pid = fork()) == 0) {
+            close(sock);
+            _exit(zygote_child(&config, fds, nfds));
+        } else if (pid < 0) {
+            pid = -errno;
+        }
+
+        for (int i = 0; i < nfds; ++i)
+            close(fds[i]);
+        while (send(sock, &pid, sizeof pid, 0) < 0 && errno == EINTR);
+    }
+    _exit(0);
+}
+
+static void zygote_close() {
+    // Called with zygote_lock held. The zygote exits when it sees the socket close.
+    if (zygote_sock >= 0 && zygote_owner == getpid()) {
+        // Shut it down rather than just closing it, in case a fork of ours still holds it open.
+        shutdown(zygote_sock, SHUT_RDWR);
+        close(zygote_sock);
+        while (waitpid(zygote_process, NULL, 0) < 0 && errno == EINTR);
+    } else if (zygote_sock >= 0) {
+        // Inherited across a fork: the zygote belongs to our parent, which is still using it.
+        close(zygote_sock);
+    }
+    zygote_sock = -1;
+    zygote_process = 0;
+    zygote_owner = 0;
+}
+
+int cptbox_zygote_start() {
+    int result = 0;
+    pthread_mutex_lock(&zygote_lock);
+    if (zygote_owner != getpid()) {
+        zygote_close();
+
+        int socks[2];
+        // Children stop until they see the judge attached in their status, so there is no zygote without /proc.
+        if (access("/proc/self/status", R_OK)) {
+            result = -1;
+        } else if (socketpair(AF_UNIX, SOCK_SEQPACKET | SOCK_CLOEXEC, 0, socks)) {
+            result = -1;
+        } else {
+            pid_t pid = fork();
+            if (pid == 0) {
+                close(socks[0]);
+                zygote_serve(socks[1]);
+            }
+            int error = errno;
+            close(socks[1]);
+            if (pid < 0) {
+                close(socks[0]);
+                errno = error;
+                result = -1;
+            } else {
+                zygote_sock = socks[0];
+                zygote_process = pid;
+                zygote_owner = getpid();
+            }
+        }
+    }
+    pthread_mutex_unlock(&zygote_lock);
+    return result;
+}
+
+void cptbox_zygote_stop() {
+    pthread_mutex_lock(&zygote_lock);
+    zygote_close();
+    pthread_mutex_unlock(&zygote_lock);
+}
+
+pid_t cptbox_zygote_pid() {
+    pthread_mutex_lock(&zygote_lock);
+    pid_t pid = zygote_owner == getpid() ? zygote_process : 0;
+    pthread_mutex_unlock(&zygote_lock);
+    return pid;
+}
+
+// Returns the pid of the new child, stopped and waiting to be attached to, or -1 if the caller must spawn it itself.
+pid_t cptbox_zygote_spawn(const struct child_config *config) {
+    struct zygote_request request;
+    int fds[ZYGOTE_MAX_FDS], nfds = 0;
+    struct sock_fprog *program = (struct sock_fprog *) config->seccomp;
+    const char *dir = config->dir;
+    char cwd[PATH_MAX];
+
+    // The zygote is wherever we were when it started, so send where we are now.
+    if (!dir || !*dir)
+        dir = getcwd(cwd, sizeof cwd);
+    if (!dir || config->max_fd - 2 + 3 > ZYGOTE_MAX_FDS)
+        return -1;
+
+    request.memory = config->memory;
+    request.address_space = config->address_space;
+    request.cpu_time = config->cpu_time;
+    request.nproc = config->nproc;
+    request.stdin = config->stdin;
+    request.stdout = config->stdout;
+    request.stderr = config->stderr;
+    request.nfds = config->max_fd - 2;
+    request.argc = request.envc = 0;
+    request.filter_len = program ? program->len : 0;
+
+    if (config->stdin >= 0)  fds[nfds++] = config->stdin;
+    if (config->stdout >= 0) fds[nfds++] = config->stdout;
+    if (config->stderr >= 0) fds[nfds++] = config->stderr;
+    for (int i = 0; i < request.nfds; ++i)
+        fds[nfds++] = config->fds[i];
+
+    size_t size = strlen(config->file) + strlen(dir) + 2;
+    for (char **arg = config->argv; *arg; ++arg, ++request.argc)
+        size += strlen(*arg) + 1;
+    for (char **var = config->envp; *var; ++var, ++request.envc)
+        size += strlen(*var) + 1;
+    size += request.filter_len * sizeof(struct sock_filter);
+    request.data_len = size;
+    if (sizeof request + size > ZYGOTE_MAX_REQUEST)
+        return -1;
+
+    char *data = (char *) malloc(sizeof request + size), *out = data + sizeof request;
+    if (!data)
+        return -1;
+    memcpy(data, &request, sizeof request);
+    out = stpcpy(out, config->file) + 1;
+    out = stpcpy(out, dir) + 1;
+    for (char **arg = config->argv; *arg; ++arg)
+        out = stpcpy(out, *arg) + 1;
+    for (char **var = config->envp; *var; ++var)
+        out = stpcpy(out, *var) + 1;
+    if (program)
+        memcpy(out, program->filter, request.filter_len * sizeof(struct sock_filter));
+
+    char control[CMSG_SPACE(sizeof(int) * ZYGOTE_MAX_FDS)];
+    struct iovec iov = {data, sizeof request + size};
+    struct msghdr message;
+    memset(&message, 0, sizeof message);
+    message.msg_iov = &iov;
+    message.msg_iovlen = 1;
+    if (nfds) {
+        memset(control, 0, sizeof control);
+        message.msg_control = control;
+        message.msg_controllen = CMSG_SPACE(sizeof(int) * nfds);
+        struct cmsghdr *cmsg = CMSG_FIRSTHDR(&message);
+        cmsg->cmsg_level = SOL_SOCKET;
+        cmsg->cmsg_type = SCM_RIGHTS;
+        cmsg->cmsg_len = CMSG_LEN(sizeof(int) * nfds);
+        memcpy(CMSG_DATA(cmsg), fds, sizeof(int) * nfds);
+    }
+
+    pid_t pid = -1;
+    pthread_mutex_lock(&zygote_lock);
+    if (zygote_sock >= 0 && zygote_owner == getpid()) {
+        ssize_t sent, received = -1;
+        while ((sent = sendmsg(zygote_sock, &message, MSG_NOSIGNAL)) < 0 && errno == EINTR);
+        if (sent >= 0)
+            while ((received = recv(zygote_sock, &pid, sizeof pid, 0)) < 0 && errno == EINTR);
+
+        if (sent < 0 && errno == EMSGSIZE) {
+            // Too big for the socket, but the zygote is fine.
+            pid = -1;
+        } else if (received != sizeof pid) {
+            // The zygote died, so stop using it.
+            zygote_close();
+            pid = -1;
+        } else if (pid < 0) {
+            pid = -1;
+        }
+    }
+    pthread_mutex_unlock(&zygote_lock);
+    free(data);
+    return pid;
+}
+
+#endif
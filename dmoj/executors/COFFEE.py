@@ -30,7 +30,10 @@ process.stdin.on 'readable', () ->
         return [self.get_command(), self.runtime_dict['coffee'], self._code]
 
     def get_fs(self):
-        return super(Executor, self).get_fs() + [self.runtime_dict['coffee'], self._code]
+        return super(Executor, self).get_fs() + [self.runtime_dict['coffee']]
+
+    def get_fs_paths(self):
+        return super(Executor, self).get_fs_paths() + [self._code]
 
     @classmethod
     def get_versionable_commands(cls):
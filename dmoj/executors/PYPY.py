@@ -22,6 +22,9 @@ class Executor(PythonExecutor):
 
     @classmethod
     def get_runtime_versions(cls):
-        # A little hack to report implemented Python version too
-        return tuple(list(super(Executor, cls).get_runtime_versions()) +
-                     [('implementing python', cls._pypy_versions[0])])
+        key = cls.get_executor_name()
+        if key not in version_cache:
+            # A little hack to report implemented Python version too
+            version_cache[key] = tuple(list(super(Executor, cls).get_runtime_versions()) +
+                                       [('implementing python', cls._pypy_versions[0])])
+        return version_cache[key]
@@ -1,6 +1,6 @@
 import subprocess
 
-from dmoj.executors.base_executor import ScriptExecutor
+from dmoj.executors.base_executor import ScriptExecutor, version_cache
 import os
 
 if os.name != 'nt':
@@ -36,9 +36,13 @@ puts $input
         # it can hang the startup process. TCL versions without --version can't be reliably detected either, since
         # they also don't have --help.
         # Here, we just use subprocess to print the TCL version, and use that.
+        key = cls.get_executor_name()
+        if key in version_cache:
+            return version_cache[key]
         process = subprocess.Popen([cls.get_command()], stdout=subprocess.PIPE, stdin=subprocess.PIPE)
         process.stdin.write('puts $tcl_version\n')
         process.stdin.close()
         retcode = process.poll()
-        return ('tclsh', tuple(map(int, process.stdout.read().split('.'))) if not retcode else ()),
+        version_cache[key] = ('tclsh', tuple(map(int, process.stdout.read().split('.'))) if not retcode else ()),
+        return version_cache[key]
 
@@ -12,8 +12,8 @@ get echo : *
 put echo
 '''
 
-    def get_fs(self):
-        return super(Executor, self).get_fs() + [self._code + 'bc']
+    def get_fs_paths(self):
+        return super(Executor, self).get_fs_paths() + [self._code + 'bc']
 
     def get_compile_args(self):
         return [self.get_command(), self._code, env['runtime']['turing_dir']]
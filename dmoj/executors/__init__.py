@@ -1,10 +1,23 @@
+import logging
 import os
 import re
+import sys
+import thread
+import threading
+import time
 import traceback
+from StringIO import StringIO
+from collections import MutableMapping
 from importlib import import_module
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
 
+from dmoj import sysinfo
+from dmoj.executors.capability_cache import get_capability_cache
 from dmoj.judgeenv import env, only_executors, exclude_executors
 
+log = logging.getLogger('dmoj.executors')
+
 _reexecutor = re.compile('([A-Z0-9]+)\.py$')
 
 # List of executors that exist for historical purposes, but which shouldn't ever be run on a normal system
@@ -12,7 +25,11 @@ _reexecutor = re.compile('([A-Z0-9]+)\.py$')
 # them; instead, removing them from this list suffices.
 _unsupported_executors = {'CPP0X'}
 
-executors = {}
+# How many of the slowest executors to report once they have all been self-tested.
+_SLOWEST_REPORTED = 5
+
+# How many of the most used executors to load in the background, when loading executors lazily.
+DEFAULT_WARMUP = 3
 
 
 def get_available():
@@ -39,26 +56,236 @@ def load_executor(name):
             traceback.print_exc()
 
 
-def load_executors():
-    to_load = get_available()
+def _load(name):
+    """
+    Imports and initializes an executor, returning its module, or None if it isn't available, along with the time
+    taken by each.
+    """
+    start = time.time()
+    executor = load_executor(name)
+    imported = time.time()
+    if executor is None or not hasattr(executor, 'Executor'):
+        executor = None
+    else:
+        cls = executor.Executor
+        if hasattr(cls, 'initialize') and not cls.initialize(sandbox=env.selftest_sandboxing):
+            executor = None
+    return executor, imported - start, time.time() - imported
 
-    print 'Self-testing executors...'
 
-    for name in to_load:
-        executor = load_executor(name)
+class ExecutorRegistry(MutableMapping):
+    """
+    The available executors by name, as their modules.
 
-        if executor is None or not hasattr(executor, 'Executor'):
-            continue
+    Executors known to work from the capability cache may be deferred, in which case they are listed, and report
+    their cached runtime versions, but are only imported and initialized once first looked up by name, which is
+    usually by the first submission in their language. Checking whether one is available never loads it. Uses are
+    only counted towards the warm-up by use(), when a submission is built with the executor.
+    """
 
-        cls = executor.Executor
-        if hasattr(cls, 'initialize') and not cls.initialize(sandbox=env.selftest_sandboxing):
-            continue
+    def __init__(self):
+        self._loaded = {}
+        self._deferred = {}
+        self._used = set()
+        self._profile = {}
+        self._lock = threading.Lock()
+
+    def defer(self, name, versions):
+        self._deferred[name] = versions
+
+    def record_load(self, name, import_time, initialize_time):
+        self._profile[name] = (import_time, initialize_time)
+
+    def use(self, name):
+        """
+        Returns the executor a submission is about to be built with, counting its first use in this run of the judge.
+        """
+        executor = self[name]
+        if name not in self._used:
+            self._used.add(name)
+            cache = get_capability_cache()
+            if cache is not None:
+                cache.record_use(name)
+        return executor
+
+    def __getitem__(self, name):
+        try:
+            return self._loaded[name]
+        except KeyError:
+            if name not in self._deferred:
+                raise
+        self._load_deferred(name)
+        return self._loaded[name]
 
-        if hasattr(executor, 'aliases'):
-            for alias in executor.aliases():
-                if alias not in _unsupported_executors:
-                    executors[alias] = executor
+    def _load_deferred(self, name):
+        with self._lock:
+            # Someone else may have loaded it while we waited.
+            if name in self._deferred:
+                try:
+                    executor, import_time, initialize_time = _load(name)
+                except Exception:
+                    log.exception('Failed to load executor %s', name)
+                    executor = None
+                del self._deferred[name]
+                if executor is None:
+                    log.warning('Executor %s is no longer available', name)
+                else:
+                    log.info('Loaded executor %s: import %.3fs, initialize %.3fs', name, import_time, initialize_time)
+                    self.record_load(name, import_time, initialize_time)
+                    self._loaded[name] = executor
+
+    def __setitem__(self, name, executor):
+        self._loaded[name] = executor
+
+    def __delitem__(self, name):
+        if name in self._deferred:
+            del self._deferred[name]
         else:
-            executors[name] = executor
+            del self._loaded[name]
+
+    def __contains__(self, name):
+        return name in self._loaded or name in self._deferred
+
+    def __iter__(self):
+        return iter(list(self._loaded) + list(self._deferred))
+
+    def __len__(self):
+        return len(self._loaded) + len(self._deferred)
+
+    def get_deferred(self):
+        return sorted(self._deferred)
+
+    def get_runtime_versions(self):
+        versions = {name: executor.Executor.get_runtime_versions() for name, executor in self._loaded.items()}
+        versions.update(self._deferred)
+        return versions
+
+    def warm_up(self, names):
+        """
+        Loads the given deferred executors in the background, so that their first submissions needn't wait.
+        """
+        def warm_up():
+            for name in names:
+                self._load_deferred(name)
+
+        worker = threading.Thread(target=warm_up, name='executor-warmup')
+        worker.daemon = True
+        worker.start()
+
+    def profile(self):
+        return {
+            'loaded': {name: {'import': import_time, 'initialize': initialize_time}
+                       for name, (import_time, initialize_time) in self._profile.items()},
+            'deferred': self.get_deferred(),
+        }
+
+
+executors = ExecutorRegistry()
+sysinfo.report_callbacks.append(lambda: ('executor-loads', executors.profile()))
 
+
+class _ThreadOutput(object):
+    """
+    Stands in for sys.stdout or sys.stderr while executors are self-tested at once, collecting what each thread
+    that is testing one writes, so that it can be printed whole and in order.
+    """
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._buffers = {}
+
+    def capture(self):
+        self._buffers[thread.get_ident()] = StringIO()
+
+    def release(self):
+        return self._buffers.pop(thread.get_ident()).getvalue()
+
+    def _target(self):
+        return self._buffers.get(thread.get_ident(), self._stream)
+
+    def write(self, data):
+        self._target().write(data)
+
+    def writelines(self, lines):
+        self._target().writelines(lines)
+
+    # The print statement keeps track of whether it left off mid-line here, so that must be per thread too.
+    @property
+    def softspace(self):
+        return getattr(self._target(), 'softspace', 0)
+
+    @softspace.setter
+    def softspace(self, value):
+        self._target().softspace = value
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+def _test_executor(name):
+    sys.stdout.capture()
+    sys.stderr.capture()
+    try:
+        executor, import_time, initialize_time = _load(name)
+    except Exception:
+        # Whatever went wrong is this executor's alone.
+        traceback.print_exc()
+        executor, import_time, initialize_time = None, 0, 0
+    finally:
+        output, errors = sys.stdout.release(), sys.stderr.release()
+    return name, executor, output, errors, import_time, initialize_time
+
+
+def load_executors():
+    to_load = get_available()
+
+    # Executors known to work with the current runtimes can wait until they are needed.
+    cache = get_capability_cache()
+    if env.lazy_executors and cache is not None:
+        for name in to_load:
+            versions = cache.fetch(name, env['runtime'])
+            if versions is not None:
+                executors.defer(name, versions)
+        to_load = [name for name in to_load if name not in executors]
+
+    print 'Self-testing executors...'
+
+    start = time.time()
+    stdout, stderr = sys.stdout, sys.stderr
+    sys.stdout, sys.stderr = _ThreadOutput(stdout), _ThreadOutput(stderr)
+    pool = ThreadPool(max(1, min(env.selftest_workers or cpu_count(), len(to_load))))
+    times = []
+    try:
+        # Results come back in order, each as soon as it and those before it are done.
+        for name, executor, output, errors, import_time, initialize_time in pool.imap(_test_executor, to_load):
+            stdout.write(output)
+            stdout.flush()
+            stderr.write(errors)
+            times.append((import_time + initialize_time, name))
+            if executor is None:
+                continue
+            executors.record_load(name, import_time, initialize_time)
+
+            if hasattr(executor, 'aliases'):
+                for alias in executor.aliases():
+                    if alias not in _unsupported_executors:
+                        executors[alias] = executor
+            else:
+                executors[name] = executor
+    finally:
+        sys.stdout, sys.stderr = stdout, stderr
+        pool.close()
+
+    print
+    if times:
+        times.sort(reverse=True)
+        print 'Self-tested %d executors in %.2fs' % (len(to_load), time.time() - start)
+        print 'Slowest: %s' % ', '.join('%s (%.2fs)' % (name, elapsed) for elapsed, name in times[:_SLOWEST_REPORTED])
+    deferred = executors.get_deferred()
+    if deferred:
+        print 'Deferred loading until needed: %s' % ', '.join(deferred)
+        warmup = env.executor_warmup if env.executor_warmup is not None else DEFAULT_WARMUP
+        executors.warm_up(cache.most_used(deferred)[:warmup])
+    elif cache is not None and cache.hits:
+        print '%d passed before with unchanged runtimes, use --revalidate to self-test them again' % cache.hits
     print
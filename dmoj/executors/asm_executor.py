@@ -87,9 +87,15 @@ class ASMExecutor(CompiledExecutor):
     def get_fs(self):
         fs = super(ASMExecutor, self).get_fs()
         if self.use_qemu:
-            fs += ['/proc/sys/vm/mmap_min_addr$', '/etc/qemu-binfmt/', self._executable]
+            fs += ['/proc/sys/vm/mmap_min_addr$', '/etc/qemu-binfmt/']
         return fs
 
+    def get_fs_paths(self):
+        paths = super(ASMExecutor, self).get_fs_paths()
+        if self.use_qemu:
+            paths.append(self._executable)
+        return paths
+
     def get_address_grace(self):
         grace = super(ASMExecutor, self).get_address_grace()
         if self.use_qemu:
@@ -1,3 +1,4 @@
+import hashlib
 import re
 import signal
 import subprocess
@@ -8,6 +9,8 @@ from distutils.spawn import find_executable
 from subprocess import Popen
 
 from dmoj.error import CompileError
+from dmoj.executors.capability_cache import get_capability_cache
+from dmoj.executors.compile_cache import get_compile_cache, hash_file, snapshot_files
 from dmoj.executors.mixins import PlatformExecutorMixin
 from dmoj.executors.resource_proxy import ResourceProxy
 from dmoj.judgeenv import env
@@ -55,6 +58,12 @@ class BaseExecutor(PlatformExecutorMixin, ResourceProxy):
                      env=self.get_env(), executable=self.get_executable(),
                      cwd=self._dir, **kwargs)
 
+    def expect_launches(self, count):
+        """
+        Tells the executor how many more times it is going to be launched, so it can prepare only for those.
+        """
+        pass
+
     @classmethod
     def get_command(cls):
         return cls.runtime_dict.get(cls.command)
@@ -72,8 +81,16 @@ class BaseExecutor(PlatformExecutorMixin, ResourceProxy):
         if not cls.test_program:
             return True
 
+        # Only the self-tests the judge runs as it starts are cached, rather than those of candidate runtimes.
+        cache = get_capability_cache() if output and sandbox else None
         if output:
             print ansi_style("%-39s%s" % ('Self-testing #ansi[%s](|underline):' % cls.get_executor_name(), '')),
+            if cache is not None:
+                versions = cache.fetch(cls.get_executor_name(), cls.runtime_dict)
+                if versions is not None:
+                    version_cache[cls.get_executor_name()] = versions
+                    print ansi_style('#ansi[Success](green|bold) (cached)')
+                    return True
         try:
             executor = cls(cls.test_name, cls.test_program)
             proc = executor.launch(time=cls.test_time, memory=cls.test_memory) if sandbox else executor.launch_unsafe()
@@ -82,8 +99,13 @@ class BaseExecutor(PlatformExecutorMixin, ResourceProxy):
             res = stdout.strip() == test_message and not stderr
             if output:
                 # Cache the versions now, so that the handshake packet doesn't take ages to generate
-                cls.get_runtime_versions()
+                versions = cls.get_runtime_versions()
                 print ansi_style(['#ansi[Failed](red|bold)', '#ansi[Success](green|bold)'][res])
+                if cache is not None:
+                    if res:
+                        cache.store(cls.get_executor_name(), cls.runtime_dict, cls.get_runtime_prefixes(), versions)
+                    else:
+                        cache.invalidate(cls.get_executor_name())
             if stdout.strip() != test_message and error_callback:
                 error_callback('Got unexpected stdout output:\n' + stdout)
             if stderr:
@@ -106,6 +128,18 @@ class BaseExecutor(PlatformExecutorMixin, ResourceProxy):
     def get_versionable_commands(cls):
         return ((cls.command, cls.get_command())),
 
+    @classmethod
+    def get_runtime_prefixes(cls):
+        """
+        Returns the prefixes of the names of the runtime entries the executor may use, such as its command, or its
+        own name for entries like `<name>_home` and `<name>_env`.
+        """
+        prefixes = {cls.get_executor_name().lower()}
+        prefixes.update(runtime for runtime, path in cls.get_versionable_commands() if runtime)
+        if cls.command:
+            prefixes.add(cls.command)
+        return sorted(prefixes)
+
     @classmethod
     def get_runtime_versions(cls):
         key = cls.get_executor_name()
@@ -214,11 +248,14 @@ class ScriptExecutor(BaseExecutor):
 
     def get_fs(self):
         home = self.runtime_dict.get('%s_home' % self.get_executor_name().lower())
-        fs = super(ScriptExecutor, self).get_fs() + [self._code]
+        fs = super(ScriptExecutor, self).get_fs()
         if home is not None:
             fs.append(re.escape(home))
         return fs
 
+    def get_fs_paths(self):
+        return super(ScriptExecutor, self).get_fs_paths() + [self._code]
+
     def create_files(self, problem_id, source_code):
         with open(self._code, 'wb') as fo:
             fo.write(source_code)
@@ -289,7 +326,7 @@ class CompiledExecutor(BaseExecutor):
         super(CompiledExecutor, self).__init__(problem_id, source_code, **kwargs)
         self.create_files(problem_id, source_code, *args, **kwargs)
         self.warning = None
-        self._executable = self.compile()
+        self._executable = self.cached_compile()
 
     def create_files(self, problem_id, source_code, *args, **kwargs):
         self._code = self._file(problem_id + self.ext)
@@ -351,6 +388,55 @@ class CompiledExecutor(BaseExecutor):
         self.warning = output
         return self.get_compiled_file()
 
+    def get_compile_cache_key(self, files):
+        """
+        Returns the key to cache the compiled artifacts under, or None if this compile can't be cached.
+
+        The key covers the executor, its runtime versions, the compiler arguments (which include the flags and
+        defines), and the names and contents of all files in the temporary directory, i.e. the main source and
+        any auxiliary sources.
+        """
+        try:
+            args = self.get_compile_args()
+        except NotImplementedError:
+            return None
+
+        hasher = hashlib.sha256()
+        hasher.update(self.get_executor_name())
+        hasher.update(repr(self.get_runtime_versions()))
+        for arg in args:
+            # The temporary directory is different every time, so leave it out.
+            hasher.update(repr(arg.replace(self._dir, '')))
+        for file in sorted(files):
+            hasher.update(repr((file, hash_file(self._file(file)))))
+        return hasher.hexdigest()
+
+    def cached_compile(self):
+        cache = get_compile_cache()
+        # Self-tests are meant to exercise the compiler, so never serve them from cache.
+        if cache is None or self.problem == self.test_name:
+            return self.compile()
+
+        before = snapshot_files(self._dir)
+        key = self.get_compile_cache_key(before)
+        if key is None:
+            return self.compile()
+
+        cached = cache.fetch(key, self._dir)
+        if cached is not None:
+            # The warning is sent to the site just like that of a fresh compile.
+            executable, self.warning = cached
+            return executable and self._file(executable)
+
+        executable = self.compile()
+        if executable is not None and not os.path.abspath(executable).startswith(os.path.abspath(self._dir)):
+            return executable
+
+        after = snapshot_files(self._dir)
+        artifacts = [file for file, info in after.iteritems() if before.get(file) != info]
+        cache.store(key, self._dir, artifacts, executable and os.path.relpath(executable, self._dir), self.warning)
+        return executable
+
     def get_cmdline(self):
         return [self.problem]
 
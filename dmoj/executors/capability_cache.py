@@ -0,0 +1,139 @@
+import errno
+import json
+import logging
+import os
+import tempfile
+import threading
+
+from dmoj import judgeenv
+from dmoj.judgeenv import env
+
+log = logging.getLogger('dmoj.capability_cache')
+
+
+def _fingerprint(value):
+    if not isinstance(value, basestring):
+        return None
+    try:
+        stat = os.stat(value)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime, stat.st_ino]
+
+
+def runtime_fingerprint(runtime, prefixes):
+    """
+    Returns a JSON-serializable description of the entries of a runtime configuration whose names start with one of
+    the prefixes given, along with the size, modification time and inode of the file each names, if it names one.
+    """
+    runtime = getattr(runtime, 'raw_config', runtime)
+    prefixes = tuple(prefixes)
+    return sorted([key, value, _fingerprint(value)] for key, value in runtime.iteritems()
+                  if key.startswith(prefixes))
+
+
+class CapabilityCache(object):
+    """
+    Remembers the executors that passed their self-tests, and the versions of their runtimes, across restarts.
+
+    The cache is a single JSON file mapping executor names to the prefixes of the runtime entries they use, the
+    fingerprint of those entries, their versions, and how many runs of the judge have used them. An entry is only
+    trusted while its fingerprint still matches, that is, while the entries it covers are the same, and every file
+    they name is the same size, modification time and inode it was when the executor was tested. Keeping the
+    prefixes lets an executor be checked without importing it, and spares it from changes to any other runtime.
+    The file is rewritten whole, through a temporary file renamed into place, so that a judge never reads it half
+    written. When revalidating, no entry is trusted, but entries are still stored for next time.
+    """
+
+    def __init__(self, path, revalidate=False):
+        self.path = path
+        self.revalidate = revalidate
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        try:
+            with open(path) as f:
+                self._entries = json.load(f)
+            if not isinstance(self._entries, dict):
+                raise ValueError('not a mapping')
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                log.warning('Failed to read capability cache %s: %s', path, e)
+            self._entries = {}
+        except ValueError as e:
+            log.warning('Ignoring corrupt capability cache %s: %s', path, e)
+            self._entries = {}
+
+    def fetch(self, name, runtime):
+        """
+        Returns the runtime versions of the executor if it passed its self-test with the same runtimes, or None.
+        """
+        with self._lock:
+            entry = self._entries.get(name)
+        valid = (not self.revalidate and entry is not None and 'prefixes' in entry and
+                 entry.get('runtime') == runtime_fingerprint(runtime, entry['prefixes']))
+        with self._lock:
+            if not valid:
+                self.misses += 1
+                return None
+            self.hits += 1
+        # JSON has no tuples, and versions are compared as such.
+        return tuple((runtime, tuple(version)) for runtime, version in entry['versions'])
+
+    def store(self, name, runtime, prefixes, versions):
+        fingerprint = runtime_fingerprint(runtime, prefixes)
+        with self._lock:
+            uses = self._entries.get(name, {}).get('uses', 0)
+            # Round-trip through JSON, so that fetch compares like with like.
+            self._entries[name] = json.loads(json.dumps({'prefixes': sorted(set(prefixes)), 'runtime': fingerprint,
+                                                         'versions': versions, 'uses': uses}))
+            self._save()
+
+    def record_use(self, name):
+        """
+        Counts a run of the judge that needed the executor, so that the most used ones can be loaded ahead of need.
+        """
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None:
+                entry['uses'] = entry.get('uses', 0) + 1
+                self._save()
+
+    def most_used(self, names):
+        with self._lock:
+            uses = [(self._entries[name].get('uses', 0), name) for name in names if name in self._entries]
+        return [name for count, name in sorted(uses, key=lambda use: (-use[0], use[1])) if count]
+
+    def invalidate(self, name):
+        with self._lock:
+            if self._entries.pop(name, None) is not None:
+                self._save()
+
+    def _save(self):
+        temp = None
+        try:
+            fd, temp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)), prefix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self._entries, f, indent=2, sort_keys=True)
+            os.rename(temp, self.path)
+        except (IOError, OSError) as e:
+            log.warning('Failed to write capability cache %s: %s', self.path, e)
+            if temp is not None and os.path.exists(temp):
+                os.unlink(temp)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_capability_cache():
+    """
+    Returns the judge-wide capability cache, or None if capability_cache isn't configured.
+    """
+    global _cache
+    if _cache is None and env.capability_cache:
+        with _cache_lock:
+            if _cache is None:
+                _cache = CapabilityCache(env.capability_cache, revalidate=judgeenv.revalidate)
+    return _cache
@@ -195,9 +195,9 @@ class CLRProcess(object):
         finally:
             self._update_stats()
 
-    def safe_communicate(self, stdin=None, outlimit=None, errlimit=None):
+    def safe_communicate(self, stdin=None, outlimit=None, errlimit=None, stdout_callback=None):
         try:
-            stdout, stderr = safe_communicate(self, stdin, outlimit, errlimit)
+            stdout, stderr = safe_communicate(self, stdin, outlimit, errlimit, stdout_callback)
             self.feedback = self._find_exception(stderr)
             return stdout, stderr
         finally:
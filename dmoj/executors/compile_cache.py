@@ -0,0 +1,179 @@
+import errno
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+
+from dmoj import sysinfo
+from dmoj.judgeenv import env
+
+log = logging.getLogger('dmoj.compile_cache')
+
+DEFAULT_CACHE_SIZE = 1073741824  # 1gb
+
+
+def _walk_files(root):
+    for dir, _, files in os.walk(root):
+        for name in files:
+            yield os.path.relpath(os.path.join(dir, name), root)
+
+
+def _tree_size(root):
+    return sum(os.path.getsize(os.path.join(root, file)) for file in _walk_files(root))
+
+
+class CompileCache(object):
+    """
+    An on-disk, content-addressed store of compiled artifacts.
+
+    Each entry is a directory named after its key, holding the artifacts under files/, the raw compiler
+    warning in warning, and the artifact list and executable name in meta.json. Entries are written to a
+    temporary directory and renamed into place, so several judges may safely share a cache directory.
+    The modification time of an entry is bumped on every hit, and the least recently used entries are
+    evicted when the cache grows past its size limit.
+    """
+
+    def __init__(self, root, max_size=DEFAULT_CACHE_SIZE):
+        self.root = root
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        try:
+            os.makedirs(root)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+    def _entry(self, key):
+        return os.path.join(self.root, key)
+
+    def fetch(self, key, dest):
+        """
+        Copies the artifacts cached under key into dest.
+
+        :return: a tuple of the executable path relative to dest and the compiler warning, or None on a miss.
+        """
+        entry = self._entry(key)
+        try:
+            with open(os.path.join(entry, 'meta.json')) as f:
+                meta = json.load(f)
+            warning = None
+            if meta['has_warning']:
+                with open(os.path.join(entry, 'warning'), 'rb') as f:
+                    warning = f.read()
+            for file in meta['files']:
+                target = os.path.join(dest, file)
+                if not os.path.isdir(os.path.dirname(target)):
+                    os.makedirs(os.path.dirname(target))
+                shutil.copy2(os.path.join(entry, 'files', file), target)
+            os.utime(entry, None)
+        except (IOError, OSError, ValueError, KeyError):
+            # Either there is no such entry, or it was evicted from under us.
+            with self._lock:
+                self.misses += 1
+            log.info('Compile cache miss: %s', key)
+            return None
+
+        with self._lock:
+            self.hits += 1
+        log.info('Compile cache hit: %s', key)
+        return meta['executable'], warning
+
+    def store(self, key, src, files, executable, warning):
+        """
+        Caches the given files, relative to src, under key, along with the executable name and compiler warning.
+        """
+        entry = self._entry(key)
+        if os.path.isdir(entry):
+            return
+
+        temp = tempfile.mkdtemp(dir=self.root, prefix='.tmp')
+        try:
+            for file in files:
+                target = os.path.join(temp, 'files', file)
+                if not os.path.isdir(os.path.dirname(target)):
+                    os.makedirs(os.path.dirname(target))
+                shutil.copy2(os.path.join(src, file), target)
+
+            if warning is not None:
+                with open(os.path.join(temp, 'warning'), 'wb') as f:
+                    f.write(warning)
+            with open(os.path.join(temp, 'meta.json'), 'w') as f:
+                json.dump({'files': list(files), 'executable': executable, 'has_warning': warning is not None}, f)
+
+            os.rename(temp, entry)
+        except (IOError, OSError):
+            # Most likely, another judge stored the same entry first.
+            shutil.rmtree(temp, ignore_errors=True)
+            return
+
+        self.evict()
+
+    def evict(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name.startswith('.tmp'):
+                continue
+            try:
+                size = _tree_size(path)
+                entries.append((os.path.getmtime(path), size, path))
+            except OSError:
+                continue
+            total += size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            with self._lock:
+                self.evictions += 1
+            log.info('Evicted from compile cache: %s', path)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+
+def snapshot_files(root):
+    """
+    Returns a mapping of every file under root to its size and modification time.
+    """
+    result = {}
+    for file in _walk_files(root):
+        stat = os.stat(os.path.join(root, file))
+        result[file] = (stat.st_size, stat.st_mtime)
+    return result
+
+
+def hash_file(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), ''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_compile_cache():
+    """
+    Returns the judge-wide compile cache, or None if compile_cache_dir isn't configured.
+    """
+    global _cache
+    if _cache is None and env.compile_cache_dir:
+        with _cache_lock:
+            if _cache is None:
+                _cache = CompileCache(env.compile_cache_dir, env.compile_cache_size or DEFAULT_CACHE_SIZE)
+                sysinfo.report_callbacks.append(lambda: ('compile-cache', _cache.stats()))
+    return _cache
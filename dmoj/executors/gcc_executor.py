@@ -70,7 +70,7 @@ class GCCExecutor(CompiledExecutor):
         from dmoj.cptbox import CHROOTSecurity
         return self._add_syscalls(
             CHROOTSecurity(self.get_fs(), writable=self._writable,
-                           io_redirects=launch_kwargs.get('io_redirects', None))
+                           io_redirects=launch_kwargs.get('io_redirects', None), paths=self.get_fs_paths())
         )
 
     def get_env(self):
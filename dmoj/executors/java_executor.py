@@ -1,15 +1,27 @@
 import errno
+import logging
+import select
+import signal
 import subprocess
 import sys
 import os
 import re
+import threading
+import weakref
+import zipfile
 from shutil import copyfile
 from subprocess import Popen
 
 from dmoj.error import CompileError, InternalError
+from dmoj.judgeenv import env
 from .base_executor import CompiledExecutor
 from dmoj.result import Result
 
+try:
+    from dmoj.cptbox import PIPE
+except ImportError:
+    PIPE = None
+
 recomment = re.compile(r'/\*.*?\*/', re.DOTALL)
 restring = re.compile(r''''(?:\\.|[^'\\])'|"(?:\\.|[^"\\])*"''', re.DOTALL)
 reinline_comment = re.compile(r'//.*?(?=[\r\n])')
@@ -19,7 +31,12 @@ redeunicode = re.compile(r'\\u([0-9a-f]{4})', re.I)
 deunicode = lambda x: redeunicode.sub(lambda a: unichr(int(a.group(1), 16)), x)
 
 
+log = logging.getLogger('dmoj.executors')
+
 JAVA_SANDBOX = os.path.abspath(os.path.join(os.path.dirname(__file__), 'java-sandbox.jar'))
+WARM_LAUNCHER = 'ca.dmoj.java.WarmLauncher'
+# Seconds to wait for a warm JVM to start before launching a cold one instead.
+WARM_START_TIMEOUT = 30
 
 POLICY_PREFIX = '''\
 grant codeBase "file:///{agent}" {{
@@ -28,6 +45,24 @@ grant codeBase "file:///{agent}" {{
 
 '''
 
+WARM_POLICY_PREFIX = '''\
+grant codeBase "file:///{agent}" {{
+    // For the warm launcher to take its stdin from a file, and to load and run the submission.
+    permission java.io.FilePermission "<<ALL FILES>>", "read";
+    permission java.util.PropertyPermission "user.dir", "read";
+    permission java.lang.RuntimePermission "setIO";
+    permission java.lang.RuntimePermission "createClassLoader";
+    permission java.lang.RuntimePermission "setContextClassLoader";
+    permission java.lang.RuntimePermission "exitVM.0";
+    permission java.lang.reflect.ReflectPermission "suppressAccessChecks";
+}};
+
+'''
+
+# Options of the java launcher that take the next argument as their value.
+JAVA_OPTIONS_WITH_VALUE = ('--module-path', '-p', '--upgrade-module-path', '--add-modules', '--limit-modules',
+                           '--add-reads', '--add-exports', '--add-opens', '--patch-module')
+
 with open(os.path.join(os.path.dirname(__file__), 'java-security.policy')) as policy_file:
     policy = policy_file.read()
 
@@ -43,6 +78,148 @@ def find_class(source):
     return class_name
 
 
+_has_warm_launcher = None
+
+
+def has_warm_launcher():
+    global _has_warm_launcher
+    if _has_warm_launcher is None:
+        try:
+            with zipfile.ZipFile(JAVA_SANDBOX) as jar:
+                _has_warm_launcher = WARM_LAUNCHER.replace('.', '/') + '.class' in jar.namelist()
+        except (IOError, zipfile.BadZipfile):
+            _has_warm_launcher = False
+        if not _has_warm_launcher:
+            log.warning('%s lacks %s, rebuild it with build_java_executor to use java_warm_pool',
+                        JAVA_SANDBOX, WARM_LAUNCHER)
+    return _has_warm_launcher
+
+
+def read_jar_main_class(path):
+    try:
+        with zipfile.ZipFile(path) as jar:
+            manifest = jar.read('META-INF/MANIFEST.MF')
+    except (IOError, KeyError, zipfile.BadZipfile):
+        return None
+    # Lines longer than 72 bytes are continued on the next, which then starts with a space.
+    for line in manifest.replace('\r\n', '\n').replace('\n ', '').splitlines():
+        key, _, value = line.partition(':')
+        if key.strip() == 'Main-Class':
+            return value.strip()
+    return None
+
+
+def split_java_cmdline(cmdline, cwd):
+    """
+    Splits a java command line run in cwd into the JVM's options, its class path, the main class and the main
+    class's arguments, or returns None if it runs something other than a main class, such as a module.
+    """
+    options, classpath = [], None
+    i = 1
+    while i < len(cmdline):
+        arg = cmdline[i]
+        if arg in ('-cp', '-classpath', '--class-path') and i + 1 < len(cmdline):
+            classpath = cmdline[i + 1]
+            i += 2
+        elif arg == '-jar' and i + 1 < len(cmdline):
+            main = read_jar_main_class(os.path.join(cwd, cmdline[i + 1]))
+            return (options, [cmdline[i + 1]], main, cmdline[i + 2:]) if main else None
+        elif arg in ('-m', '--module'):
+            return None
+        elif arg in JAVA_OPTIONS_WITH_VALUE and i + 1 < len(cmdline):
+            options += cmdline[i:i + 2]
+            i += 2
+        elif arg.startswith('-'):
+            options.append(arg)
+            i += 1
+        else:
+            return options, classpath.split(os.pathsep) if classpath else ['.'], arg, cmdline[i + 1:]
+    return None
+
+
+def _kill_quietly(process):
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except OSError:
+        pass
+
+
+def _await_ready(process):
+    # A warm JVM writes a single NUL byte once it's ready to be told what to run.
+    fd = process.stdout.fileno()
+    ready, _, _ = select.select([fd], [], [], WARM_START_TIMEOUT)
+    if ready and os.read(fd, 1) == '\0':
+        return True
+    log.warning('Warm JVM %d failed to start, launching a cold one instead', process.pid)
+    _kill_quietly(process)
+    return False
+
+
+class WarmJVMPool(object):
+    """
+    The spare JVMs of a submission, which have started and wait to be told what to run, keyed by everything they
+    are launched with but their main class and its arguments. Each only ever runs one test case, so that nothing
+    carries over from one case to the next, and is replaced once that case finishes, rather than while it runs,
+    but only if the submission is expected to be launched again.
+    """
+
+    def __init__(self, executor):
+        # The executor owns us, and closes us when it's cleaned up, which a reference back would keep from happening.
+        self._executor = weakref.ref(executor)
+        self._spares = {}
+        self._lock = threading.Lock()
+        self._closed = False
+        # The number of launches still to come, if we were told.
+        self._remaining = None
+
+    def expect(self, count):
+        with self._lock:
+            self._remaining = count
+
+    def launched(self):
+        with self._lock:
+            if self._remaining is not None:
+                self._remaining -= 1
+
+    def _wanted(self, key):
+        return not self._closed and key not in self._spares and (self._remaining is None or self._remaining > 0)
+
+    def take(self, key):
+        with self._lock:
+            return self._spares.pop(key, None)
+
+    def replace(self, key, process):
+        def replace():
+            process.wait()
+            with self._lock:
+                if not self._wanted(key):
+                    return
+            executor = self._executor()
+            if executor is None:
+                return
+            spare = executor.launch_warm_jvm(key)
+            del executor
+            with self._lock:
+                if self._wanted(key):
+                    self._spares[key] = spare
+                    return
+            _kill_quietly(spare)
+
+        with self._lock:
+            if not self._wanted(key):
+                return
+        thread = threading.Thread(target=replace, name='warm-jvm')
+        thread.daemon = True
+        thread.start()
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            spares, self._spares = self._spares.values(), {}
+        for spare in spares:
+            _kill_quietly(spare)
+
+
 class JavaExecutor(CompiledExecutor):
     ext = '.java'
 
@@ -56,6 +233,7 @@ class JavaExecutor(CompiledExecutor):
 
     def __init__(self, problem_id, source_code, **kwargs):
         self._class_name = None
+        self._warm_pool = None
         super(JavaExecutor, self).__init__(problem_id, source_code, **kwargs)
 
     def create_files(self, problem_id, source_code, *args, **kwargs):
@@ -66,13 +244,19 @@ class JavaExecutor(CompiledExecutor):
             copyfile(JAVA_SANDBOX, self._agent_file)
         else:
             self._agent_file = JAVA_SANDBOX
+            # JVMs started ahead of the test cases they run, which is only possible where stdin can be a file.
+            if env.get('java_warm_pool', False) and has_warm_launcher():
+                self._warm_pool = WarmJVMPool(self)
 
         self._policy_file = self._file('security.policy')
         with open(self._policy_file, 'w') as file:
             # Normalize path separators because the security policy is processed by a StringTokenizer which treats
             # escapes sequences as... escape sequences.
             path = self._agent_file.replace('\\', '/') if os.name == 'nt' else self._agent_file
-            file.write(POLICY_PREFIX.format(agent=path) + self.security_policy)
+            prefix = POLICY_PREFIX.format(agent=path)
+            if self._warm_pool is not None:
+                prefix += WARM_POLICY_PREFIX.format(agent=path)
+            file.write(prefix + self.security_policy)
 
     def get_compile_popen_kwargs(self):
         return {'executable': self.get_compiler()}
@@ -97,8 +281,76 @@ class JavaExecutor(CompiledExecutor):
     def launch(self, *args, **kwargs):
         self.__memory_limit = kwargs['memory']
         kwargs['memory'] = 0
+        if self._warm_pool is not None:
+            self._warm_pool.launched()
+        if self._warm_pool is not None and not args and not kwargs.get('unbuffered', False):
+            process = self.launch_warm(kwargs)
+            if process is not None:
+                return process
         return super(JavaExecutor, self).launch(*args, **kwargs)
 
+    def launch_warm(self, kwargs):
+        """
+        Runs the submission in a JVM that was started ahead of time, which isn't timed until it's told what to run.
+        Returns None if it can't be, in which case it should be launched as usual.
+        """
+        command = split_java_cmdline(self.get_cmdline(), self._dir)
+        if command is None:
+            return None
+        options, classpath, main, args = command
+
+        # The JVM reads its stdin from a pipe, so it's told where its input file is instead.
+        stdin = kwargs.get('stdin', PIPE)
+        input_file = ''
+        if stdin is not PIPE:
+            fd = stdin if isinstance(stdin, int) else stdin.fileno()
+            input_file = os.readlink('/proc/self/fd/%d' % fd)
+            if not os.path.isfile(input_file):
+                return None
+
+        line = '\0'.join([input_file, os.pathsep.join(classpath), main] + args)
+        if '\n' in line:
+            return None
+
+        key = (tuple(options), tuple(classpath), kwargs.get('time'), kwargs.get('wall_time'),
+               kwargs.get('pipe_stderr', False))
+        process = self._warm_pool.take(key)
+        if process is None or not _await_ready(process):
+            process = self.launch_warm_jvm(key)
+            if not _await_ready(process):
+                return None
+
+        try:
+            process.stdin.write(line + '\n')
+            process.stdin.flush()
+        except IOError:
+            _kill_quietly(process)
+            return None
+        if stdin is not PIPE:
+            process.stdin.close()
+            process.stdin = None
+            if isinstance(stdin, int):
+                os.close(stdin)
+        process.begin()
+        self._warm_pool.replace(key, process)
+        return process
+
+    def launch_warm_jvm(self, key):
+        options, classpath, time, wall_time, pipe_stderr = key
+        cmdline = (['java'] + list(options) + ['-cp', os.pathsep.join((self._agent_file,) + classpath),
+                                               WARM_LAUNCHER])
+        return self.launch_cmdline(cmdline, time=time, memory=0, wall_time=wall_time, pipe_stderr=pipe_stderr,
+                                   deferred=True)
+
+    def expect_launches(self, count):
+        if self._warm_pool is not None:
+            self._warm_pool.expect(count)
+
+    def cleanup(self):
+        if self._warm_pool is not None:
+            self._warm_pool.close()
+        super(JavaExecutor, self).cleanup()
+
     def launch_unsafe(self, *args, **kwargs):
         return Popen(['java', '-client', self._class_name] + list(args),
                      executable=self.get_vm(), cwd=self._dir, **kwargs)
@@ -83,13 +83,21 @@ try:
             def get_security(self, launch_kwargs=None):
                 if CHROOTSecurity is None:
                     raise NotImplementedError('No security manager on Windows')
-                sec = CHROOTSecurity(self.get_fs(), io_redirects=launch_kwargs.get('io_redirects', None))
+                sec = CHROOTSecurity(self.get_fs(), io_redirects=launch_kwargs.get('io_redirects', None),
+                                     paths=self.get_fs_paths())
                 return self._add_syscalls(sec)
 
             def get_fs(self):
                 name = self.get_executor_name()
                 return BASE_FILESYSTEM + self.fs + env.get('extra_fs', {}).get(name, [])
 
+            def get_fs_paths(self):
+                """
+                Paths of this submission to allow access to, as plain prefixes. Unlike get_fs, which should be the
+                same for every submission so that it's compiled once, these are checked on top of it for each launch.
+                """
+                return []
+
             def get_allowed_syscalls(self):
                 return self.syscalls
 
@@ -100,14 +108,19 @@ try:
                 return {'LANG': 'C'}
 
             def launch(self, *args, **kwargs):
-                return SecurePopen(self.get_cmdline() + list(args), executable=self.get_executable(),
+                return self.launch_cmdline(self.get_cmdline() + list(args), **kwargs)
+
+            def launch_cmdline(self, cmdline, **kwargs):
+                return SecurePopen(cmdline, executable=self.get_executable(),
                                    security=self.get_security(launch_kwargs=kwargs),
                                    address_grace=self.get_address_grace(),
                                    time=kwargs.get('time'), memory=kwargs.get('memory'),
-                                   wall_time=kwargs.get('wall_time'),
+                                   wall_time=kwargs.get('wall_time'), stdin=kwargs.get('stdin', PIPE),
                                    stderr=(PIPE if kwargs.get('pipe_stderr', False) else None),
                                    env=self.get_env(), cwd=self._dir, nproc=self.get_nproc(),
-                                   unbuffered=kwargs.get('unbuffered', False))
+                                   unbuffered=kwargs.get('unbuffered', False), seccomp=env.get('seccomp', True),
+                                   zygote=env.get('sandbox_zygote', True), cgroup=env.get('sandbox_cgroup'),
+                                   deferred=kwargs.get('deferred', False))
 except ImportError:
     pass
 
@@ -196,5 +209,5 @@ class ScriptDirectoryMixin(object):
     usually for some searching purposes.
     """
 
-    def get_fs(self):
-        return super(ScriptDirectoryMixin, self).get_fs() + [self._dir]
+    def get_fs_paths(self):
+        return super(ScriptDirectoryMixin, self).get_fs_paths() + [self._dir]
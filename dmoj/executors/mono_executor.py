@@ -9,7 +9,7 @@ from dmoj.cptbox import CHROOTSecurity, SecurePopen
 from dmoj.cptbox.handlers import ALLOW, ACCESS_DENIED
 from .base_executor import CompiledExecutor
 
-WRITE_FS = ['/proc/self/task/\d+/comm$', '.*?/mono\.\d+$']
+WRITE_FS = re.compile(r'/proc/self/task/\d+/comm$|.*?/mono\.\d+$')
 UNLINK_FS = re.compile('.*?/mono.\d+$')
 
 log = logging.getLogger('dmoj.security')
@@ -38,8 +38,8 @@ class MonoExecutor(CompiledExecutor):
         return self.runtime_dict['mono']
 
     def get_security(self, launch_kwargs=None):
-        fs = self.get_fs() + [self._dir]
-        sec = CHROOTSecurity(fs, io_redirects=launch_kwargs.get('io_redirects', None))
+        sec = CHROOTSecurity(self.get_fs(), io_redirects=launch_kwargs.get('io_redirects', None),
+                             paths=self.get_fs_paths() + [self._dir])
         sec[sys_sched_getaffinity] = ALLOW
         sec[sys_sched_setscheduler] = ALLOW
         sec[sys_statfs] = ALLOW
@@ -48,18 +48,16 @@ class MonoExecutor(CompiledExecutor):
         sec[sys_rt_sigsuspend] = ALLOW
         sec[sys_wait4] = ALLOW
 
-        fs = sec.fs_jail
-        write_fs = re.compile('|'.join(WRITE_FS))
         writable = defaultdict(bool)
         writable[1] = writable[2] = True
 
         def handle_open(debugger):
             file = debugger.readstr(debugger.uarg0)
-            if fs.match(file) is None:
+            if not sec.in_jail(file):
                 print>>sys.stderr, 'Not allowed to access:', file
                 log.warning('Denied file open: %s', file)
                 return False
-            can = write_fs.match(file) is not None
+            can = WRITE_FS.match(file) is not None
 
             def update():
                 writable[debugger.result] = can
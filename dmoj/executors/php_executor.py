@@ -11,5 +11,5 @@ class PHPExecutor(ScriptExecutor):
     def get_cmdline(self):
         return ['php', self._code]
 
-    def get_fs(self):
-        return super(PHPExecutor, self).get_fs() + [self._code]
+    def get_fs_paths(self):
+        return super(PHPExecutor, self).get_fs_paths() + [self._code]
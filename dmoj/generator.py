@@ -30,13 +30,14 @@ class GeneratorManager(object):
                     return grader
             return None
 
+        # Only the executor for the generator's own extension is looked up, as deferred ones load when looked up.
         lookup = {
-            '.py': executors.get('PY2', None),
-            '.py3': executors.get('PY3', None),
-            '.c': executors.get('C', None),
-            '.cpp': executors.get(find_runtime(('CPP14', 'CPP11', 'CPP0X', 'CPP03')), None),
-            '.java': executors.get(find_runtime(('JAVA9', 'JAVA8', 'JAVA7')), None),
-            '.rb': executors.get(find_runtime(('RUBY2', 'RUBY19', 'RUBY18')), None)
+            '.py': ('PY2',),
+            '.py3': ('PY3',),
+            '.c': ('C',),
+            '.cpp': ('CPP14', 'CPP11', 'CPP0X', 'CPP03'),
+            '.java': ('JAVA9', 'JAVA8', 'JAVA7'),
+            '.rb': ('RUBY2', 'RUBY19', 'RUBY18'),
         }
         ext = os.path.splitext(filename)[1]
         pass_platform_flags = ['.c', '.cpp']
@@ -44,10 +45,10 @@ class GeneratorManager(object):
         if pass_platform_flags:
             flags += ['-DWINDOWS_JUDGE', '-DWIN32'] if os.name == 'nt' else ['-DLINUX_JUDGE']
 
-        clazz = lookup.get(ext, None)
-        if not clazz:
+        runtime = find_runtime(lookup.get(ext, ()))
+        if runtime is None:
             raise IOError('could not identify generator extension')
-        clazz = clazz.Executor
+        clazz = executors[runtime].Executor
 
         if hasattr(clazz, 'flags'):
             # We shouldn't be mutating the base class flags
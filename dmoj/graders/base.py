@@ -1,4 +1,18 @@
+import thread
+
+
+def kill_quietly(proc):
+    if proc:
+        try:
+            proc.kill()
+        except OSError:
+            pass
+
+
 class BaseGrader(object):
+    # Whether grade() may be called concurrently for different cases of the same submission.
+    supports_parallel = False
+
     def __init__(self, judge, problem, language, source):
         if isinstance(source, unicode):
             source = source.encode('utf-8')
@@ -6,21 +20,52 @@ class BaseGrader(object):
         self.language = language
         self.problem = problem
         self.judge = judge
+        self._procs = {}
+        self._launch_callbacks = {}
         self.binary = self._generate_binary()
         self._terminate_grading = False
-        self._current_proc = None
+
+    @property
+    def _current_proc(self):
+        # Processes are tracked per grading thread, so that cases graded in parallel don't clobber each other.
+        return self._procs.get(thread.get_ident())
+
+    @_current_proc.setter
+    def _current_proc(self, proc):
+        ident = thread.get_ident()
+        self._procs[ident] = proc
+        callback = self._launch_callbacks.get(ident)
+        if callback is not None:
+            callback(proc)
 
     def grade(self, case):
         raise NotImplementedError
 
+    def grade_case(self, case, on_launch=None):
+        """
+        Grades a case on this thread, calling on_launch with every process launched for it, so that the caller can
+        kill exactly the processes of that case.
+        """
+        ident = thread.get_ident()
+        if on_launch is not None:
+            self._launch_callbacks[ident] = on_launch
+        try:
+            return self.grade(case)
+        finally:
+            self._launch_callbacks.pop(ident, None)
+            # The next case this thread grades is not this one, and mustn't be killed in its place.
+            self._procs.pop(ident, None)
+
     def _generate_binary(self):
         raise NotImplementedError
 
+    def kill_process(self, ident):
+        """
+        Kills the process currently being graded by the thread with the given identifier, if any.
+        """
+        kill_quietly(self._procs.get(ident))
+
     def terminate_grading(self):
         self._terminate_grading = True
-        if self._current_proc:
-            try:
-                self._current_proc.kill()
-            except OSError:
-                pass
-        pass
+        for ident in self._procs.keys():
+            self.kill_process(ident)
@@ -5,6 +5,9 @@ from dmoj.utils.module import load_module_from_file
 
 
 class CustomGrader(object):
+    # We have no idea whether a custom grader is thread-safe, so assume the worst.
+    supports_parallel = False
+
     def __init__(self, judge, problem, language, source):
         self.judge = judge
         self.mod = load_module_from_file(os.path.join(get_problem_root(problem.id), problem.config['custom_judge']))
@@ -76,6 +76,12 @@ class Interactor(object):
 
 
 class InteractiveGrader(StandardGrader):
+    # The interactor result is kept on the grader, so cases must be graded one at a time.
+    supports_parallel = False
+    # The interactor talks to the process through its stdin and stdout, so they must remain pipes.
+    supports_input_file = False
+    supports_output_stream = False
+
     def _interact_with_process(self, case, result, input):
         interactor = Interactor(self._current_proc)
         self.check = False
@@ -3,6 +3,8 @@ import logging
 import os
 import platform
 import signal
+import threading
+from Queue import Queue
 
 from dmoj.error import CompileError
 from dmoj.executors import executors
@@ -22,18 +24,96 @@ except ImportError:
 log = logging.getLogger('dmoj.graders')
 
 
+class OutputStream(object):
+    """
+    Feeds the output of a process to a streaming checker as it is read, keeping only the prefix that is reported.
+
+    The checker runs on a thread of its own, fed through a queue, so that reading the output never waits on it: a
+    process blocked on a full pipe would otherwise be charged for the time spent checking what it wrote.
+    """
+
+    def __init__(self, checker, prefix_length, stop_early):
+        self.checker = checker
+        self.prefix_length = prefix_length
+        self.stop_early = stop_early
+        self.prefix = ''
+        self.process = None
+        self.stopped = False
+        self._chunks = Queue()
+        self._thread = threading.Thread(target=self._check, name='output-stream')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __call__(self, data):
+        if len(self.prefix) < self.prefix_length:
+            self.prefix += data[:self.prefix_length - len(self.prefix)]
+        self._chunks.put(data)
+        return not self.stopped
+
+    def _check(self):
+        while True:
+            data = self._chunks.get()
+            if data is None:
+                return
+            if self.stopped or self.checker.feed(data) or not self.stop_early:
+                continue
+
+            # The output is already wrong, so there's no point in letting the process run any longer.
+            self.stopped = True
+            if self.process is not None and self.process.returncode is None:
+                self.process.kill()
+
+    def close(self):
+        """
+        Waits for the checker to have seen everything read so far.
+        """
+        self._chunks.put(None)
+        self._thread.join()
+
+
 class StandardGrader(BaseGrader):
+    supports_parallel = True
+    supports_input_file = os.name != 'nt'  # Other sandboxes can't take a file descriptor for stdin.
+    supports_output_stream = True
+
     def grade(self, case):
         result = Result(case)
 
-        input = case.input_data()  # cache generator data
+        # Loading the judge's output for the checker could take a while, so it's done before the process is timed.
+        stream = self._open_output_stream(case)
+
+        # A plain input file is handed to the process as its stdin, sparing us from loading and piping it.
+        input_file = case.input_file() if self.supports_input_file else None
+        if input_file is not None:
+            input = None
+            stdin = os.open(input_file, os.O_RDONLY)
+            launch_kwargs = {'stdin': stdin}
+        else:
+            input = case.input_data()  # cache generator data
+            launch_kwargs = {}
 
-        self._current_proc = self.binary.launch(time=self.problem.time_limit, memory=self.problem.memory_limit,
-                                                pipe_stderr=True, unbuffered=case.config.unbuffered,
-                                                io_redirects=case.io_redirects(),
-                                                wall_time=case.config.wall_time_factor * self.problem.time_limit)
+        try:
+            self._current_proc = self.binary.launch(time=self.problem.time_limit, memory=self.problem.memory_limit,
+                                                    pipe_stderr=True, unbuffered=case.config.unbuffered,
+                                                    io_redirects=case.io_redirects(),
+                                                    wall_time=case.config.wall_time_factor * self.problem.time_limit,
+                                                    **launch_kwargs)
+        except:
+            if input_file is not None:
+                os.close(stdin)
+            if stream is not None:
+                stream.close()
+            raise
 
-        error = self._interact_with_process(case, result, input)
+        if stream is not None:
+            stream.process = self._current_proc
+            try:
+                error = self._interact_with_process(case, result, input, stream=stream)
+            finally:
+                stream.close()
+            result.proc_output = stream.prefix
+        else:
+            error = self._interact_with_process(case, result, input)
 
         process = self._current_proc
 
@@ -41,10 +121,18 @@ class StandardGrader(BaseGrader):
         result.execution_time = process.execution_time or 0.0
         result.r_execution_time = process.r_execution_time or 0.0
 
-        # Translate status codes/process results into Result object for status codes
-        self.set_result_flag(process, result)
+        if stream is not None and stream.stopped:
+            # We killed it for its wrong output, which is what it should be judged on.
+            result.result_flag |= Result.WA
+            check = False
+        else:
+            # Translate status codes/process results into Result object for status codes
+            self.set_result_flag(process, result)
 
-        check = self.check_result(case, result)
+            if stream is not None:
+                check = stream.checker.finish() if not result.result_flag else False
+            else:
+                check = self.check_result(case, result)
 
         # checkers must either return a boolean (True: full points, False: 0 points)
         # or a CheckerResult, so convert to CheckerResult if it returned bool
@@ -91,21 +179,31 @@ class StandardGrader(BaseGrader):
             }.get(callname, '%s syscall disallowed' % callname)
             result.feedback = message
 
+    def _checker_kwargs(self, case):
+        # Checkers might crash if any data is None, so force at least empty string
+        return dict(submission_source=self.source,
+                    judge_input=case.input_data() or '',
+                    point_value=case.points,
+                    case_position=case.position,
+                    batch=case.batch,
+                    submission_language=self.language)
+
+    def _open_output_stream(self, case):
+        if not self.supports_output_stream:
+            return None
+        checker = case.stream_checker()
+        if checker is None:
+            return None
+        return OutputStream(checker(case.output_data() or '', **self._checker_kwargs(case)),
+                            case.output_prefix_length, case.config.stop_on_wrong_output)
+
     def check_result(self, case, result):
         # If the submission didn't crash and didn't time out, there's a chance it might be AC
         # We shouldn't run checkers if the submission is already known to be incorrect, because some checkers
         # might be very computationally expensive.
         # See https://github.com/DMOJ/judge/issues/170
         if not result.result_flag:
-            # Checkers might crash if any data is None, so force at least empty string
-            check = case.checker()(result.proc_output or '',
-                                   case.output_data() or '',
-                                   submission_source=self.source,
-                                   judge_input=case.input_data() or '',
-                                   point_value=case.points,
-                                   case_position=case.position,
-                                   batch=case.batch,
-                                   submission_language=self.language)
+            check = case.checker()(result.proc_output or '', case.output_data() or '', **self._checker_kwargs(case))
         else:
             # Solution is guaranteed to receive 0 points
             check = False
@@ -135,11 +233,11 @@ class StandardGrader(BaseGrader):
         if process.mle:
             result.result_flag |= Result.MLE
 
-    def _interact_with_process(self, case, result, input):
+    def _interact_with_process(self, case, result, input, stream=None):
         process = self._current_proc
         try:
             result.proc_output, error = process.safe_communicate(input, outlimit=case.config.output_limit_length,
-                                                                 errlimit=1048576)
+                                                                 errlimit=1048576, stdout_callback=stream)
         except OutputLimitExceeded as ole:
             stream, result.proc_output, error = ole.args
             log.warning('OLE on stream: %s', stream)
@@ -160,8 +258,8 @@ class StandardGrader(BaseGrader):
         # If the executor requires compilation, compile and send any errors/warnings to the site
         try:
             # Fetch an appropriate executor for the language
-            binary = executors[self.language].Executor(self.problem.id, self.source,
-                                                       hints=self.problem.config.hints or [])
+            binary = executors.use(self.language).Executor(self.problem.id, self.source,
+                                                           hints=self.problem.config.hints or [])
         except CompileError as compilation_error:
             error = compilation_error.args[0]
             error = error.decode('mbcs') if os.name == 'nt' and isinstance(error, str) else error
@@ -9,14 +9,17 @@ import threading
 import traceback
 from functools import partial
 from itertools import chain
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
 
 from dmoj import packet, graders
 from dmoj.config import ConfigNode
 from dmoj.control import JudgeControlRequestHandler
 from dmoj.error import CompileError
+from dmoj.graders.base import kill_quietly
 from dmoj.judgeenv import env, get_supported_problems, startup_warnings
 from dmoj.monitor import Monitor, DummyMonitor
-from dmoj.problem import Problem, BatchedTestCase
+from dmoj.problem import Problem, BatchedTestCase, problem_cache
 from dmoj.result import Result
 from dmoj.utils.ansi import ansi_style, strip_ansi
 from dmoj.utils.debugger import setup_all_debuggers
@@ -42,24 +45,136 @@ class TerminateGrading(Exception):
     pass
 
 
+def expect_launches(binary, count):
+    # Binaries of custom judges needn't be executors, and so may not take the hint.
+    expect = getattr(binary, 'expect_launches', None)
+    if expect is not None:
+        expect(count)
+
+
+class CaseJob(object):
+    """
+    A test case queued for grading on a worker thread, used when a problem opts into parallel grading. The worker
+    thread takes on the submission job the case belongs to while grading it, so that what it looks up about the
+    current submission is about this one, rather than whichever was started last.
+    """
+
+    def __init__(self, grader, case, slots, local, job):
+        self.grader = grader
+        self.case = case
+        self._local = local
+        self._job = job
+        self.result = None
+        self.cancelled = False
+        self._slots = slots
+        self._exc_info = None
+        self._process = None
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    def run(self):
+        with self._slots:
+            with self._lock:
+                if self.cancelled:
+                    self._done.set()
+                    return
+            self._local.job = self._job
+            try:
+                self.result = self.grader.grade_case(self.case, on_launch=self._launched)
+            except BaseException:
+                self._exc_info = sys.exc_info()
+            finally:
+                self._local.job = None
+                self._done.set()
+
+    def _launched(self, process):
+        with self._lock:
+            self._process = process
+            cancelled = self.cancelled
+        # We were cancelled while the process was starting, and it's ours to kill.
+        if cancelled:
+            kill_quietly(process)
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            process = self._process
+        # The result of a cancelled case is never looked at, so just kill its process if it has one.
+        if process is not None and not self._done.is_set():
+            kill_quietly(process)
+
+    def wait(self):
+        self._done.wait()
+        if self._exc_info is not None:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self.result
+
+
 TYPE_SUBMISSION = 1
 TYPE_INVOCATION = 2
 
 
+class SubmissionJob(object):
+    """
+    The state of a single submission or invocation being processed by the judge.
+    """
+
+    def __init__(self, type, id):
+        self.type = type
+        self.id = id
+        self.grader = None
+        self.thread = None
+        self.terminating = False
+
+
 class Judge(object):
     def __init__(self):
-        self.current_submission = None
-        self.current_grader = None
-        self.current_submission_thread = None
-        self._terminate_grading = False
-        self.process_type = 0
+        # Each grading thread looks up its own job, so that several submissions can be graded at once.
+        self._local = threading.local()
+        self._jobs = {}
+        self._jobs_lock = threading.Lock()
+        self._last_job = None
+        self.submission_workers = max(1, env.submission_workers or 1)
+        self._worker_slots = threading.BoundedSemaphore(self.submission_workers)
 
         self._updating_problem = False
         self._problem_is_stale = False
 
+        # Judge-wide cap on the number of test cases that may be running at once across parallel graders.
+        self.parallel_case_limit = env.parallel_case_limit or cpu_count()
+        self._case_slots = threading.BoundedSemaphore(self.parallel_case_limit)
+
         self.begin_grading = partial(self.process_submission, TYPE_SUBMISSION, self._begin_grading)
         self.custom_invocation = partial(self.process_submission, TYPE_INVOCATION, self._custom_invocation)
 
+    @property
+    def current_job(self):
+        """
+        The job processed by the calling thread. Threads not grading anything, such as the packet reader,
+        see the most recently started job instead.
+        """
+        return getattr(self._local, 'job', None) or self._last_job
+
+    @property
+    def current_submission(self):
+        job = self.current_job
+        return job.id if job else None
+
+    @property
+    def current_grader(self):
+        job = self.current_job
+        return job.grader if job else None
+
+    @property
+    def process_type(self):
+        job = self.current_job
+        return job.type if job else 0
+
+    @property
+    def _terminate_grading(self):
+        job = self.current_job
+        return job.terminating if job else False
+
     def update_problems(self):
         """
         Pushes current problem set to server.
@@ -75,17 +190,29 @@ class Judge(object):
             self._updating_problem = False
 
     def process_submission(self, type, target, id, *args, **kwargs):
-        try:
-            self.current_submission_thread.join()
-        except AttributeError:
-            pass
-        self.process_type = type
-        self.current_submission = id
-        self.current_submission_thread = threading.Thread(target=target, args=args)
-        self.current_submission_thread.daemon = True
-        self.current_submission_thread.start()
+        # Wait for a free worker; with a single worker, this waits for the previous submission to finish.
+        self._worker_slots.acquire()
+        job = SubmissionJob(type, id)
+        job.thread = threading.Thread(target=self._run_job, args=(job, target) + args)
+        job.thread.daemon = True
+        with self._jobs_lock:
+            self._jobs[id] = job
+            self._last_job = job
+        job.thread.start()
         if kwargs.pop('blocking', False):
-            self.current_submission_thread.join()
+            job.thread.join()
+
+    def _run_job(self, job, target, *args):
+        self._local.job = job
+        try:
+            target(*args)
+        finally:
+            with self._jobs_lock:
+                if self._jobs.get(job.id) is job:
+                    del self._jobs[job.id]
+                if self._last_job is job:
+                    self._last_job = None
+            self._worker_slots.release()
 
     def _custom_invocation(self, language, source, memory_limit, time_limit, input_data):
         class InvocationGrader(graders.StandardGrader):
@@ -98,14 +225,18 @@ class Judge(object):
             memory_limit = memory_limit
 
         class InvocationCase(object):
-            config = ConfigNode({'unbuffered': False})
-            io_redirects = lambda: None
-            input_data = lambda: input_data
+            config = ConfigNode({'unbuffered': False, 'wall_time_factor': 3})
+            io_redirects = lambda self: None
+            input_data = lambda self: input_data
+            input_file = lambda self: None
+            free_data = lambda self: None
+            stream_checker = lambda self: None
 
         grader = self.get_grader_from_source(InvocationGrader, InvocationProblem(), language, source)
         binary = grader.binary if grader else None
 
         if binary:
+            expect_launches(binary, 1)
             self.packet_manager.invocation_begin_packet()
             try:
                 result = grader.grade(InvocationCase())
@@ -119,9 +250,6 @@ class Judge(object):
                 self.packet_manager.invocation_end_packet(result)
 
         print ansi_style('Done invoking #ansi[%s](green|bold).\n' % (id))
-        self._terminate_grading = False
-        self.current_submission_thread = None
-        self.current_submission = None
 
     def _begin_grading(self, problem_id, language, source, time_limit, memory_limit, short_circuit, pretests_only):
         submission_id = self.current_submission
@@ -146,7 +274,16 @@ class Judge(object):
         # the compiler may have failed, or an error could have happened while initializing a custom judge
         # either way, we can't continue
         if binary:
+            self.current_job.grader = grader
             self.packet_manager.begin_grading_packet(problem.is_pretested)
+            expect_launches(binary, sum(len(case.batched_cases) if isinstance(case, BatchedTestCase) else 1
+                                        for case in problem.cases))
+
+            workers = self.get_case_parallelism(grader, problem)
+            if workers > 1:
+                results = self.grade_cases_parallel(grader, problem.cases, workers, short_circuit=short_circuit)
+            else:
+                results = self.grade_cases(grader, problem.cases, short_circuit=short_circuit)
 
             batch_counter = 1
             in_batch = False
@@ -154,7 +291,7 @@ class Judge(object):
             # cases are indexed at 1
             case_number = 1
             try:
-                for result in self.grade_cases(grader, problem.cases, short_circuit=short_circuit):
+                for result in results:
                     if isinstance(result, BatchBegin):
                         self.packet_manager.batch_begin_packet()
                         print ansi_style("#ansi[Batch #%d](yellow|bold)" % batch_counter)
@@ -195,19 +332,50 @@ class Judge(object):
 
         print ansi_style('Done grading #ansi[%s](yellow)/#ansi[%s](green|bold).' % (problem_id, submission_id))
         print
-        self._terminate_grading = False
-        self.current_submission_thread = None
-        self.current_submission = None
-        self.current_grader = None
 
-    def grade_cases(self, grader, cases, short_circuit=False, is_short_circuiting=False):
+    def get_case_parallelism(self, grader, problem):
+        """
+        Returns the number of test cases of a problem that may be graded at once.
+
+        Problems opt in with the `parallel_cases` key in their init.yml: `true` uses as many workers as the judge
+        allows, while a number caps the workers for that problem.
+        """
+        workers = problem.config.parallel_cases
+        if not workers or not grader.supports_parallel:
+            return 1
+        if workers is True:
+            return self.parallel_case_limit
+        return max(1, min(int(workers), self.parallel_case_limit))
+
+    def grade_cases_parallel(self, grader, cases, workers, short_circuit=False):
+        pool = ThreadPool(workers)
+        jobs = {}
+
+        # Queue every case in grading order, so that the pool picks up earlier cases first.
+        for case in cases:
+            for queued in (case.batched_cases if isinstance(case, BatchedTestCase) else [case]):
+                job = CaseJob(grader, queued, self._case_slots, self._local, self.current_job)
+                jobs[queued] = job
+                pool.apply_async(job.run)
+        pool.close()
+
+        try:
+            for result in self.grade_cases(grader, cases, short_circuit=short_circuit, jobs=jobs):
+                yield result
+        finally:
+            # Only reached early if we are terminating or something broke, in which case nothing else matters.
+            for job in jobs.itervalues():
+                job.cancel()
+            pool.join()
+
+    def grade_cases(self, grader, cases, short_circuit=False, is_short_circuiting=False, jobs=None):
         for case in cases:
             # Yield notifying objects for batch begin/end, and unwrap all cases inside the batches
             if isinstance(case, BatchedTestCase):
                 yield BatchBegin()
                 for batched_case in self.grade_cases(grader, case.batched_cases,
                                           short_circuit=case.config['short_circuit'],
-                                          is_short_circuiting=is_short_circuiting):
+                                          is_short_circuiting=is_short_circuiting, jobs=jobs):
                     if (batched_case.result_flag & Result.WA) > 0 and not case.points:
                         is_short_circuiting = True
                     yield batched_case
@@ -216,6 +384,8 @@ class Judge(object):
 
             # Stop grading if we're short circuiting
             if is_short_circuiting:
+                if jobs is not None:
+                    jobs[case].cancel()
                 result = Result(case)
                 result.result_flag = Result.SC
                 yield result
@@ -227,7 +397,7 @@ class Judge(object):
             if self._terminate_grading:
                 raise TerminateGrading()
 
-            result = grader.grade(case)
+            result = grader.grade(case) if jobs is None else jobs[case].wait()
 
             # If the WA bit of result_flag is set and we are set to short-circuit (e.g., in a batch),
             # short circuit the rest of the cases.
@@ -279,16 +449,23 @@ class Judge(object):
         # Logs can contain ANSI, and it'll display fine
         print >> sys.stderr, message
 
-    def terminate_grading(self):
+    def terminate_grading(self, id=None):
         """
-        Forcefully terminates the current submission. Not necessarily safe.
+        Forcefully terminates the given submission, or all current submissions if none is given.
+        Not necessarily safe.
         """
-        if self.current_submission_thread:
-            self._terminate_grading = True
-            if self.current_grader:
-                self.current_grader.terminate()
-            self.current_submission_thread.join()
-            self.current_submission_thread = None
+        with self._jobs_lock:
+            if id is None:
+                jobs = self._jobs.values()
+            else:
+                jobs = [self._jobs[id]] if id in self._jobs else []
+
+        for job in jobs:
+            job.terminating = True
+            if job.grader:
+                job.grader.terminate_grading()
+        for job in jobs:
+            job.thread.join()
 
     def listen(self):
         """
@@ -378,6 +555,8 @@ def judge_proc(need_monitor):
     if hasattr(signal, 'SIGUSR2'):
         def update_problem_signal(signum, frame):
             logging.getLogger('signal').info('Received SIGUSR2, updating problems.')
+            # The manager's monitor saw something change, but not what, so forget every cached problem.
+            problem_cache.clear()
             judge.update_problems()
 
         signal.signal(signal.SIGUSR2, update_problem_signal)
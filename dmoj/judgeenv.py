@@ -20,7 +20,7 @@ _root = os.path.dirname(__file__)
 fs_encoding = os.environ.get('DMOJ_ENCODING', sys.getfilesystemencoding())
 
 log_file = server_host = server_port = no_ansi = no_ansi_emu = no_watchdog = problem_regex = case_regex = None
-secure = no_cert_check = False
+secure = no_cert_check = revalidate = False
 cert_store = api_listen = None
 
 startup_warnings = []
@@ -38,7 +38,7 @@ def unicodify(string):
 def load_env(cli=False, testsuite=False):  # pragma: no cover
     global problem_dirs, only_executors, exclude_executors, log_file, server_host, \
         server_port, no_ansi, no_ansi_emu, env, startup_warnings, no_watchdog, \
-        problem_regex, case_regex, api_listen, secure, no_cert_check, cert_store
+        problem_regex, case_regex, api_listen, secure, no_cert_check, cert_store, revalidate
     parser = argparse.ArgumentParser(description='''
         Spawns a judge for a submission server.
     ''')
@@ -78,6 +78,8 @@ def load_env(cli=False, testsuite=False):  # pragma: no cover
     _group.add_argument('-x', '--exclude-executors',
                         help='prevent listed executors from loading (comma-separated)')
 
+    parser.add_argument('--revalidate', action='store_true',
+                        help='self-test all executors, even those cached as working with unchanged runtimes')
     parser.add_argument('--no-ansi', action='store_true', help='disable ANSI output')
     if os.name == 'nt':
         parser.add_argument('--no-ansi-emu', action='store_true', help='disable ANSI emulation on Windows')
@@ -94,6 +96,7 @@ def load_env(cli=False, testsuite=False):  # pragma: no cover
 
     no_ansi_emu = args.no_ansi_emu if os.name == 'nt' else True
     no_ansi = args.no_ansi
+    revalidate = args.revalidate
     no_watchdog = True if cli else args.no_watchdog
     if not cli:
         api_listen = (args.api_host, args.api_port) if args.api_port else None
@@ -209,4 +212,4 @@ def get_supported_problems():
 
 def get_runtime_versions():
     from dmoj.executors import executors
-    return {name: clazz.Executor.get_runtime_versions() for name, clazz in executors.iteritems()}
+    return executors.get_runtime_versions()
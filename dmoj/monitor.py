@@ -5,6 +5,7 @@ from urllib2 import urlopen
 
 from dmoj import judgeenv
 from dmoj.judgeenv import startup_warnings, get_problem_roots
+from dmoj.problem import problem_cache
 from dmoj.utils.ansi import ansi_style
 
 try:
@@ -54,6 +55,9 @@ class SendProblemsHandler(FileSystemEventHandler):
         self.callback = None
 
     def on_any_event(self, event):
+        problem_cache.invalidate(event.src_path)
+        if getattr(event, 'dest_path', None):
+            problem_cache.invalidate(event.dest_path)
         if self.callback is not None:
             self.callback()
         if self.refresher is not None:
@@ -1,21 +1,36 @@
-import json
+import collections
+import errno
 import logging
 import os
+import select
 import socket
 import struct
 import threading
 import time
 import traceback
 import zlib
+from Queue import Queue, Empty
 
 from dmoj import sysinfo
-from dmoj.judgeenv import get_supported_problems, get_runtime_versions
+from dmoj.judgeenv import env, get_supported_problems, get_runtime_versions
+from dmoj.packet_codec import JSONCodec, get_codec, get_codec_names
+from dmoj.packet_journal import DEFAULT_JOURNAL_SIZE, PacketJournal
 
 try:
     import ssl
 except ImportError:
     ssl = None
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+if ssl is not None and hasattr(ssl, 'SSLWantReadError'):
+    _WOULD_BLOCK = (ssl.SSLWantReadError, ssl.SSLWantWriteError)
+else:
+    _WOULD_BLOCK = ()
+
 log = logging.getLogger(__name__)
 timer = time.clock if os.name == 'nt' else time.time
 
@@ -26,6 +41,14 @@ class JudgeAuthenticationFailed(Exception):
 
 class PacketManager(object):
     SIZE_PACK = struct.Struct('!I')
+    # Packets that may be coalesced into multi-event packets, for sites that accept them.
+    EVENT_PACKETS = frozenset(['test-case-status', 'batch-begin', 'batch-end'])
+    # Packets handled by the I/O thread as soon as they arrive, rather than waiting behind submissions.
+    CONTROL_PACKETS = frozenset(['ping', 'get-current-submission', 'packet-ack'])
+    # Packets kept in the journal until acknowledged, for sites that acknowledge packets.
+    JOURNALED_PACKETS = frozenset(['grading-begin', 'grading-end', 'test-case-status', 'batch-begin', 'batch-end',
+                                   'compile-error', 'compile-message', 'internal-error', 'submission-terminated',
+                                   'invocation-begin', 'invocation-end'])
 
     def __init__(self, host, port, judge, name, key, secure=False, no_cert_check=False, cert_store=None):
         self.host = host
@@ -58,14 +81,63 @@ class PacketManager(object):
         self.cert_store = cert_store
 
         self._lock = threading.RLock()
-        self._batch = 0
+        # The number of the current batch of each submission being graded.
+        self._batches = {}
+
+        # Events are held back until event_flush_count of them, or about event_flush_bytes of them, are pending,
+        # or the oldest has waited event_flush_delay seconds, or any other packet is sent.
+        self.event_flush_count = env.get('event_flush_count', 32)
+        self.event_flush_bytes = env.get('event_flush_bytes', 65536)
+        self.event_flush_delay = env.get('event_flush_delay', 0.25)
+        self.multi_event = False
+        self._events = []
+        self._events_size = 0
+        self._events_timer = None
+
+        # Packets are written by a dedicated I/O thread; other threads only queue them, and wait while
+        # packet_queue_size packets are already queued. Replies to pings skip ahead of the queue.
+        self.queue_size = env.get('packet_queue_size', 1024)
+        self.queue_stalls = 0
+        self.queue_stall_time = 0.0
+        self.reconnects = 0
+        self._queue_full = False
+        self._closing = False
+        self._outbound = collections.deque()
+        self._urgent = collections.deque()
+        self._queue_space = threading.Condition(self._lock)
+        self._sending = None
+        self._send_buffer = ''
+        self._send_offset = 0
+        self._recv_buffer = bytearray()
+        self._inbound = Queue()
+        self._io_thread = None
+        self._exit_code = None
+        if os.name == 'nt':
+            # select() only takes sockets here, so the I/O thread polls for queued packets instead.
+            self._wake_read = self._wake_write = None
+        else:
+            self._wake_read, self._wake_write = os.pipe()
+            fcntl.fcntl(self._wake_write, fcntl.F_SETFL, fcntl.fcntl(self._wake_write, fcntl.F_GETFL) | os.O_NONBLOCK)
+
+        # Results are journaled until the site acknowledges them, so that a dropped connection costs a replay rather
+        # than a rejudge. The journal is only on disk if packet_journal_dir is set.
+        self.packet_ack = False
+        self.journal = PacketJournal(env.packet_journal_dir, env.packet_journal_size or DEFAULT_JOURNAL_SIZE)
+
         # Exponential backoff: starting at 4 seconds.
         # Certainly hope it won't stack overflow, since it will take days if not years.
         self.fallback = 4
 
         self.conn = None
+        self.codec = JSONCodec()
         self._do_reconnect()
 
+        sysinfo.report_callbacks.append(lambda: ('packet-queue', self.queue_stats()))
+        sysinfo.report_callbacks.append(lambda: ('packet-journal', self.journal.stats()))
+        self._io_thread = threading.Thread(target=self._io_loop, name='packet-io')
+        self._io_thread.daemon = True
+        self._io_thread.start()
+
     def _connect(self):
         problems = get_supported_problems()
         versions = get_runtime_versions()
@@ -80,11 +152,27 @@ class PacketManager(object):
             self.conn = self.ssl_context.wrap_socket(self.conn, server_hostname=self.host)
 
         log.info('Starting handshake with: [%s]:%s', self.host, self.port)
-        self.input = self.conn.makefile('r')
-        self.output = self.conn.makefile('w', 0)
+        # The handshake is always in JSON, which every site understands; the response selects the codec after it.
+        self.codec = JSONCodec()
+        self.multi_event = False
+        self.packet_ack = False
         self.handshake(problems, versions, self.name, self.key)
+        self.conn.setblocking(0)
         log.info('Judge "%s" online: [%s]:%s', self.name, self.host, self.port)
 
+        # Replay what the previous connection, or judge, didn't get acknowledged ahead of everything else queued.
+        with self._lock:
+            pending = self.journal.pending()
+            if pending:
+                log.info('Replaying %d unacknowledged packets to: [%s]:%s', len(pending), self.host, self.port)
+                self._outbound.extendleft(reversed(pending))
+            if not self.packet_ack:
+                # No acknowledgements will come from this site.
+                self.journal.clear()
+
+        # Send whatever was held back from the previous connection, one by one if this site can't take them together.
+        self.flush_events()
+
     def _reconnect(self):
         if self.fallback > 86400:
             # Return 0 to avoid supervisor restart.
@@ -94,6 +182,7 @@ class PacketManager(object):
         if self.conn is not None:
             log.info('Dropping old connection.')
             self.conn.close()
+        self._reset_transfers()
         time.sleep(self.fallback)
         self.fallback *= 1.5
         self._do_reconnect()
@@ -108,57 +197,285 @@ class PacketManager(object):
             log.exception('Connection failed due to socket error: [%s]:%s', self.host, self.port)
             self._reconnect()
 
+    def _is_journaled(self, packet):
+        if packet['name'] == 'multi-event':
+            return 'seq' in packet['events'][0]
+        return 'seq' in packet
+
+    def _journal(self, packet):
+        # Must be called with self._lock held.
+        if self.packet_ack and packet['name'] in self.JOURNALED_PACKETS:
+            self.journal.append(packet.get('submission-id', packet.get('invocation-id')), packet)
+
+    def _reset_transfers(self):
+        with self._lock:
+            # A packet cut off by the connection dropping is sent again in full, except a stale reply to a ping.
+            # Journaled packets are instead replayed from the journal after the handshake.
+            self._outbound = collections.deque(packet for packet in self._outbound if not self._is_journaled(packet))
+            if (self._sending is not None and self._sending['name'] != 'ping-response' and
+                    not self._is_journaled(self._sending)):
+                self._outbound.appendleft(self._sending)
+            self._sending = None
+            self._send_buffer = ''
+            self._send_offset = 0
+            self._urgent.clear()
+        self._recv_buffer = bytearray()
+
     def __del__(self):
-        self.conn.shutdown(socket.SHUT_RDWR)
+        if self.conn is not None and not self._closing:
+            try:
+                self.conn.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
 
     def _read_async(self):
         try:
             while True:
-                self._receive_packet(self._read_single())
+                try:
+                    # Blocking forever here would keep KeyboardInterrupt from ever being delivered.
+                    packet = self._inbound.get(timeout=60)
+                except Empty:
+                    continue
+                if packet is None:
+                    raise SystemExit(self._exit_code)
+                self._receive_packet(packet)
         except KeyboardInterrupt:
             pass
-        except Exception:  # connection reset by peer
+        except Exception:
             traceback.print_exc()
             raise SystemExit(1)
 
-    def _read_single(self):
-        try:
-            data = self.input.read(PacketManager.SIZE_PACK.size)
-        except socket.error:
-            self._reconnect()
-            return self._read_single()
-        if not data:
-            self._reconnect()
-            return self._read_single()
-        size = PacketManager.SIZE_PACK.unpack(data)[0]
-        try:
-            packet = self.input.read(size).decode('zlib')
-        except zlib.error:
-            self._reconnect()
-            return self._read_single()
-        else:
-            return json.loads(packet)
-
     def run(self):
         self._read_async()
 
     def run_async(self):
         threading.Thread(target=self._read_async).start()
 
+    def _io_loop(self):
+        try:
+            while not (self._closing and not self._next_frame()):
+                try:
+                    self._pump()
+                except (socket.error, zlib.error, ValueError) as e:
+                    if self._closing:
+                        break
+                    log.warning('Lost connection to [%s]:%s: %s', self.host, self.port, e)
+                    self.reconnects += 1
+                    self._reconnect()
+            self.conn.close()
+        except SystemExit as e:
+            self._exit_code = e.code
+        except Exception:
+            traceback.print_exc()
+            self._exit_code = 1
+        # Wake the thread dispatching packets, so that it exits too.
+        self._inbound.put(None)
+
+    def _pump(self):
+        writing = self._next_frame()
+        readers = [self.conn]
+        timeout = 0.05
+        if self._wake_read is not None:
+            readers.append(self._wake_read)
+            timeout = None
+        if self.ssl_context and self.conn.pending():
+            # Data already decrypted is invisible to select().
+            timeout = 0
+
+        try:
+            readable, writable, _ = select.select(readers, [self.conn] if writing else [], [], timeout)
+        except select.error as e:
+            if e.args[0] != errno.EINTR:
+                raise
+            return
+
+        if self._wake_read in readable:
+            os.read(self._wake_read, 4096)
+        if self.conn in readable or timeout == 0:
+            self._receive()
+        if writable:
+            self._send()
+
+    def _next_frame(self):
+        """
+        Makes sure the frame being sent is encoded, and returns whether there is one.
+        """
+        while not self._send_buffer:
+            with self._lock:
+                if self._urgent:
+                    packet = self._urgent.popleft()
+                elif self._outbound:
+                    packet = self._outbound.popleft()
+                    self._queue_space.notify_all()
+                    if self._queue_full and len(self._outbound) < self.queue_size // 2:
+                        self._queue_full = False
+                        log.info('Outbound packet queue drained: [%s]:%s', self.host, self.port)
+                else:
+                    return False
+
+                # The site may have changed since the events were put together.
+                if packet['name'] == 'multi-event' and not self.multi_event:
+                    self._outbound.extendleft(reversed(packet['events']))
+                    continue
+
+            try:
+                raw = self.codec.encode(packet)
+            except Exception:
+                log.exception('Failed to encode packet: %s', packet['name'])
+                continue
+            self._sending = packet
+            self._send_buffer = PacketManager.SIZE_PACK.pack(len(raw)) + raw
+            self._send_offset = 0
+        return True
+
+    def _send(self):
+        # Keep writing frames until the socket is full, rather than going back to select() after each.
+        while True:
+            try:
+                self._send_offset += self.conn.send(buffer(self._send_buffer, self._send_offset))
+            except _WOULD_BLOCK:
+                return
+            except socket.error as e:
+                if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    raise
+                return
+
+            if self._send_offset < len(self._send_buffer):
+                return
+            with self._lock:
+                self._sending = None
+                self._send_buffer = ''
+            if not self._next_frame():
+                return
+
+    def _receive(self):
+        while True:
+            try:
+                data = self.conn.recv(65536)
+            except _WOULD_BLOCK:
+                break
+            except socket.error as e:
+                if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    raise
+                break
+            if not data:
+                raise socket.error(errno.ECONNRESET, 'connection closed by site')
+            self._recv_buffer += data
+            if not (self.ssl_context and self.conn.pending()):
+                break
+
+        pending = self._recv_buffer
+        while len(pending) >= PacketManager.SIZE_PACK.size:
+            size = PacketManager.SIZE_PACK.unpack_from(pending)[0]
+            end = PacketManager.SIZE_PACK.size + size
+            if len(pending) < end:
+                break
+            packet = self.codec.decode(str(pending[PacketManager.SIZE_PACK.size:end]))
+            del pending[:end]
+
+            if packet['name'] in self.CONTROL_PACKETS:
+                self._receive_packet(packet)
+            else:
+                self._inbound.put(packet)
+
+    def _wake(self):
+        if self._wake_write is not None:
+            try:
+                os.write(self._wake_write, '\0')
+            except OSError as e:
+                # A full pipe will wake the I/O thread anyway.
+                if e.errno != errno.EAGAIN:
+                    raise
+
+    def _wait_for_space(self):
+        # The I/O thread drains the queue, so it must never wait for it.
+        if threading.current_thread() is self._io_thread:
+            return
+        with self._lock:
+            if len(self._outbound) < self.queue_size:
+                return
+            if not self._queue_full:
+                self._queue_full = True
+                log.warning('Outbound packet queue is full, waiting on [%s]:%s', self.host, self.port)
+            self.queue_stalls += 1
+            start = time.time()
+            while len(self._outbound) >= self.queue_size and self._exit_code is None:
+                self._queue_space.wait(1)
+            self.queue_stall_time += time.time() - start
+
+    def close(self):
+        """
+        Sends every queued packet, then closes the connection and stops the I/O thread.
+        """
+        self.flush_events()
+        self._closing = True
+        self._wake()
+        self._io_thread.join()
+
+    def queue_stats(self):
+        with self._lock:
+            return {'queued': len(self._outbound) + len(self._events),
+                    'capacity': self.queue_size,
+                    'stalls': self.queue_stalls,
+                    'stall-time': round(self.queue_stall_time, 3),
+                    'reconnects': self.reconnects}
+
     def _send_packet(self, packet, rewrite=True):
         if rewrite and 'submission-id' in packet and self.judge.get_process_type() != 'submission':
             packet['%s-id' % self.judge.get_process_type()] = packet['submission-id']
             del packet['submission-id']
 
-        for k, v in packet.items():
-            if isinstance(v, str):
-                # Make sure we don't have any garbage utf-8 from e.g. weird compilers
-                # *cough* fpc *cough* that could cause this routine to crash
-                packet[k] = v.decode('utf-8', 'replace')
+        # Waiting before taking the lock lets packets overshoot the queue a little, but keeps them in order.
+        self._wait_for_space()
+        with self._lock:
+            if self.multi_event and packet['name'] in self.EVENT_PACKETS:
+                self._queue_event(packet)
+            else:
+                # Held back events come first, to keep packets in order.
+                self._flush_events()
+                self._journal(packet)
+                self._outbound.append(packet)
+        self._wake()
+
+    def _send_urgent(self, packet):
+        with self._lock:
+            self._urgent.append(packet)
+        self._wake()
+
+    def _queue_event(self, packet):
+        # Must be called with self._lock held.
+        self._events.append(packet)
+        self._events_size += 32 + sum(len(v) for v in packet.itervalues() if isinstance(v, basestring))
+        if len(self._events) >= self.event_flush_count or self._events_size >= self.event_flush_bytes:
+            self._flush_events()
+        elif self._events_timer is None:
+            self._events_timer = threading.Timer(self.event_flush_delay, self.flush_events)
+            self._events_timer.daemon = True
+            self._events_timer.start()
+
+    def _flush_events(self):
+        # Must be called with self._lock held.
+        if self._events_timer is not None:
+            self._events_timer.cancel()
+            self._events_timer = None
+        if not self._events:
+            return
+
+        events, self._events, self._events_size = self._events, [], 0
+        for event in events:
+            self._journal(event)
+        if self.multi_event:
+            self._outbound.append({'name': 'multi-event', 'events': events})
+        else:
+            self._outbound.extend(events)
 
-        raw = json.dumps(packet).encode('zlib')
+    def flush_events(self):
+        """
+        Queues every held back event now.
+        """
         with self._lock:
-            self.output.writelines((PacketManager.SIZE_PACK.pack(len(raw)), raw))
+            self._flush_events()
+        self._wake()
 
     def _receive_packet(self, packet):
         name = packet['name']
@@ -166,6 +483,8 @@ class PacketManager(object):
             self.ping_packet(packet['when'])
         elif name == 'get-current-submission':
             self.current_submission_packet()
+        elif name == 'packet-ack':
+            self.journal.ack(packet['seq'])
         elif name == 'submission-request':
             self.submission_acknowledged_packet(packet['submission-id'])
             self.judge.begin_grading(
@@ -178,7 +497,6 @@ class PacketManager(object):
                 packet['short-circuit'],
                 packet['pretests-only']
             )
-            self._batch = 0
             log.info('Accept submission: %d: executor: %s, code: %s',
                      packet['submission-id'], packet['language'], packet['problem-id'])
         elif name == 'invocation-request':
@@ -193,23 +511,29 @@ class PacketManager(object):
             )
             log.info('Accept invocation: %d: executor: %s', packet['invocation-id'], packet['language'])
         elif name == 'terminate-submission':
-            log.info('Received abortion request for %s', self.judge.current_submission)
-            self.judge.terminate_grading()
+            # Sites grading one submission at a time don't say which submission to abort.
+            sub_id = packet.get('submission-id')
+            log.info('Received abortion request for %s', sub_id if sub_id is not None else 'all submissions')
+            self.judge.terminate_grading(sub_id)
         else:
             log.error('Unknown packet %s, payload %s', name, packet)
 
     def handshake(self, problems, runtimes, id, key):
-        self._send_packet({'name': 'handshake',
-                           'problems': problems,
-                           'executors': runtimes,
-                           'id': id,
-                           'key': key})
+        # Written directly on the still blocking socket, since queued packets must wait until the site has accepted
+        # the judge.
+        raw = self.codec.encode({'name': 'handshake',
+                                 'problems': problems,
+                                 'executors': runtimes,
+                                 'id': id,
+                                 'key': key,
+                                 'codecs': get_codec_names(),
+                                 'features': (['multi-event'] if self.event_flush_count > 1 else []) +
+                                             ['packet-ack']})
+        self.conn.sendall(PacketManager.SIZE_PACK.pack(len(raw)) + raw)
         log.info('Awaiting handshake response: [%s]:%s', self.host, self.port)
         try:
-            data = self.input.read(PacketManager.SIZE_PACK.size)
-            size = PacketManager.SIZE_PACK.unpack(data)[0]
-            packet = self.input.read(size).decode('zlib')
-            resp = json.loads(packet)
+            size = PacketManager.SIZE_PACK.unpack(self._recv_exact(PacketManager.SIZE_PACK.size))[0]
+            resp = self.codec.decode(self._recv_exact(size))
         except Exception:
             log.exception('Cannot understand handshake response: [%s]:%s', self.host, self.port)
             raise JudgeAuthenticationFailed()
@@ -218,6 +542,33 @@ class PacketManager(object):
                 log.error('Handshake failed.')
                 raise JudgeAuthenticationFailed()
 
+        # Sites that predate codec negotiation don't pick one, and keep to JSON.
+        try:
+            self.codec = get_codec(resp.get('codec', 'json'))
+        except ValueError:
+            log.error('Site selected unsupported packet codec: %s', resp.get('codec'))
+            raise JudgeAuthenticationFailed()
+        log.info('Using packet codec: %s', self.codec.name)
+
+        # Sites that don't list the feature back get every event in a packet of its own.
+        features = resp.get('features') or ()
+        self.multi_event = 'multi-event' in features
+        if self.multi_event:
+            log.info('Coalescing grading events into multi-event packets')
+        self.packet_ack = 'packet-ack' in features
+        if self.packet_ack:
+            log.info('Journaling packets until acknowledged')
+
+    def _recv_exact(self, size):
+        data = []
+        while size:
+            chunk = self.conn.recv(min(size, 65536))
+            if not chunk:
+                raise socket.error(errno.ECONNRESET, 'connection closed by site')
+            data.append(chunk)
+            size -= len(chunk)
+        return ''.join(data)
+
     def invocation_begin_packet(self):
         log.info('Begin invoking: %d', self.judge.current_submission)
         self._send_packet({'name': 'invocation-begin',
@@ -277,24 +628,28 @@ class PacketManager(object):
 
     def begin_grading_packet(self, is_pretested):
         log.info('Begin grading: %d', self.judge.current_submission)
+        self._batches[self.judge.current_submission] = 0
         self._send_packet({'name': 'grading-begin',
                            'submission-id': self.judge.current_submission,
                            'pretested': is_pretested})
 
     def grading_end_packet(self):
         log.info('End grading: %d', self.judge.current_submission)
+        self._batches.pop(self.judge.current_submission, None)
         self.fallback = 4
         self._send_packet({'name': 'grading-end',
                            'submission-id': self.judge.current_submission})
 
     def batch_begin_packet(self):
-        self._batch += 1
-        log.info('Enter batch number %d: %d', self._batch, self.judge.current_submission)
+        submission = self.judge.current_submission
+        batch = self._batches[submission] = self._batches.get(submission, 0) + 1
+        log.info('Enter batch number %d: %d', batch, submission)
         self._send_packet({'name': 'batch-begin',
                            'submission-id': self.judge.current_submission})
 
     def batch_end_packet(self):
-        log.info('Exit batch number %d: %d', self._batch, self.judge.current_submission)
+        log.info('Exit batch number %d: %d', self._batches.get(self.judge.current_submission, 0),
+                 self.judge.current_submission)
         self._send_packet({'name': 'batch-end',
                            'submission-id': self.judge.current_submission})
 
@@ -305,6 +660,7 @@ class PacketManager(object):
 
     def submission_terminated_packet(self):
         log.info('Submission aborted: %d', self.judge.current_submission)
+        self._batches.pop(self.judge.current_submission, None)
         self._send_packet({'name': 'submission-terminated',
                            'submission-id': self.judge.current_submission})
 
@@ -315,7 +671,8 @@ class PacketManager(object):
         for fn in sysinfo.report_callbacks:
             key, value = fn()
             data[key] = value
-        self._send_packet(data)
+        # Answered ahead of everything queued, so the site doesn't think the judge is dead while it sends results.
+        self._send_urgent(data)
 
     def submission_acknowledged_packet(self, sub_id):
         self._send_packet({'name': 'submission-acknowledged',
@@ -0,0 +1,133 @@
+"""
+Measures the packet codecs and multi-event coalescing end to end, by grading simulated submissions against a local stand-in for the site.
+
+Usage: python -m dmoj.packet_benchmark [-s SUBMISSIONS] [-c CASES]
+"""
+
+import argparse
+import logging
+import random
+import socket
+import struct
+import threading
+import time
+
+from dmoj.packet import PacketManager
+from dmoj.packet_codec import JSONCodec, get_codec, get_codec_names
+from dmoj.result import Result
+
+
+class StandInServer(threading.Thread):
+    """
+    Accepts a single judge, completes the handshake selecting the given codec and, if multi_event is set, accepting
+    multi-event packets, and then counts the events, packets and bytes received, decoding every packet as a site
+    would.
+    """
+    SIZE_PACK = struct.Struct('!I')
+
+    def __init__(self, codec_name, multi_event, expected):
+        super(StandInServer, self).__init__()
+        self.daemon = True
+        self.codec_name = codec_name
+        self.multi_event = multi_event
+        self.expected = expected
+        self.events = 0
+        self.packets = 0
+        self.bytes = 0
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(1)
+        self.port = self.sock.getsockname()[1]
+        self.done = threading.Event()
+
+    def _read_packet(self, input):
+        size = self.SIZE_PACK.unpack(input.read(self.SIZE_PACK.size))[0]
+        return size + self.SIZE_PACK.size, input.read(size)
+
+    def run(self):
+        conn, _ = self.sock.accept()
+        input = conn.makefile('r')
+        output = conn.makefile('w', 0)
+
+        _, data = self._read_packet(input)
+        assert JSONCodec().decode(data)['name'] == 'handshake'
+        raw = JSONCodec().encode({'name': 'handshake-success', 'codec': self.codec_name,
+                                  'features': ['multi-event'] if self.multi_event else []})
+        output.write(self.SIZE_PACK.pack(len(raw)) + raw)
+
+        codec = get_codec(self.codec_name)
+        while self.events < self.expected:
+            size, data = self._read_packet(input)
+            packet = codec.decode(data)
+            self.events += len(packet['events']) if packet['name'] == 'multi-event' else 1
+            self.packets += 1
+            self.bytes += size
+        self.done.set()
+
+        # Wait for the judge to hang up first.
+        input.read()
+        conn.close()
+
+
+class StandInJudge(object):
+    current_submission = 1
+
+    def get_process_type(self):
+        return 'submission'
+
+
+class StandInCase(object):
+    def __init__(self, points):
+        self.points = points
+        self.output_prefix_length = 64
+
+
+def make_results(cases):
+    results = []
+    for position in xrange(cases):
+        result = Result(StandInCase(10))
+        result.execution_time = random.uniform(0, 2)
+        result.max_memory = random.randint(1024, 262144)
+        result.points = 10
+        result.proc_output = '%d\n' % random.randint(0, 1 << 60)
+        results.append(result)
+    return results
+
+
+def benchmark(codec_name, multi_event, submissions, cases):
+    results = make_results(cases)
+    per_submission = cases + 2
+    server = StandInServer(codec_name, multi_event, submissions * per_submission)
+    server.start()
+
+    manager = PacketManager('127.0.0.1', server.port, StandInJudge(), 'benchmark', 'key')
+    start = time.time()
+    for id in xrange(submissions):
+        manager.judge.current_submission = id
+        manager.begin_grading_packet(False)
+        for position, result in enumerate(results, 1):
+            manager.test_case_status_packet(position, result)
+        manager.grading_end_packet()
+    server.done.wait()
+    elapsed = time.time() - start
+    manager.close()
+    return server.events / elapsed, server.packets / float(submissions), server.bytes / float(submissions)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measures packet throughput and size for each packet codec.')
+    parser.add_argument('-s', '--submissions', type=int, default=1000, help='submissions to send')
+    parser.add_argument('-c', '--cases', type=int, default=20, help='test cases in each submission')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    print '%-10s %-12s %10s %20s %18s' % ('codec', 'multi-event', 'events/s', 'packets/submission',
+                                          'bytes/submission')
+    for name in get_codec_names():
+        for multi_event in (False, True):
+            rate, packets, size = benchmark(name, multi_event, args.submissions, args.cases)
+            print '%-10s %-12s %10.0f %20.1f %18.0f' % (name, 'yes' if multi_event else 'no', rate, packets, size)
+
+
+if __name__ == '__main__':
+    main()
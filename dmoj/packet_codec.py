@@ -0,0 +1,151 @@
+import json
+import struct
+import zlib
+
+from dmoj.judgeenv import env
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+DEFAULT_COMPRESS_THRESHOLD = 1024
+
+# The fields of each packet, in the order the binary codec sends them. A packet's index in this list is its tag on the
+# wire, so packets may only ever be appended, and fields never changed.
+PACKET_SCHEMAS = [
+    ('handshake', ('problems', 'executors', 'id', 'key')),
+    ('handshake-success', ()),
+    ('ping', ('when',)),
+    ('ping-response', ('when', 'time')),
+    ('get-current-submission', ()),
+    ('current-submission-id', ('submission-id',)),
+    ('submission-request', ('submission-id', 'problem-id', 'language', 'source', 'time-limit', 'memory-limit',
+                            'short-circuit', 'pretests-only')),
+    ('submission-acknowledged', ('submission-id',)),
+    ('invocation-request', ('invocation-id', 'language', 'source', 'time-limit', 'memory-limit', 'input-data')),
+    ('invocation-begin', ('invocation-id',)),
+    ('invocation-end', ('invocation-id', 'output', 'status', 'time', 'memory', 'feedback')),
+    ('terminate-submission', ('submission-id',)),
+    ('supported-problems', ('problems',)),
+    ('grading-begin', ('submission-id', 'pretested')),
+    ('grading-end', ('submission-id',)),
+    ('batch-begin', ('submission-id',)),
+    ('batch-end', ('submission-id',)),
+    ('test-case-status', ('submission-id', 'position', 'status', 'time', 'points', 'total-points', 'memory',
+                          'output', 'feedback')),
+    ('compile-error', ('submission-id', 'log')),
+    ('compile-message', ('submission-id', 'log')),
+    ('internal-error', ('submission-id', 'message')),
+    ('submission-terminated', ('submission-id',)),
+    ('multi-event', ('events',)),
+]
+PACKET_TAGS = {name: (tag, fields, frozenset(fields)) for tag, (name, fields) in enumerate(PACKET_SCHEMAS)}
+
+
+def sanitize_packet(packet):
+    """
+    Decodes the str values of packet, and of the events in it, as UTF-8 in place, so that it can be dumped as JSON.
+    """
+    for k, v in packet.items():
+        if isinstance(v, str):
+            # Make sure we don't have any garbage utf-8 from e.g. weird compilers
+            # *cough* fpc *cough* that could cause this routine to crash
+            packet[k] = v.decode('utf-8', 'replace')
+        elif k == 'events':
+            for event in v:
+                sanitize_packet(event)
+    return packet
+
+
+class JSONCodec(object):
+    """
+    The original encoding, which every site understands: zlib-compressed JSON.
+    """
+    name = 'json'
+
+    def encode(self, packet):
+        return json.dumps(sanitize_packet(packet)).encode('zlib')
+
+    def decode(self, data):
+        return json.loads(data.decode('zlib'))
+
+
+class MsgpackCodec(object):
+    """
+    A compact binary encoding: a flags byte, then a msgpack body, compressed with zlib if flags has bit 0 set.
+
+    A packet in PACKET_SCHEMAS is sent as [tag, [values in schema order]], with a third element mapping any other
+    keys to their values. Packets missing a schema field, or not in it at all, are sent as a plain map. The events of
+    a multi-event packet are themselves packets, and are sent the same way. Strings are sent as-is in the msgpack str
+    type, so receivers must decode them as UTF-8 with replacement, rather than the sender sanitizing every field.
+    """
+    name = 'msgpack'
+    FLAG_ZLIB = 1
+    FLAGS_PACK = struct.Struct('!B')
+
+    def __init__(self, compress_threshold=DEFAULT_COMPRESS_THRESHOLD):
+        self.compress_threshold = compress_threshold
+
+    def _encode_body(self, packet):
+        schema = PACKET_TAGS.get(packet['name'])
+        if schema is None:
+            return packet
+        tag, fields, field_set = schema
+        if not all(field in packet for field in fields):
+            return packet
+
+        values = [packet[field] for field in fields]
+        if packet['name'] == 'multi-event':
+            values[0] = map(self._encode_body, values[0])
+        body = [tag, values]
+        if len(packet) > len(fields) + 1:
+            body.append({k: v for k, v in packet.iteritems() if k != 'name' and k not in field_set})
+        return body
+
+    def _decode_body(self, body):
+        if isinstance(body, dict):
+            return body
+        try:
+            name, fields = PACKET_SCHEMAS[body[0]]
+            packet = dict(zip(fields, body[1]))
+            if len(body) > 2:
+                packet.update(body[2])
+            if name == 'multi-event':
+                packet['events'] = map(self._decode_body, packet['events'])
+        except (IndexError, KeyError, TypeError, ValueError):
+            raise ValueError('malformed packet: %r' % (body,))
+        packet['name'] = name
+        return packet
+
+    def encode(self, packet):
+        raw = msgpack.packb(self._encode_body(packet), use_bin_type=False)
+        if self.compress_threshold is not None and len(raw) >= self.compress_threshold:
+            return self.FLAGS_PACK.pack(self.FLAG_ZLIB) + zlib.compress(raw)
+        return self.FLAGS_PACK.pack(0) + raw
+
+    def decode(self, data):
+        if not data:
+            raise ValueError('empty packet')
+        flags = self.FLAGS_PACK.unpack_from(data)[0]
+        raw = data[self.FLAGS_PACK.size:]
+        if flags & self.FLAG_ZLIB:
+            raw = zlib.decompress(raw)
+
+        return self._decode_body(msgpack.unpackb(raw, raw=False, unicode_errors='replace'))
+
+
+def get_codec_names():
+    """
+    Returns the names of the codecs this judge can speak, in order of preference.
+    """
+    return ['msgpack', 'json'] if msgpack is not None else ['json']
+
+
+def get_codec(name):
+    if name == 'json':
+        return JSONCodec()
+    if name == 'msgpack' and msgpack is not None:
+        # A null threshold turns compression off altogether.
+        return MsgpackCodec(env.get('packet_compress_threshold', DEFAULT_COMPRESS_THRESHOLD))
+    raise ValueError('unsupported packet codec: %s' % name)
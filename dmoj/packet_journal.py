@@ -0,0 +1,201 @@
+import errno
+import json
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from dmoj.packet_codec import sanitize_packet
+
+log = logging.getLogger(__name__)
+
+DEFAULT_JOURNAL_SIZE = 67108864  # 64mb
+
+
+class _JournalFile(object):
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'a')
+        # Records in the file, and how many of those the site has yet to acknowledge.
+        self.records = 0
+        self.live = 0
+
+
+class PacketJournal(object):
+    """
+    The outbound packets the site has yet to acknowledge, in order of their sequence numbers.
+
+    Packets are kept in memory and, if root is set, in an append-only file per submission under root, so that they
+    survive the judge restarting. Each line of a file is a JSON record, either of a packet and its sequence number,
+    or of an acknowledgement of every packet up to a sequence number. Acknowledged packets are forgotten, a file is
+    deleted once all its packets are acknowledged, and rewritten once most of them are. When the journal grows past
+    max_size bytes, the packets of the submission with the oldest of them are dropped.
+    """
+
+    def __init__(self, root=None, max_size=DEFAULT_JOURNAL_SIZE):
+        self.root = root
+        self.max_size = max_size
+        self.size = 0
+        self.next_seq = 1
+        self.acked = 0
+        self.dropped = 0
+        self._packets = OrderedDict()
+        self._files = {}
+        self._lock = threading.Lock()
+
+        if root is not None:
+            try:
+                os.makedirs(root)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+            self._load()
+
+    def __len__(self):
+        return len(self._packets)
+
+    def _path(self, key):
+        return os.path.join(self.root, '%s.journal' % re.sub(r'[^\w-]', '_', key))
+
+    def _file(self, key):
+        journal = self._files.get(key)
+        if journal is None:
+            journal = self._files[key] = _JournalFile(self._path(key))
+        return journal
+
+    def _load(self):
+        records = {}
+        for name in os.listdir(self.root):
+            if not name.endswith('.journal'):
+                continue
+            key = name[:-len('.journal')]
+            with open(os.path.join(self.root, name)) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A record cut short by the judge dying while writing it.
+                        continue
+                    if 'ack' in record:
+                        self.acked = max(self.acked, record['ack'])
+                    else:
+                        records[record['seq']] = key, record['packet'], len(line)
+
+        self.next_seq = max(records.keys() + [self.acked]) + 1
+        for seq in sorted(records):
+            if seq <= self.acked:
+                continue
+            key, packet, size = records[seq]
+            self._packets[seq] = key, packet, size
+            self.size += size
+            self._file(key).live += 1
+
+        # Start every file afresh with only the packets still to be acknowledged.
+        for name in os.listdir(self.root):
+            if name.endswith('.journal') and name[:-len('.journal')] not in self._files:
+                os.unlink(os.path.join(self.root, name))
+        for key in self._files.keys():
+            self._rewrite(key)
+        if self._packets:
+            log.info('Loaded %d unacknowledged packets from journal: %s', len(self._packets), self.root)
+
+    def _rewrite(self, key):
+        journal = self._files[key]
+        journal.file.close()
+        temp = journal.path + '.tmp'
+        with open(temp, 'w') as f:
+            for seq, (packet_key, packet, _) in self._packets.iteritems():
+                if packet_key == key:
+                    f.write(json.dumps({'seq': seq, 'packet': packet}) + '\n')
+        os.rename(temp, journal.path)
+        journal.file = open(journal.path, 'a')
+        journal.records = journal.live
+
+    def _forget(self, key):
+        journal = self._files.pop(key, None)
+        if journal is not None:
+            journal.file.close()
+            try:
+                os.unlink(journal.path)
+            except OSError:
+                pass
+
+    def append(self, key, packet):
+        """
+        Records packet as sent for the submission key, numbering it by setting its seq field.
+        """
+        key = str(key)
+        with self._lock:
+            packet['seq'] = seq = self.next_seq
+            self.next_seq += 1
+            line = json.dumps({'seq': seq, 'packet': sanitize_packet(packet)}) + '\n'
+            self._packets[seq] = key, packet, len(line)
+            self.size += len(line)
+
+            if self.root is not None:
+                journal = self._file(key)
+                journal.file.write(line)
+                journal.file.flush()
+                journal.records += 1
+                journal.live += 1
+
+            while self.size > self.max_size and len(self._packets) > 1:
+                self._drop_oldest()
+
+    def _drop_oldest(self):
+        key = next(self._packets.itervalues())[0]
+        dropped = [seq for seq, (packet_key, _, _) in self._packets.iteritems() if packet_key == key]
+        for seq in dropped:
+            self.size -= self._packets.pop(seq)[2]
+        self.dropped += len(dropped)
+        if self.root is not None:
+            self._forget(key)
+        log.warning('Packet journal is full, dropped %d unacknowledged packets for %s', len(dropped), key)
+
+    def ack(self, seq):
+        """
+        Forgets every packet numbered up to seq, which the site has received.
+        """
+        with self._lock:
+            if seq <= self.acked:
+                return
+            self.acked = seq
+
+            touched = set()
+            while self._packets and next(iter(self._packets)) <= seq:
+                key, _, size = self._packets.popitem(last=False)[1]
+                self.size -= size
+                touched.add(key)
+                if self.root is not None:
+                    self._files[key].live -= 1
+
+            if self.root is None:
+                return
+            for key in touched:
+                journal = self._files[key]
+                if not journal.live:
+                    self._forget(key)
+                elif journal.records > 64 and journal.live * 2 < journal.records:
+                    self._rewrite(key)
+                else:
+                    journal.file.write(json.dumps({'ack': seq}) + '\n')
+                    journal.file.flush()
+
+    def pending(self):
+        """
+        Returns the unacknowledged packets, in the order they were sent.
+        """
+        with self._lock:
+            return [packet for _, packet, _ in self._packets.itervalues()]
+
+    def clear(self):
+        with self._lock:
+            if self.root is not None:
+                for key in self._files.keys():
+                    self._forget(key)
+            self._packets.clear()
+            self.size = 0
+
+    def stats(self):
+        return {'unacknowledged': len(self._packets), 'bytes': self.size, 'dropped': self.dropped}
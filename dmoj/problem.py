@@ -1,18 +1,226 @@
+import copy
+import logging
 import os
 import subprocess
+import threading
 import zipfile
+from collections import OrderedDict
 from functools import partial
 
 import yaml
 from yaml.parser import ParserError
 from yaml.scanner import ScannerError
 
-from dmoj import checkers
+from dmoj import checkers, sysinfo
 from dmoj.config import InvalidInitException, ConfigNode
 from dmoj.generator import GeneratorManager
-from dmoj.judgeenv import get_problem_root
+from dmoj.judgeenv import env, get_problem_root
 from dmoj.utils.module import load_module_from_file
 
+log = logging.getLogger('dmoj.problem')
+
+DEFAULT_TEST_DATA_CACHE_SIZE = 134217728  # 128mb
+
+
+def normalize_newlines(data):
+    # Normalize all newline formats (\r\n, \r, \n) to \n, otherwise we have problems with people creating
+    # data on Macs (\r newline) when judged programs assume \n
+    return data.replace('\r\n', '\r').replace('\r', '\n')
+
+
+def _has_dynamic_keys(doc):
+    if isinstance(doc, dict):
+        return any(isinstance(key, basestring) and key.endswith('+') or _has_dynamic_keys(value)
+                   for key, value in doc.iteritems())
+    if isinstance(doc, list):
+        return any(_has_dynamic_keys(value) for value in doc)
+    return False
+
+
+def _stat_key(path):
+    stat = os.stat(path)
+    return stat.st_mtime, stat.st_size
+
+
+class ProblemMetadata(object):
+    """
+    The parsed init.yml and opened archive of a problem, shared between every submission to it.
+    """
+
+    def __init__(self, root, init_stat):
+        self.root = root
+        self.init_stat = init_stat
+        self.archive = None
+        self.archive_stat = None
+
+        try:
+            with open(os.path.join(root, 'init.yml'), 'rb') as f:
+                self.doc = yaml.safe_load(f.read())
+            if not self.doc:
+                raise InvalidInitException('I find your lack of content disturbing.')
+        except (IOError, ParserError, ScannerError) as e:
+            raise InvalidInitException(str(e))
+
+        if not isinstance(self.doc, dict):
+            raise InvalidInitException('init.yml is not a mapping')
+
+        # Dynamic keys are replaced by their value on first access, so such configs can't be shared.
+        self.dynamic = _has_dynamic_keys(self.doc)
+
+        archive = self.config().archive
+        if archive:
+            archive_path = os.path.join(root, archive)
+            if not os.path.exists(archive_path):
+                raise InvalidInitException('archive file "%s" does not exist' % archive_path)
+            try:
+                self.archive_stat = _stat_key(archive_path)
+                # Opened by name, so every ZipFile.open() gets its own file object and concurrent reads are safe.
+                self.archive = zipfile.ZipFile(archive_path, 'r')
+            except zipfile.BadZipfile:
+                raise InvalidInitException('bad archive: "%s"' % archive_path)
+
+    def is_fresh(self):
+        try:
+            if _stat_key(os.path.join(self.root, 'init.yml')) != self.init_stat:
+                return False
+            return self.archive is None or _stat_key(self.archive.filename) == self.archive_stat
+        except OSError:
+            return False
+
+    def config(self):
+        return ConfigNode(copy.deepcopy(self.doc) if self.dynamic else self.doc, defaults={
+            'wall_time_factor': 3,
+            'output_prefix_length': 64,
+            'output_limit_length': 25165824,
+            'binary_data': False,
+            'short_circuit': True,
+        })
+
+
+class ProblemCache(object):
+    """
+    A bounded LRU cache of ProblemMetadata, keyed by problem root and validated against the init.yml and archive
+    modification times and sizes on every lookup.
+    """
+
+    def __init__(self, max_entries=None):
+        self._max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def max_entries(self):
+        if self._max_entries is not None:
+            return self._max_entries
+        return env.problem_cache_size if env.problem_cache_size is not None else 64
+
+    def get(self, problem_id):
+        root = get_problem_root(problem_id)
+        if root is None:
+            raise InvalidInitException('problem "%s" does not exist' % problem_id)
+        try:
+            init_stat = _stat_key(os.path.join(root, 'init.yml'))
+        except OSError as e:
+            raise InvalidInitException(str(e))
+
+        with self._lock:
+            metadata = self._entries.pop(root, None)
+            if metadata is not None and metadata.init_stat == init_stat and metadata.is_fresh():
+                self._entries[root] = metadata
+                return metadata
+
+        metadata = ProblemMetadata(root, init_stat)
+        max_entries = self.max_entries
+        if max_entries > 0:
+            with self._lock:
+                self._entries[root] = metadata
+                while len(self._entries) > max_entries:
+                    self._entries.popitem(last=False)
+        return metadata
+
+    def invalidate(self, path):
+        """
+        Drops the entries for every problem containing path, or contained in it.
+        """
+        path = os.path.abspath(path)
+        with self._lock:
+            for root in self._entries.keys():
+                root_path = os.path.abspath(root)
+                if path == root_path or path.startswith(root_path + os.sep) or root_path.startswith(path + os.sep):
+                    log.info('Invalidating cached problem: %s', root)
+                    del self._entries[root]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+problem_cache = ProblemCache()
+
+
+class TestDataCache(object):
+    """
+    A judge-wide LRU cache of test data, bounded by the total size of the data it holds.
+    """
+
+    def __init__(self, max_size=None):
+        self._max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def max_size(self):
+        if self._max_size is not None:
+            return self._max_size
+        return env.test_data_cache_size if env.test_data_cache_size is not None else DEFAULT_TEST_DATA_CACHE_SIZE
+
+    def get(self, key, load):
+        """
+        Returns the data cached under key, calling load() to produce it on a miss.
+        """
+        with self._lock:
+            data = self._entries.pop(key, None)
+            if data is not None:
+                self._entries[key] = data
+                self.hits += 1
+                return data
+            self.misses += 1
+
+        data = load()
+        max_size = self.max_size
+        if len(data) > max_size:
+            return data
+
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = data
+                self.size += len(data)
+            while self.size > max_size:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+                self.evictions += 1
+        return data
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'size': self.size}
+
+
+test_data_cache = TestDataCache()
+
+# Whether files, by identity, are unchanged by newline normalization.
+_plain_files = OrderedDict()
+_plain_files_lock = threading.Lock()
+sysinfo.report_callbacks.append(lambda: ('test-data-cache', test_data_cache.stats()))
+
 
 class Problem(object):
     def __init__(self, problem_id, time_limit, memory_limit, load_pretests_only=False):
@@ -29,21 +237,9 @@ class Problem(object):
         self._testcase_counter = 0
         self._batch_counter = 0
 
-        try:
-            doc = yaml.safe_load(self.problem_data['init.yml'])
-            if not doc:
-                raise InvalidInitException('I find your lack of content disturbing.')
-            self.config = ConfigNode(doc, defaults={
-                'wall_time_factor': 3,
-                'output_prefix_length': 64,
-                'output_limit_length': 25165824,
-                'binary_data': False,
-                'short_circuit': True,
-            })
-        except (IOError, ParserError, ScannerError) as e:
-            raise InvalidInitException(str(e))
-
-        self.problem_data.archive = self._resolve_archive_files()
+        metadata = problem_cache.get(problem_id)
+        self.config = metadata.config()
+        self.problem_data.archive = metadata.archive
 
         self.is_pretested = load_pretests_only and 'pretest_test_cases' in self.config
         self.cases = self._resolve_testcases(self.config['pretest_test_cases' if self.is_pretested else 'test_cases'])
@@ -54,18 +250,6 @@ class Problem(object):
         self._checkers[name] = checker = load_module_from_file(os.path.join(get_problem_root(self.id), name))
         return checker
 
-    def _resolve_archive_files(self):
-        if self.config.archive:
-            archive_path = os.path.join(get_problem_root(self.id), self.config.archive)
-            if not os.path.exists(archive_path):
-                raise InvalidInitException('archive file "%s" does not exist' % archive_path)
-            try:
-                archive = zipfile.ZipFile(archive_path, 'r')
-            except zipfile.BadZipfile:
-                raise InvalidInitException('bad archive: "%s"' % archive_path)
-            return archive
-        return None
-
     def _resolve_testcases(self, cfg, batch_no=0):
         cases = []
         for case_config in cfg:
@@ -93,9 +277,59 @@ class ProblemDataManager(dict):
                 return self.archive.open(zipinfo).read()
             raise KeyError('file "%s" could not be found' % key)
 
-    def __del__(self):
+    def _identity(self, key):
+        # Identifies the current version of a file, for keying the test data cache.
+        path = os.path.join(get_problem_root(self.problem_id), key)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            pass
+        else:
+            return path, stat.st_mtime, stat.st_size
         if self.archive:
-            self.archive.close()
+            try:
+                zipinfo = self.archive.getinfo(key)
+            except KeyError:
+                pass
+            else:
+                return self.archive.filename, key, zipinfo.date_time, zipinfo.CRC, zipinfo.file_size
+        raise KeyError('file "%s" could not be found' % key)
+
+    def file_path(self, key, normalize=True):
+        """
+        Returns the path of key on disk if reading it gives exactly what load() would, otherwise None.
+        """
+        path = os.path.join(get_problem_root(self.problem_id), key)
+        if key in self or not os.path.isfile(path):
+            return None
+        if not normalize:
+            return path
+
+        identity = self._identity(key)
+        with _plain_files_lock:
+            plain = _plain_files.pop(identity, None)
+        if plain is None:
+            plain = True
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1048576), ''):
+                    if '\r' in chunk:
+                        plain = False
+                        break
+        with _plain_files_lock:
+            _plain_files[identity] = plain
+            while len(_plain_files) > 4096:
+                _plain_files.popitem(last=False)
+        return path if plain else None
+
+    def load(self, key, normalize=True):
+        """
+        Returns the contents of key, with newlines normalized if requested, through the test data cache.
+        """
+        if key in self:
+            data = self[key]
+            return normalize_newlines(data) if normalize else data
+        return test_data_cache.get((self._identity(key), normalize),
+                                   lambda: normalize_newlines(self[key]) if normalize else self[key])
 
 
 class BatchedTestCase(object):
@@ -156,11 +390,21 @@ class TestCase(object):
         return filtered_data
 
     def _normalize(self, data):
-        # Normalize all newline formats (\r\n, \r, \n) to \n, otherwise we have problems with people creating
-        # data on Macs (\r newline) when judged programs assume \n
         if self.config.binary_data:
             return data
-        return data.replace('\r\n', '\r').replace('\r', '\n')
+        return normalize_newlines(data)
+
+    def input_file(self):
+        """
+        Returns the path of a file holding exactly the input data, if there is one, so that it can be given to the
+        process as stdin rather than written through a pipe.
+        """
+        if self.config.generator or not self.config['in'] or self.config.unbuffered:
+            return None
+        return self.problem.problem_data.file_path(self.config['in'], normalize=not self.config.binary_data)
+
+    def _load_data(self, key):
+        return self.problem.problem_data.load(key, normalize=not self.config.binary_data)
 
     def _run_generator(self, gen, args=None):
         flags = []
@@ -193,18 +437,18 @@ class TestCase(object):
             if self._generated[0]:
                 return self._generated[0]
         # in file is optional
-        return self._normalize(self.problem.problem_data[self.config['in']]) if self.config['in'] else ''
+        return self._load_data(self.config['in']) if self.config['in'] else ''
 
     def output_data(self):
         if self.config.out:
-            return self._normalize(self.problem.problem_data[self.config.out])
+            return self._load_data(self.config.out)
         gen = self.config.generator
         if gen:
             if self._generated is None:
                 self._run_generator(gen, args=self.config.generator_args)
             return self._generated[1]
 
-    def checker(self):
+    def _resolve_checker(self):
         try:
             name = self.config['checker'] or 'standard'
             if isinstance(name, ConfigNode):
@@ -223,9 +467,23 @@ class TestCase(object):
             raise InvalidInitException('error loading checker: ' + e.message)
         if not hasattr(checker, 'check') or not callable(checker.check):
             raise InvalidInitException('malformed checker: no check method found')
+        return checker, params
 
+    def checker(self):
+        checker, params = self._resolve_checker()
         return partial(checker.check, **params)
 
+    def stream_checker(self):
+        """
+        Returns the streaming variant of the checker, if the problem asks for output streaming and the checker has one.
+        """
+        if not self.config.stream_output:
+            return None
+        checker, params = self._resolve_checker()
+        if not callable(getattr(checker, 'check_stream', None)):
+            return None
+        return partial(checker.check_stream, **params)
+
     def free_data(self):
         self._generated = None
 
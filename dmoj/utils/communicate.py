@@ -3,7 +3,9 @@ import select
 import errno
 import threading
 
-_PIPE_BUF = getattr(select, 'PIPE_BUF', 512)
+# stdin is made non-blocking, so a write can be as large as we like, and the kernel tells us how much it took.
+_WRITE_CHUNK = 65536
+_READ_CHUNK = 65536
 
 
 class OutputLimitExceeded(Exception):
@@ -14,7 +16,7 @@ if os.name == 'nt':
     from dmoj.utils.winutils import get_handle_of_thread, SYNCHRONIZE, wait_for_multiple_objects
 
 
-    def _readerthread(fh, buffer, limit, ole):
+    def _readerthread(fh, buffer, limit, ole, callback=None):
         read = 0
         while True:
             buf = fh.read(65536)
@@ -24,10 +26,13 @@ if os.name == 'nt':
             if read > limit:
                 ole[0] = True
                 break
-            buffer.append(buf)
+            if callback is None:
+                buffer.append(buf)
+            elif not callback(buf):
+                break
 
 
-    def safe_communicate(proc, input, outlimit=None, errlimit=None):
+    def safe_communicate(proc, input, outlimit=None, errlimit=None, stdout_callback=None):
         if outlimit is None:
             outlimit = 10485760
         if errlimit is None:
@@ -42,7 +47,8 @@ if os.name == 'nt':
 
         if proc.stdout:
             stdout = []
-            stdout_thread = threading.Thread(target=_readerthread, args=(proc.stdout, stdout, outlimit, out_ole))
+            stdout_thread = threading.Thread(target=_readerthread,
+                                             args=(proc.stdout, stdout, outlimit, out_ole, stdout_callback))
             stdout_thread.daemon = True
             stdout_thread.start()
             handle = get_handle_of_thread(stdout_thread, SYNCHRONIZE)
@@ -91,7 +97,15 @@ if os.name == 'nt':
         proc.wait()
         return stdout, stderr
 else:
-    def safe_communicate(proc, input, outlimit=None, errlimit=None):
+    import fcntl
+
+    def safe_communicate(proc, input, outlimit=None, errlimit=None, stdout_callback=None):
+        """
+        Feeds input to proc and collects its output, until it exits.
+
+        If stdout_callback is given, stdout is passed to it as it is read instead of being collected, and is no longer
+        read once the callback returns False.
+        """
         if outlimit is None:
             outlimit = 10485760
         if errlimit is None:
@@ -123,8 +137,11 @@ else:
 
         if proc.stdin and input:
             register_and_append(proc.stdin, select.POLLOUT)
+            flags = fcntl.fcntl(proc.stdin.fileno(), fcntl.F_GETFL)
+            fcntl.fcntl(proc.stdin.fileno(), fcntl.F_SETFL, flags | os.O_NONBLOCK)
 
         select_POLLIN_POLLPRI = select.POLLIN | select.POLLPRI
+        stdout_fd = proc.stdout.fileno() if proc.stdout else None
         if proc.stdout:
             register_and_append(proc.stdout, select_POLLIN_POLLPRI)
             fd2output[proc.stdout.fileno()] = stdout = []
@@ -147,23 +164,28 @@ else:
 
             for fd, mode in ready:
                 if mode & select.POLLOUT:
-                    chunk = input[input_offset:input_offset + _PIPE_BUF]
+                    # buffer() avoids copying the chunk out of what might be a very large input.
+                    chunk = buffer(input, input_offset, _WRITE_CHUNK)
                     try:
                         input_offset += os.write(fd, chunk)
                     except OSError as e:
                         if e.errno == errno.EPIPE:
                             close_unregister_and_remove(fd)
-                        else:
+                        elif e.errno != errno.EAGAIN:
                             raise
                     else:
                         if input_offset >= len(input):
                             close_unregister_and_remove(fd)
                 elif mode & select_POLLIN_POLLPRI:
-                    data = os.read(fd, 4096)
+                    data = os.read(fd, _READ_CHUNK)
                     if not data:
                         close_unregister_and_remove(fd)
-                    fd2output[fd].append(data)
                     fd2length[fd] += len(data)
+                    if stdout_callback is not None and fd == stdout_fd:
+                        if data and not stdout_callback(data):
+                            close_unregister_and_remove(fd)
+                    else:
+                        fd2output[fd].append(data)
                     if fd2length[fd] > fd2limit[fd]:
                         if stdout is not None:
                             stdout = ''.join(stdout)
@@ -171,8 +193,7 @@ else:
                         if stderr is not None:
                             stderr = ''.join(stderr)
 
-                        raise OutputLimitExceeded(['stderr', 'stdout'][proc.stdout is not None and proc.stdout.fileno() == fd],
-                                                  stdout, stderr)
+                        raise OutputLimitExceeded(['stderr', 'stdout'][fd == stdout_fd], stdout, stderr)
                 else:
                     # Ignore hang up or errors.
                     close_unregister_and_remove(fd)
@@ -0,0 +1,70 @@
+package ca.dmoj.java;
+
+import java.io.*;
+import java.lang.reflect.InvocationTargetException;
+import java.lang.reflect.Method;
+import java.net.URL;
+import java.net.URLClassLoader;
+import java.util.Arrays;
+
+/**
+ * The main class of a JVM that is started before the judge knows what it is to run, so that the JVM, the submission
+ * agent and the security policy are all loaded ahead of time. It runs with the permissions granted to the agent's jar.
+ *
+ * Once ready, it writes a single NUL byte to stdout, then reads a line from stdin: NUL-separated fields of the file
+ * to read stdin from instead (or an empty field to keep reading the same stdin), the class path to load from, the
+ * main class, and its arguments. The main class is then loaded by a fresh class loader and run as if it were the
+ * JVM's own main class.
+ */
+public class WarmLauncher {
+    // Classes that nearly every submission uses, and that are not loaded by the JVM on its own. Scanner is left out
+    // as it may load BigInteger, which the agent reports as used by the submission if it's told to disallow it.
+    private static final String[] PRELOAD = {
+            "java.io.BufferedReader", "java.io.InputStreamReader", "java.io.PrintWriter", "java.io.StreamTokenizer",
+            "java.util.StringTokenizer", "java.util.ArrayList", "java.util.HashMap", "java.util.Arrays",
+    };
+
+    public static void main(String[] argv) throws Throwable {
+        for (String name : PRELOAD) {
+            try {
+                Class.forName(name);
+            } catch (ClassNotFoundException ignored) {
+            }
+        }
+
+        // Neither is buffered, so nothing past the command is taken from System.in.
+        FileInputStream in = new FileInputStream(FileDescriptor.in);
+        FileOutputStream out = new FileOutputStream(FileDescriptor.out);
+        out.write(0);
+
+        ByteArrayOutputStream line = new ByteArrayOutputStream();
+        int read;
+        while ((read = in.read()) != '\n') {
+            if (read < 0)
+                // The judge no longer needs us, and we have nothing to report to it.
+                Runtime.getRuntime().halt(0);
+            line.write(read);
+        }
+        String[] command = line.toString("UTF-8").split("\0", -1);
+
+        if (!command[0].isEmpty())
+            System.setIn(new BufferedInputStream(new FileInputStream(command[0])));
+
+        String[] classPath = command[1].isEmpty() ? new String[0] : command[1].split(File.pathSeparator);
+        URL[] urls = new URL[classPath.length];
+        for (int i = 0; i < classPath.length; ++i)
+            urls[i] = new File(classPath[i]).toURI().toURL();
+        ClassLoader loader = new URLClassLoader(urls, WarmLauncher.class.getClassLoader());
+        Thread.currentThread().setContextClassLoader(loader);
+
+        Method main = Class.forName(command[2], true, loader).getMethod("main", String[].class);
+        // The java launcher runs a public main even if its class isn't public.
+        main.setAccessible(true);
+        try {
+            main.invoke(null, (Object) Arrays.copyOfRange(command, 3, command.length));
+        } catch (InvocationTargetException e) {
+            // Let the agent see what the submission threw, rather than how we called it.
+            throw e.getCause();
+        }
+    }
+}
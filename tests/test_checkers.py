@@ -0,0 +1,109 @@
+"""
+Checks that every native checker agrees with the Python version it stands in for, on the inputs they are most likely
+to differ on: every kind of whitespace, empty and blank lines, nan and inf, and tokens that merely look numeric.
+"""
+
+import random
+import unittest
+
+from dmoj.checkers.benchmark import load_native_checker, load_python_checker
+
+try:
+    from dmoj.checkers import _checker
+except ImportError:
+    _checker = None
+
+WHITESPACE = [' ', '\t', '\v', '\f', '\r', '\n', '\r\n', '\n\n', ' \n ']
+TOKENS = ['1', '2', '12', '-1', '1.0', '1e0', '1e', '.5', '5.', '.', '+', '-0', 'nan', 'NaN', '-nan', 'inf', '-inf',
+          'Infinity', 'infinit', '0x10', '1_0', 'abc', 'ABC', 'a1']
+FLOATS = ['floats', 'floatsabs', 'floatsrel']
+
+
+def generate_output(rng):
+    output = ''.join(rng.choice(TOKENS) + rng.choice(WHITESPACE) for _ in xrange(rng.randint(0, 6)))
+    return output if rng.random() < 0.5 else output.rstrip()
+
+
+def mutate(rng, output):
+    """
+    Returns another output that is often, but not always, accepted against the given one.
+    """
+    choice = rng.randint(0, 4)
+    if choice == 0:
+        # The same tokens, with whitespace of every kind between them.
+        return ''.join(token + rng.choice(WHITESPACE) for token in output.split())
+    elif choice == 1:
+        # The same lines, in any order.
+        lines = output.split('\n')
+        rng.shuffle(lines)
+        return '\n'.join(lines)
+    elif choice == 2:
+        # The same tokens, in any order.
+        tokens = output.split()
+        rng.shuffle(tokens)
+        return ' '.join(tokens)
+    elif choice == 3:
+        # A single token replaced, or whitespace inserted, somewhere.
+        index = rng.randint(0, len(output))
+        return output[:index] + rng.choice(TOKENS + WHITESPACE) + output[index:]
+    return generate_output(rng)
+
+
+def generate_cases(seed=1, count=20000):
+    rng = random.Random(seed)
+    cases = [('', ''), ('', '\n'), ('\n\n', ''), ('1', '1\n\n'), ('1\n2', '1\r2'), ('1\n2', '1\n \n2'),
+             ('1 2', '1\n2'), ('2 1', '21'), ('21', '2 1'), ('nan', 'nan'), ('inf', 'inf'), ('-inf', 'inf'),
+             ('1e', '1e'), ('abc', 'ABC'), ('1\v2', '1 2'), ('1\f2', '1\n2')]
+    for _ in xrange(count):
+        judge = generate_output(rng)
+        cases.append((judge, mutate(rng, judge)))
+    return cases
+
+
+@unittest.skipIf(_checker is None, 'native checkers are not built')
+class NativeCheckerTest(unittest.TestCase):
+    cases = generate_cases()
+
+    def assert_agree(self, name, **kwargs):
+        native = load_native_checker(name)
+        python = load_python_checker(name)
+        for judge, process in self.cases:
+            self.assertEqual(native(process, judge, **kwargs), python(process, judge, **kwargs),
+                             '%s disagrees on judge %r, process %r' % (name, judge, process))
+
+    def test_standard(self):
+        self.assert_agree('standard')
+
+    def test_sorted(self):
+        self.assert_agree('sorted')
+
+    def test_unordered(self):
+        self.assert_agree('unordered')
+
+    def test_easy(self):
+        self.assert_agree('easy')
+
+    def test_floats(self):
+        for name in FLOATS:
+            for precision in (0, 3, 6):
+                self.assert_agree(name, precision=precision)
+
+    def test_floats_fallback(self):
+        # Returning None hands the case to the Python checker, which is only done when the native one can't decide,
+        # so an answer it does give must be the same.
+        for name in FLOATS:
+            native = getattr(_checker, name)
+            python = load_python_checker(name)
+            undecided = 0
+            for judge, process in self.cases:
+                result = native(judge, process, 1e-6)
+                if result is None:
+                    undecided += 1
+                else:
+                    self.assertEqual(result, python(process, judge, precision=6),
+                                     '%s disagrees on judge %r, process %r' % (name, judge, process))
+            self.assertLess(undecided, len(self.cases) // 10, '%s left too much to the Python checker' % name)
+
+
+if __name__ == '__main__':
+    unittest.main()